@@ -0,0 +1,57 @@
+from flask import Blueprint, jsonify, request
+from utils.ModelCache import ModelCache
+from utils.SliceCache import SliceCache
+import logging
+cache_bp = Blueprint("cache_bp", __name__)
+logger = logging.getLogger(__name__)
+
+
+@cache_bp.route("/list", methods=["GET"])
+def list_cache():
+    """
+    查看建模结果缓存的条目以及预处理切片缓存的大小。
+    """
+    try:
+        model_cache = ModelCache()
+        slice_cache = SliceCache()
+        slice_entries = slice_cache.entries()
+        return jsonify({
+            "status": "缓存信息已读取",
+            "models": model_cache.entries(),
+            "models_bytes": model_cache.size(),
+            "slices": len(slice_entries),
+            "slices_bytes": sum(size for _, size, _ in slice_entries),
+        })
+
+    except Exception as e:
+        logger.info(f"缓存信息读取失败: {e}")
+        return jsonify({"status": f"缓存信息读取失败: {e}"})
+
+
+@cache_bp.route("/clear", methods=["POST"])
+def clear_cache():
+    """
+    清空缓存。请求参数 kind 为 "models"、"slices" 或 "all"（默认）；
+    提供 fingerprint 时只删除对应的建模结果条目，fingerprint 必须是 40 位十六进制指纹，否则返回 400。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        logger.info(data)
+        kind = data.get("kind", "all")
+        if kind not in ("models", "slices", "all"):
+            raise ValueError(f"未知的缓存类型: {kind}")
+
+        if data.get("fingerprint"):
+            if not ModelCache.is_fingerprint(data["fingerprint"]):
+                logger.info(f"缓存清理失败: 无效的建模指纹 {data['fingerprint']!r}")
+                return jsonify({"status": "缓存清理失败: 无效的建模指纹"}), 400
+            removed = int(ModelCache().remove(data["fingerprint"]))
+            return jsonify({"status": "缓存已清理", "models": removed, "slices": 0})
+
+        removed_models = ModelCache().clear() if kind in ("models", "all") else 0
+        removed_slices = SliceCache().clear() if kind in ("slices", "all") else 0
+        return jsonify({"status": "缓存已清理", "models": removed_models, "slices": removed_slices})
+
+    except Exception as e:
+        logger.info(f"缓存清理失败: {e}")
+        return jsonify({"status": f"缓存清理失败: {e}"})
@@ -1,22 +1,57 @@
 from flask import Blueprint, jsonify, request
 from utils.Pipeline import Pipeline
+from utils.ModelCache import ModelCache
+from utils.SliceCache import SliceCache
 import logging
 creat_model_bp= Blueprint("creat_model_bp", __name__)
 logger = logging.getLogger(__name__)
 
 
+def create_pipeline(data, **kwargs):
+    """
+    根据前端提交的建模参数创建 Pipeline，其余参数（workers、progress 等）通过 kwargs 传入。
+    """
+    # 从前端获取图片文件夹路径
+    # 从已保存的标签体文件建模时不需要图片文件夹
+    folder_path = data.get("folder_path")
+    output_path = data["output_path"]
+    target = data["target"]
+    model_type = data["model_type"]
+    # 从标签体文件建模时层厚可以省略，默认使用文件中保存的层厚，见 Pipeline.load_volume
+    layer_thickness = int(data.get("layer_thickness", 1))
+    # 可选：模型文件格式和压缩方式，默认保存为旧版 .vtk 文件
+    kwargs.setdefault("file_format", data.get("file_format", "vtk"))
+    kwargs.setdefault("codec", data.get("codec", "zlib"))
+    # 可选：点云多分辨率金字塔的级数，0 表示不生成
+    kwargs.setdefault("lod_levels", int(data.get("lod_levels") or 0))
+    # 可选：点云加密模板（整数、三元组或偏移数组，见 PointCloudBuilder.make_stencil）和是否流式写入点云
+    kwargs.setdefault("stencil", data.get("stencil", 3))
+    kwargs.setdefault("stream", bool(data.get("stream", False)))
+    # 可选：使用预处理切片缓存和建模结果缓存（位于 config.CACHE_ROOT），默认不使用
+    if data.get("use_cache"):
+        kwargs.setdefault("cache_folder", SliceCache.DEFAULT_FOLDER)
+        kwargs.setdefault("model_cache_folder", ModelCache.DEFAULT_FOLDER)
+    # 可选：增量建模，只重新计算追加或修改过的切片
+    kwargs.setdefault("incremental", bool(data.get("incremental", False)))
+    # 可选：立方体模型贪心合并共面且同颜色的相邻面；开启减面时 Pipeline 会关闭贪心合并
+    kwargs.setdefault("greedy", bool(data.get("greedy", False)))
+    # 可选：立方体模型减面，三角形数上限和最大偏差
+    kwargs.setdefault("decimate", bool(data.get("decimate", False)))
+    kwargs.setdefault("decimate_target", int(data["decimate_target"]) if data.get("decimate_target") else None)
+    kwargs.setdefault("decimate_error", float(data["decimate_error"]) if data.get("decimate_error") is not None else 0.0)
+    return Pipeline(folder_path=folder_path, output_path=output_path, layer_thickness=layer_thickness, target=target,
+                    model_type=model_type, **kwargs)
+
+
 def get_request():
     logger.info(request.json)
-    # 从前端获取图片文件夹路径
-    folder_path = request.json["folder_path"]
-    output_path = request.json["output_path"]
-    target = request.json["target"]
-    model_type = request.json["model_type"]
-    layer_thickness = int(request.json["layer_thickness"])
-    pipline = Pipeline(folder_path=folder_path,output_path=output_path,layer_thickness=layer_thickness, target=target,model_type = model_type)
-    pipline.preprocess_images()
+    pipline = create_pipeline(request.json)
+    if request.json.get("volume_path"):
+        pipline.load_volume(request.json["volume_path"], request.json.get("layer_thickness"))
+    else:
+        pipline.preprocess_images()
 
-    return pipline,output_path
+    return pipline,pipline.output_path
 
 @creat_model_bp.route("/point_cloud", methods=["POST"])
 def point_cloud():
@@ -48,4 +83,15 @@ def cube():
         return jsonify({"status": f"立方体模型创建失败: {e}"})
 
 
+@creat_model_bp.route("/volume", methods=["POST"])
+def volume():
+    try:
+        pipline,output_path= get_request()
+
+        pipline.create_volume()
 
+        return jsonify({"status": "标签体已保存"})
+
+    except Exception as e:
+        logger.info(f"标签体保存失败: {e}")
+        return jsonify({"status": f"标签体保存失败: {e}"})
@@ -0,0 +1,200 @@
+import json
+import os
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from blueprints.creat_model_bp import create_pipeline
+from utils.EventBus import EventBus
+from utils.JobManager import Job, JobManager
+import logging
+job_bp = Blueprint("job_bp", __name__)
+logger = logging.getLogger(__name__)
+
+# 同时运行的建模任务数；每个任务预处理使用的进程数按 CPU 核心数平分，几个任务同时运行时也不会抢占过多资源
+job_manager = JobManager(max_workers=2, max_pending=8)
+
+
+def run_build(data, report):
+    """
+    在后台线程中运行一次完整的建模流程，返回生成的文件路径列表。
+    """
+    workers = max(1, (os.cpu_count() or 1) // job_manager.max_workers)
+    pipline = create_pipeline(data, workers=workers, progress=report)
+    if data.get("volume_path"):
+        pipline.load_volume(data["volume_path"], data.get("layer_thickness"))
+    else:
+        pipline.preprocess_images()
+
+    sections = int(data.get("sections") or 0)
+    if sections > 1:
+        file_paths = pipline.create_section(sections)
+    elif pipline.model_type == "point_cloud":
+        file_paths = pipline.create_point_cloud()
+    elif pipline.model_type == "cube":
+        file_paths = pipline.create_cube()
+    elif pipline.model_type == "volume":
+        file_paths = pipline.create_volume()
+    else:
+        raise ValueError(f"未知的模型类型: {pipline.model_type}")
+
+    if not file_paths:
+        raise RuntimeError("建模失败，详见日志")
+    return file_paths
+
+
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise LookupError(f"任务不存在: {job_id}")
+    return job
+
+
+@job_bp.route("/submit", methods=["POST"])
+def submit():
+    """
+    提交建模任务，立即返回任务编号。参数与 /creat/point_cloud、/creat/cube、/creat/volume 相同，
+    另外可以提供 sections（分段数量，大于 1 时分段建模）；提供 volume_path 时从已保存的标签体文件建模，不需要 folder_path，
+    layer_thickness 可以省略。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        logger.info(data)
+        for key in ("output_path", "target", "model_type"):
+            if key not in data:
+                raise ValueError(f"缺少参数: {key}")
+        if not data.get("folder_path") and not data.get("volume_path"):
+            raise ValueError("缺少参数: folder_path 或 volume_path")
+        # 从标签体文件建模时层厚默认使用文件中保存的值
+        if not data.get("volume_path") and "layer_thickness" not in data:
+            raise ValueError("缺少参数: layer_thickness")
+
+        job_id = job_manager.submit(data["model_type"], lambda report: run_build(data, report), params=data)
+        return jsonify({"status": "任务已提交", "job_id": job_id})
+
+    except Exception as e:
+        logger.info(f"任务提交失败: {e}")
+        return jsonify({"status": f"任务提交失败: {e}"})
+
+
+@job_bp.route("/list", methods=["GET"])
+def list_jobs():
+    """
+    查看全部任务的状态。
+    """
+    try:
+        return jsonify({"status": "任务列表已读取", "jobs": [job.to_dict() for job in job_manager.jobs()]})
+
+    except Exception as e:
+        logger.info(f"任务列表读取失败: {e}")
+        return jsonify({"status": f"任务列表读取失败: {e}"})
+
+
+@job_bp.route("/status/<job_id>", methods=["GET"])
+def status(job_id):
+    """
+    查看任务的完整状态。
+    """
+    try:
+        return jsonify({"status": "任务状态已读取", "job": get_job(job_id).to_dict()})
+
+    except Exception as e:
+        logger.info(f"任务状态读取失败: {e}")
+        return jsonify({"status": f"任务状态读取失败: {e}"})
+
+
+@job_bp.route("/progress/<job_id>", methods=["GET"])
+def progress(job_id):
+    """
+    查看任务的进度，供前端轮询。
+    """
+    try:
+        job = get_job(job_id)
+        return jsonify({"status": job.message, "state": job.state, "progress": job.progress})
+
+    except Exception as e:
+        logger.info(f"任务进度读取失败: {e}")
+        return jsonify({"status": f"任务进度读取失败: {e}"})
+
+
+@job_bp.route("/cancel/<job_id>", methods=["POST"])
+def cancel(job_id):
+    """
+    取消任务：排队中的任务立即取消，运行中的任务在当前步骤结束后停止。
+    """
+    try:
+        get_job(job_id)
+        if not job_manager.cancel(job_id):
+            return jsonify({"status": "任务已结束，无法取消"})
+        return jsonify({"status": "已请求取消任务"})
+
+    except Exception as e:
+        logger.info(f"任务取消失败: {e}")
+        return jsonify({"status": f"任务取消失败: {e}"})
+
+
+@job_bp.route("/result/<job_id>", methods=["GET"])
+def result(job_id):
+    """
+    读取已完成任务生成的文件路径。
+    """
+    try:
+        job = get_job(job_id)
+        if job.state != "succeeded":
+            return jsonify({"status": f"任务尚未完成: {job.message}", "state": job.state})
+        return jsonify({"status": "任务已完成", "state": job.state, "file_paths": job.result})
+
+    except Exception as e:
+        logger.info(f"任务结果读取失败: {e}")
+        return jsonify({"status": f"任务结果读取失败: {e}"})
+
+
+@job_bp.route("/events", methods=["GET"])
+def events():
+    """
+    长轮询读取任务事件：返回游标 since 之后的新事件，没有新事件时最多等待 timeout 秒（默认 25 秒）。
+    提供 job_id 时只返回该任务的事件。前端把返回的 cursor 作为下一次请求的 since。
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        timeout = min(float(request.args.get("timeout", 25)), 60.0)
+        job_id = request.args.get("job_id") or None
+        new_events, cursor, dropped = EventBus.shared().poll(since, job_id, timeout)
+        return jsonify({"status": "事件已读取", "events": new_events, "cursor": cursor, "dropped": dropped})
+
+    except Exception as e:
+        logger.info(f"事件读取失败: {e}")
+        return jsonify({"status": f"事件读取失败: {e}"})
+
+
+@job_bp.route("/stream", methods=["GET"])
+def stream():
+    """
+    以 Server-Sent Events 推送任务事件，每个事件的 id 为其序号，断线重连时浏览器通过 Last-Event-ID 继续读取。
+    提供 job_id 时只推送该任务的事件，任务结束后关闭连接。
+    """
+    job_id = request.args.get("job_id") or None
+    since = int(request.headers.get("Last-Event-ID") or request.args.get("since", 0))
+
+    def finished(event):
+        return event["type"] == "job" and event["state"] in Job.FINISHED_STATES
+
+    def generate():
+        # 先推送任务的当前状态，连接建立前任务已经结束时直接关闭
+        if job_id is not None:
+            job = job_manager.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'status': f'任务不存在: {job_id}'}, ensure_ascii=False)}\n\n"
+                return
+            if job.done and since == 0:
+                yield f"data: {json.dumps(dict(type='job', **job.to_dict()), ensure_ascii=False)}\n\n"
+                return
+
+        for new_events, _ in EventBus.shared().listen(since, job_id, until=finished if job_id else None):
+            if not new_events:
+                yield ": heartbeat\n\n"
+            for event in new_events:
+                yield f"id: {event['seq']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from utils.FileManager import FileManager
 from utils.PyvistaShow import PyvistaShow
+from utils.VolumeStatistics import VolumeStatistics
 import logging
 show_model_bp= Blueprint("show_model_bp", __name__)
 logger = logging.getLogger(__name__)
@@ -18,15 +19,29 @@ def show_point_cloud():
             show.show_point_cloud(file_path)
         elif model_type=="cube":
             show.show_mesh_vtk(file_path)
-        return jsonify({"status": "模型已显示"})
+        elif model_type=="volume":
+            show.show_volume(file_path)
+        return jsonify({"status": "模型已显示", "timings": show.timings})
 
     except Exception as e:
         logger.info(f"模型显示失败: {e}")
         return jsonify({"status": f"模型显示失败: {e}"})
 
 
+@show_model_bp.route("/stats", methods=["POST"])
+def show_stats():
+    """
+    读取模型旁边保存的体积统计结果（各颜色体积、每层及每个深度的比例、累积入渗分布），不需要重新建模。
+    请求中未提供 file_path 时弹出文件选择框。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        logger.info(data)
+        file_path = data.get("file_path") or FileManager.get_file_path()
 
+        stats = VolumeStatistics.load_json(file_path)
+        return jsonify({"status": "统计结果已读取", "stats": stats})
 
-
-
-
+    except Exception as e:
+        logger.info(f"统计结果读取失败: {e}")
+        return jsonify({"status": f"统计结果读取失败: {e}"})
@@ -1,17 +1,21 @@
 import webview
 import threading
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 
 from blueprints.creat_model_bp import creat_model_bp
 from blueprints.file_bp import file_bp
 from blueprints.top_bp import top_bp, window
 from blueprints.show_model_bp import show_model_bp
+from blueprints.cache_bp import cache_bp
+from blueprints.job_bp import job_bp
 
 from utils import config
+from utils.RingBufferHandler import RingBufferHandler
 
 from logging import Filter
 import logging
+import multiprocessing
 import os
 
 
@@ -20,17 +24,24 @@ log_dir = "backend_log"
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
-# 清空日志文件内容
+# 清空日志文件内容（进程池的子进程在 Windows 上会重新导入本模块，此时不能清空）
 log_path = "./backend_log/app.log"
-if os.path.exists(log_path):
+if os.path.exists(log_path) and multiprocessing.parent_process() is None:
     with open(log_path, 'w', encoding='utf-8') as f:
         f.truncate()  # 清空文件内容
 
 # 自定义日志过滤器
 class APILogFilter(Filter):
+    # 前端轮询的接口，访问日志没有意义
+    POLLING_PATHS = ("/get_logs", "/job/events", "/job/progress/")
+
     def filter(self, record):
-        # 屏蔽对 /get_logs 的访问日志记录
-        return "/get_logs" not in record.getMessage()
+        # 屏蔽对轮询接口的访问日志记录
+        message = record.getMessage()
+        return not any(path in message for path in self.POLLING_PATHS)
+
+# 最近的日志同时保存在内存中，/get_logs 直接从这里增量读取，不再读取整个日志文件
+log_buffer = RingBufferHandler(capacity=5000)
 
 # 配置日志
 logging.basicConfig(
@@ -38,7 +49,8 @@ logging.basicConfig(
     format="[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s",
     handlers=[
         logging.FileHandler(log_path, encoding="utf-8"),  # 将日志输出到文件，设置编码为 utf-8
-        logging.StreamHandler()  # 同时输出到控制台
+        logging.StreamHandler(),  # 同时输出到控制台
+        log_buffer,
     ]
 )
 
@@ -56,13 +68,30 @@ app.register_blueprint(creat_model_bp, url_prefix="/creat")
 app.register_blueprint(file_bp, url_prefix="/file")
 app.register_blueprint(top_bp, url_prefix="/top")
 app.register_blueprint(show_model_bp, url_prefix="/show")
+app.register_blueprint(cache_bp, url_prefix="/cache")
+app.register_blueprint(job_bp, url_prefix="/job")
 
 
 @app.route('/get_logs', methods=['GET'])
 def get_logs():
-    with open('./backend_log/app.log', 'r', encoding='utf-8') as f:
-        logs = f.readlines()
-    return jsonify(logs)
+    """
+    读取最近的日志。
+
+    不带参数时返回最近日志行的列表（与旧接口一致）；提供 since（上次返回的 cursor）或 level（最低级别，如 "WARNING"）时，
+    只返回游标之后的新日志：{"logs", "cursor", "dropped", "session"}，dropped 为来不及读取而被覆盖的条数，
+    session 变化说明后端已重启，应从 since=0 重新读取。
+    """
+    if "since" not in request.args and "level" not in request.args:
+        logs, _, _ = log_buffer.lines()
+        return jsonify([f"{line}\n" for line in logs])
+
+    try:
+        logs, cursor, dropped = log_buffer.lines(
+            int(request.args.get("since", 0)), request.args.get("level"), request.args.get("limit", type=int)
+        )
+        return jsonify({"logs": logs, "cursor": cursor, "dropped": dropped, "session": log_buffer.session})
+    except Exception as e:
+        return jsonify({"status": f"日志读取失败: {e}"})
 
 def run_flask():
     """ 运行 Flask API 服务器 """
@@ -71,6 +100,8 @@ def run_flask():
 
 
 if __name__ == "__main__":
+    # 打包后的程序在 Windows 上启动预处理进程池时需要
+    multiprocessing.freeze_support()
     try:
         # 创建并启动 Flask 线程
         flask_thread = threading.Thread(target=run_flask, daemon=True)
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+import pyvista as pv
+
+from utils.ImageProcessor import ImageProcessor
+from utils.Pipeline import Pipeline
+
+# 调色板颜色（RGB），与 Palette.DEFAULT_COLORS 一致
+COLORS = np.array([[0x9C, 0xFF, 0x9B], [0x0F, 0xFD, 0xFE], [0x0B, 0x00, 0xFB], [0xFF, 0xFF, 0xFF]], dtype=np.uint8)
+
+
+def write_slice(path, seed, shape=(24, 20)):
+    rng = np.random.default_rng(seed)
+    image = COLORS[rng.integers(0, len(COLORS), shape)]
+    cv2.imwrite(path, image[:, :, ::-1])
+
+
+def build(folder, output_path, model_type, incremental):
+    pipeline = Pipeline(folder, output_path, layer_thickness=2, target="#0FFDFE", model_type=model_type,
+                        workers=1, incremental=incremental, file_format="xml")
+    pipeline.preprocess_images()
+    if model_type == "point_cloud":
+        return pipeline.create_point_cloud()[0]
+    return pipeline.create_cube()[0]
+
+
+def assert_same_model(path, expected_path):
+    model, expected = pv.read(path), pv.read(expected_path)
+    assert model.n_points == expected.n_points
+    assert model.n_cells == expected.n_cells
+    np.testing.assert_array_equal(model.points, expected.points)
+    for name in expected.point_data.keys():
+        np.testing.assert_array_equal(model.point_data[name], expected.point_data[name])
+    if isinstance(expected, pv.UnstructuredGrid):
+        np.testing.assert_array_equal(model.cell_connectivity, expected.cell_connectivity)
+
+
+@pytest.mark.parametrize("model_type", ["point_cloud", "cube"])
+def test_incremental_build_matches_full_rebuild(tmp_path, monkeypatch, model_type):
+    folder = str(tmp_path / "slices")
+    os.makedirs(folder)
+    for k in range(6):
+        write_slice(os.path.join(folder, f"{k:03d}.png"), seed=k)
+    incremental_path = str(tmp_path / "incremental" / "model.vtk")
+    os.makedirs(os.path.dirname(incremental_path))
+    build(folder, incremental_path, model_type, incremental=True)
+
+    # 追加两张切片并重新拍摄其中一张
+    for k in (6, 7):
+        write_slice(os.path.join(folder, f"{k:03d}.png"), seed=k)
+    write_slice(os.path.join(folder, "002.png"), seed=100)
+
+    clustered = []
+    preprocess_slice = ImageProcessor.preprocess_slice
+
+    def counting_preprocess_slice(image_path, *args):
+        clustered.append(os.path.basename(image_path))
+        return preprocess_slice(image_path, *args)
+
+    monkeypatch.setattr(ImageProcessor, "preprocess_slice", staticmethod(counting_preprocess_slice))
+    model_path = build(folder, incremental_path, model_type, incremental=True)
+    # 未改变的切片不再重新聚类
+    assert sorted(clustered) == ["002.png", "006.png", "007.png"]
+
+    full_folder = str(tmp_path / "full")
+    shutil.copytree(folder, full_folder)
+    full_path = str(tmp_path / "full_model" / "model.vtk")
+    os.makedirs(os.path.dirname(full_path))
+    expected_path = build(full_folder, full_path, model_type, incremental=False)
+    assert_same_model(model_path, expected_path)
@@ -1,3 +1,4 @@
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -6,8 +7,19 @@ logger = logging.getLogger(__name__)
 class ColorAnalyzer:
     """
     颜色分析类，提供判断颜色特性的方法。
+
+    单个颜色的方法接收十六进制字符串；批量方法接收形状为 (..., 3) 的 RGB 数组（例如 (N, 3) 像素表或
+    (height, width, 3) 整张图片），返回与 rgb.shape[:-1] 形状相同的掩码或距离数组，全部用数组运算完成。
     """
 
+    # sRGB (D65) 线性分量到 XYZ 的转换矩阵，以及 D65 白点
+    _RGB_TO_XYZ = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ], dtype=np.float32)
+    _WHITE_D65 = np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+
     @staticmethod
     def hex_to_rgb(hex_color):
         """
@@ -62,3 +74,142 @@ class ColorAnalyzer:
         return abs(r1 - r2) <= tolerance and \
                abs(g1 - g2) <= tolerance and \
                abs(b1 - b2) <= tolerance
+
+    @staticmethod
+    def hex_to_rgb_array(hex_colors):
+        """
+        将一组十六进制颜色转换为 RGB 数组。
+
+        :param hex_colors: 十六进制颜色字符串列表，例如 ["#FFFFFF", "#0B00FB"]。
+        :type hex_colors: list[str]
+        :return: (K, 3) 的 uint8 RGB 数组。
+        :rtype: np.ndarray
+        :raises ValueError: 如果某个十六进制颜色格式无效。
+        """
+        return np.array([ColorAnalyzer.hex_to_rgb(c) for c in hex_colors], dtype=np.uint8).reshape(-1, 3)
+
+    @staticmethod
+    def _as_rgb(color):
+        """
+        将十六进制字符串或 RGB 序列统一转换为 int16 数组。
+        """
+        if isinstance(color, str):
+            color = ColorAnalyzer.hex_to_rgb(color)
+        rgb = np.asarray(color, dtype=np.int16)
+        if rgb.shape[-1] != 3:
+            raise ValueError(f"颜色数组最后一维必须是 RGB 三通道，实际形状为 {rgb.shape}")
+        return rgb
+
+    @staticmethod
+    def nearly_white_mask(rgb, threshold=200):
+        """
+        批量判断颜色是否接近白色，规则与 is_nearly_white 相同。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组。
+        :type rgb: np.ndarray
+        :param threshold: 白色判断阈值，RGB 值需要大于该阈值。
+        :type threshold: int
+        :return: 形状为 rgb.shape[:-1] 的布尔数组。
+        :rtype: np.ndarray
+        """
+        rgb = ColorAnalyzer._as_rgb(rgb)
+        return np.all(rgb > threshold, axis=-1)
+
+    @staticmethod
+    def in_range_mask(rgb, target_color, tolerance):
+        """
+        批量判断颜色是否在目标颜色的范围内，规则与 is_color_in_range 相同。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组。
+        :type rgb: np.ndarray
+        :param target_color: 目标颜色，十六进制字符串或 RGB 三元组。
+        :type target_color: str | Tuple[int, int, int]
+        :param tolerance: 允许的 RGB 偏差范围（0-255）。
+        :type tolerance: int
+        :return: 形状为 rgb.shape[:-1] 的布尔数组。
+        :rtype: np.ndarray
+        """
+        rgb = ColorAnalyzer._as_rgb(rgb)
+        target = ColorAnalyzer._as_rgb(target_color)
+        return np.all(np.abs(rgb - target) <= tolerance, axis=-1)
+
+    @staticmethod
+    def squared_distances(rgb, targets):
+        """
+        计算每个颜色到一组目标颜色的 RGB 欧氏距离的平方。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组。
+        :type rgb: np.ndarray
+        :param targets: (K, 3) 的目标 RGB 数组。
+        :type targets: np.ndarray
+        :return: 形状为 rgb.shape[:-1] + (K,) 的 int32 数组。
+        :rtype: np.ndarray
+        """
+        rgb = ColorAnalyzer._as_rgb(rgb).astype(np.int32)
+        targets = ColorAnalyzer._as_rgb(targets).astype(np.int32).reshape(-1, 3)
+        pixels = rgb.reshape(-1, 3)
+        distances = np.empty((len(pixels), len(targets)), dtype=np.int32)
+        for index, target in enumerate(targets):
+            diff = pixels - target
+            np.einsum("ij,ij->i", diff, diff, out=distances[:, index])
+        return distances.reshape(rgb.shape[:-1] + (len(targets),))
+
+    @staticmethod
+    def rgb_to_lab(rgb):
+        """
+        将 sRGB 颜色转换为 CIE Lab（D65 白点）。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组（0-255）。
+        :type rgb: np.ndarray
+        :return: 形状与 rgb 相同的 float32 Lab 数组。
+        :rtype: np.ndarray
+        """
+        rgb = ColorAnalyzer._as_rgb(rgb).astype(np.float32) / 255.0
+        linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+        xyz = (linear @ ColorAnalyzer._RGB_TO_XYZ.T) / ColorAnalyzer._WHITE_D65
+
+        epsilon, kappa = 216 / 24389, 24389 / 27
+        f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+        lab = np.empty_like(f, dtype=np.float32)
+        lab[..., 0] = 116 * f[..., 1] - 16
+        lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+        lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+        return lab
+
+    @staticmethod
+    def delta_e(rgb, targets):
+        """
+        计算每个颜色到一组目标颜色的感知色差 ΔE（CIE76，即 Lab 空间的欧氏距离）。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组。
+        :type rgb: np.ndarray
+        :param targets: (K, 3) 的目标 RGB 数组。
+        :type targets: np.ndarray
+        :return: 形状为 rgb.shape[:-1] + (K,) 的 float32 数组。
+        :rtype: np.ndarray
+        """
+        lab = ColorAnalyzer.rgb_to_lab(rgb)
+        target_lab = ColorAnalyzer.rgb_to_lab(np.asarray(targets).reshape(-1, 3))
+        return np.linalg.norm(lab[..., None, :] - target_lab, axis=-1)
+
+    @staticmethod
+    def nearest_palette_indices(rgb, targets, metric="rgb"):
+        """
+        批量找出每个颜色最接近的目标颜色下标，距离相同时取靠前的颜色。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组。
+        :type rgb: np.ndarray
+        :param targets: (K, 3) 的目标 RGB 数组，K 不超过 256。
+        :type targets: np.ndarray
+        :param metric: 距离度量，"rgb" 为 RGB 欧氏距离，"lab" 为感知色差 ΔE。
+        :type metric: str
+        :return: 形状为 rgb.shape[:-1] 的 uint8 下标数组。
+        :rtype: np.ndarray
+        """
+        if metric == "rgb":
+            distances = ColorAnalyzer.squared_distances(rgb, targets)
+        elif metric == "lab":
+            distances = ColorAnalyzer.delta_e(rgb, targets)
+        else:
+            raise ValueError(f"未知的距离度量: {metric}")
+        return np.argmin(distances, axis=-1).astype(np.uint8)
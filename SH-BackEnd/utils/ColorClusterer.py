@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from utils.ColorAnalyzer import ColorAnalyzer
+from utils.Palette import Palette
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ColorClusterer:
+    """
+    批量最近调色板颜色聚类引擎，一次性把整张图片或整组切片的像素归类到调色板颜色。
+
+    支持两种计算方式：
+    - "lut"：预先计算 256³ → 调色板类别的查找表（16 MB，按调色板缓存），之后每个像素只需一次查表；
+    - "broadcast"：直接用广播计算每个像素到各调色板颜色的距离。
+
+    两种方式都按 chunk_size 个像素分块处理，内存占用与图片大小无关。
+    距离默认为 RGB 欧氏距离，也可以选择 Lab 空间的感知色差 ΔE，距离相同时取调色板中靠前的颜色。
+    """
+
+    # 查找表缓存，键为 (调色板标识, 距离度量)，按最近使用顺序淘汰
+    _lut_cache = OrderedDict()
+    _lut_cache_size = 4
+    _lut_lock = threading.Lock()
+
+    def __init__(self, palette=None, method="lut", chunk_size=1 << 20, metric="rgb"):
+        """
+        :param palette: 目标调色板，默认为 Palette()。
+        :type palette: Palette
+        :param method: 计算方式，"lut" 或 "broadcast"。
+        :type method: str
+        :param chunk_size: 每块处理的像素数量。
+        :type chunk_size: int
+        :param metric: 距离度量，"rgb" 或 "lab"，见 ColorAnalyzer.nearest_palette_indices。
+        :type metric: str
+        """
+        if method not in ("lut", "broadcast"):
+            raise ValueError(f"未知的聚类方式: {method}")
+        if metric not in ("rgb", "lab"):
+            raise ValueError(f"未知的距离度量: {metric}")
+        if chunk_size <= 0:
+            raise ValueError(f"分块大小必须为正数: {chunk_size}")
+
+        self.palette = palette if palette is not None else Palette()
+        self.method = method
+        self.chunk_size = int(chunk_size)
+        self.metric = metric
+
+    @staticmethod
+    def nearest_labels(pixels, palette, metric="rgb"):
+        """
+        用广播计算一组像素最接近的调色板类别。
+
+        :param pixels: (N, 3) 的 RGB 数组。
+        :type pixels: np.ndarray
+        :param palette: 目标调色板。
+        :type palette: Palette
+        :param metric: 距离度量，"rgb" 或 "lab"。
+        :type metric: str
+        :return: (N,) 的 uint8 类别编号数组。
+        :rtype: np.ndarray
+        """
+        return ColorAnalyzer.nearest_palette_indices(pixels, palette.rgb, metric)
+
+    @classmethod
+    def lookup_table(cls, palette, chunk_size=1 << 20, metric="rgb"):
+        """
+        获取调色板对应的 256³ 查找表，不存在时计算并缓存。
+
+        :param palette: 目标调色板。
+        :type palette: Palette
+        :param chunk_size: 计算查找表时每块的颜色数量。
+        :type chunk_size: int
+        :param metric: 距离度量，"rgb" 或 "lab"。
+        :type metric: str
+        :return: 长度为 2^24 的 uint8 数组，下标为 0xRRGGBB 打包颜色。
+        :rtype: np.ndarray
+        """
+        key = (palette.key(), metric)
+        with cls._lut_lock:
+            lut = cls._lut_cache.get(key)
+            if lut is not None:
+                cls._lut_cache.move_to_end(key)
+                return lut
+
+            lut = np.empty(1 << 24, dtype=np.uint8)
+            for start in range(0, len(lut), chunk_size):
+                packed = np.arange(start, min(start + chunk_size, len(lut)), dtype=np.uint32)
+                colors = np.stack(((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF), axis=1)
+                lut[start:start + len(packed)] = cls.nearest_labels(colors, palette, metric)
+            lut.flags.writeable = False
+
+            cls._lut_cache[key] = lut
+            while len(cls._lut_cache) > cls._lut_cache_size:
+                cls._lut_cache.popitem(last=False)
+            logger.info(f"已生成调色板查找表: {palette}（{metric}）")
+            return lut
+
+    @classmethod
+    def preload_lookup_table(cls, palette, lut, metric="rgb"):
+        """
+        将已经计算好的查找表放入缓存，供进程池的子进程初始化时使用，避免每个进程重复计算。
+
+        :param palette: 查找表对应的调色板。
+        :type palette: Palette
+        :param lut: lookup_table 返回的查找表，为 None 时不做任何操作。
+        :type lut: np.ndarray
+        :param metric: 查找表使用的距离度量。
+        :type metric: str
+        """
+        if lut is None:
+            return
+        with cls._lut_lock:
+            cls._lut_cache[(palette.key(), metric)] = lut
+            while len(cls._lut_cache) > cls._lut_cache_size:
+                cls._lut_cache.popitem(last=False)
+
+    def assign(self, image):
+        """
+        将图片（或切片堆栈）中每个像素归类到最接近的调色板颜色。
+
+        :param image: 形状为 (..., 3) 的 uint8 RGB 数组，例如 (height, width, 3) 或 (n, height, width, 3)。
+        :type image: np.ndarray
+        :return: 形状为 image.shape[:-1] 的 uint8 类别编号数组。
+        :rtype: np.ndarray
+        """
+        image = np.asarray(image)
+        if image.shape[-1] != 3:
+            raise ValueError(f"图片最后一维必须是 RGB 三通道，实际形状为 {image.shape}")
+
+        pixels = image.reshape(-1, 3)
+        labels = np.empty(len(pixels), dtype=np.uint8)
+        lut = self.lookup_table(self.palette, metric=self.metric) if self.method == "lut" else None
+
+        for start in range(0, len(pixels), self.chunk_size):
+            chunk = pixels[start:start + self.chunk_size]
+            if lut is not None:
+                chunk = chunk.astype(np.uint32)
+                packed = (chunk[:, 0] << 16) | (chunk[:, 1] << 8) | chunk[:, 2]
+                labels[start:start + len(chunk)] = lut[packed]
+            else:
+                labels[start:start + len(chunk)] = self.nearest_labels(chunk, self.palette, self.metric)
+
+        return labels.reshape(image.shape[:-1])
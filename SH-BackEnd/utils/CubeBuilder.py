@@ -1,9 +1,16 @@
 import pyvista as pv
 from utils.ImageProcessor import ImageProcessor
-from utils.ColorAnalyzer import ColorAnalyzer
+from utils.TargetFilter import TargetFilter
+from utils.LabelVolume import LabelVolume
+from utils.VoxelSurface import VoxelSurface
+from utils.VolumeStatistics import VolumeStatistics
+from utils.ProgressTracker import ProgressTracker
+from utils.MeshDecimator import MeshDecimator
+from utils.JobManager import JobCancelled
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+import os
 import numpy as np
-from collections import defaultdict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,17 +21,68 @@ class CubeBuilder:
     建模类，用于根据图像生成三维模型，使用优化的体素网格合并。
     """
 
-    def __init__(self, side_length=1, layer_thickness=3,target=None):
+    def __init__(self, side_length=1, layer_thickness=3,target=None, surface_method="faces", progress=None,
+                 decimate=False, decimate_target=None, decimate_error=0.0, workers=1):
         """
         :param side_length: 每个立方体的边长，控制生成模型的分辨率和体素大小，默认为 1。
         :param layer_thickness: 每层的厚度，控制图像层的堆叠间隔，默认为 3。
+        :param surface_method: 标签体的表面生成方式："faces" 直接在标签数组上只生成暴露面，
+                               "grid" 构建体素网格后由 VTK 提取外表面。
+        :param progress: 进度回调，参数为当前阶段的 ProgressTracker，按 ProgressTracker 的发布间隔调用。
+        :param decimate: 是否在合并前按颜色区域减面（仅标签体输入，不与贪心合并同时使用），见 decimate_color_cubes。
+        :param decimate_target: 减面后整个模型的三角形数上限，为 None 时尽量减少。
+        :param decimate_error: 减面允许的最大偏差（与模型坐标同单位），0 表示只删除共面的顶点、形状不变，None 表示不限制。
+        :param workers: 减面使用的进程数，每个颜色区域一个任务；None 表示使用全部 CPU 核心，1 表示串行处理。
         """
+        if surface_method not in ("faces", "grid"):
+            raise ValueError(f"未知的表面生成方式: {surface_method}")
         self.side_length = side_length
         self.layer_thickness = layer_thickness
-        self.plotter = pv.Plotter()
+        self.surface_method = surface_method
+        self._plotter = None  # 可视化窗口，首次使用时才创建
+        self.model = None
         self.target=target
+        self.target_filter = TargetFilter(target)  # 编译后的目标流过滤规则，两种建模类共用
         self.color_cubes = {}
         self.volume_data = {}
+        self.mesh_stats = {}  # 面数、三角形数统计
+        self.progress = progress
+        self.decimate = decimate
+        self.decimate_target = decimate_target
+        self.decimate_error = decimate_error
+        self.workers = workers
+
+    @property
+    def plotter(self):
+        """
+        可视化使用的 pv.Plotter，首次访问时才创建，建模和保存过程不需要。
+        """
+        if self._plotter is None:
+            self._plotter = pv.Plotter()
+        return self._plotter
+
+    def track(self, tracker, done=None, items=0):
+        """
+        更新阶段进度，到了发布时间且设置了 progress 回调时报告。
+
+        :param tracker: 当前阶段的进度跟踪器。
+        :type tracker: ProgressTracker
+        :param done: 已完成的数量，为 None 时加 1。
+        :param items: 本次新处理的元素数量。
+        """
+        if tracker.update(done, items) and self.progress is not None:
+            self.progress(tracker)
+
+    def tracked_chunks(self, n_slices, chunk_layers=32, stage="生成表面"):
+        """
+        依次产出各块的第一层编号，每块处理完（取下一块时）报告一次进度，作为 VoxelSurface 的 chunk_starts 使用。
+
+        :rtype: Iterator[int]
+        """
+        tracker = ProgressTracker(stage, n_slices, "层")
+        for k0 in range(0, n_slices, chunk_layers):
+            yield k0
+            self.track(tracker, min(k0 + chunk_layers, n_slices))
 
     def optimize_mesh(self, mesh):
         """
@@ -41,6 +99,60 @@ class CubeBuilder:
 
         return cleaned
 
+    def create_cubes(self, coords, current_z):
+        """
+        一次性为一组像素生成立方体网格（六面体单元），替代逐个创建 pv.Cube。
+
+        :param coords: (N, 2) 的像素坐标，作为立方体中心的 x、y。
+        :type coords: np.ndarray
+        :param current_z: 当前层的高度，作为立方体中心的 z。
+        :return: 包含 N 个六面体单元的非结构网格。
+        :rtype: pv.UnstructuredGrid
+        """
+        half = np.array([self.side_length, self.side_length, self.layer_thickness], dtype=np.float64) / 2
+        # VTK 六面体的角点顺序：先底面逆时针四点，再顶面四点
+        corners = np.array([
+            [-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+            [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1],
+        ], dtype=np.float64) * half
+
+        centers = np.empty((len(coords), 3), dtype=np.float64)
+        centers[:, :2] = coords
+        centers[:, 2] = current_z
+        points = (centers[:, None, :] + corners[None, :, :]).reshape(-1, 3)
+
+        n_cells = len(coords)
+        cells = np.empty((n_cells, 9), dtype=np.int64)
+        cells[:, 0] = 8
+        cells[:, 1:] = np.arange(n_cells * 8, dtype=np.int64).reshape(n_cells, 8)
+        cell_types = np.full(n_cells, pv.CellType.HEXAHEDRON, dtype=np.uint8)
+
+        return pv.UnstructuredGrid(cells.ravel(), cell_types, points)
+
+    def add_color_cubes(self, current_z, color, coords):
+        """
+        为同一颜色的一组像素生成立方体，优化后合并到该颜色的网格中，并累计体积。
+
+        :param current_z: 当前层的高度。
+        :param color: 十六进制颜色字符串。
+        :type color: str
+        :param coords: (N, 2) 的像素坐标。
+        :type coords: np.ndarray
+        """
+        if len(coords) == 0:
+            return
+
+        self.volume_data[color] = self.volume_data.get(color, 0) + len(coords) * self.layer_thickness
+
+        # 批量生成立方体并优化
+        optimized_mesh = self.optimize_mesh(self.create_cubes(coords, current_z))
+
+        # 直接更新颜色字典（更简洁）
+        self.color_cubes[color] = (
+            optimized_mesh if color not in self.color_cubes
+            else self.color_cubes[color].merge(optimized_mesh)
+        )
+
     def generate_surface(self, current_z, image_path):
         """
         根据单张图片生成三维表面，包含优化处理。
@@ -49,100 +161,283 @@ class CubeBuilder:
         """
 
         try:
-            pixels = ImageProcessor.extract_pixel_colors(image_path)
-
-            color_mesh_list = defaultdict(list)
-
-            # 遍历像素并生成立方体
-            for x, y, r, g, b, color in pixels:
-                if ColorAnalyzer.is_nearly_white(color):
-                    continue  # 跳过接近白色的像素
-                if self.target is not None:
-                    if self.target == "matrix_flow":
-                        if ColorAnalyzer.is_color_in_range(color, "#0B00FB", 50):
-                            continue
-                    if self.target == "preferential_flow":
-                        if ColorAnalyzer.is_color_in_range(color, "#9CFF9B", 50):
-                            continue
-                        elif ColorAnalyzer.is_color_in_range(color, "#0FFDFE", 50):
-                            continue
-
-                # 直接将立方体存入字典
-                color_mesh_list[color].append(
-                    pv.Cube(
-                        center=(x, y, current_z),
-                        x_length=self.side_length,
-                        y_length=self.side_length,
-                        z_length=self.layer_thickness
-                    )
-                )
-                self.volume_data[color] = self.volume_data.get(color, 0) + self.layer_thickness
-            # 批量合并并优化
-            for color, cubes in color_mesh_list.items():
-                # 合并立方体并优化
-                combined_mesh = pv.MultiBlock(cubes).combine()
-                optimized_mesh = self.optimize_mesh(combined_mesh)
-
-                # 直接更新颜色字典（更简洁）
-                self.color_cubes[color] = (
-                    optimized_mesh if color not in self.color_cubes
-                    else self.color_cubes[color].merge(optimized_mesh)
-                )
+            coords, colors = ImageProcessor.extract_pixel_arrays(image_path)
+
+            # 先用目标流过滤的保留表剔除像素，再按颜色分组
+            mask = self.target_filter.rgb_mask(colors)
+            coords, colors = coords[mask], colors[mask]
+            unique_colors, inverse = np.unique(ImageProcessor.pack_rgb(colors), return_inverse=True)
+            inverse = inverse.ravel()
+
+            for color_index, packed_color in enumerate(unique_colors):
+                self.add_color_cubes(current_z, f"#{int(packed_color):06x}", coords[inverse == color_index])
         except Exception as e:
             logger.error(f"逐层建模时出现异常: {e}")
 
+    def build_voxel_grid(self, volume):
+        """
+        将整个标签体直接构建为体素网格（pv.ImageData），每个单元即一个立方体，类别编号保存在单元数据 "label" 中。
+
+        单元 (i, j, k) 对应第 k 层切片中坐标为 (x=i, y=j) 的像素，立方体中心与逐层建模时一致：
+        (x * side_length, y * side_length, k * layer_thickness)。
 
-    def build_model(self, image_paths):
+        :param volume: 聚类得到的标签体。
+        :type volume: LabelVolume
+        :rtype: pv.ImageData
         """
-        根据多张图片生成三维模型，使用分层构建方式，并保留颜色信息。
-        :param image_paths: 图像路径列表。
-        :return: 合并后的完整 PolyData 网格（保留颜色）
+        n_slices, height, width = volume.shape
+        grid = pv.ImageData(
+            dimensions=(height + 1, width + 1, n_slices + 1),
+            spacing=(self.side_length, self.side_length, self.layer_thickness),
+            origin=(-self.side_length / 2, -self.side_length / 2, -self.layer_thickness / 2),
+        )
+        # VTK 单元编号以 x 变化最快，对应标签数组的 (slice, y, x) 顺序
+        grid.cell_data["label"] = volume.labels.transpose(0, 2, 1).ravel()
+        return grid
+
+    def generate_surface_from_volume(self, volume, greedy=False):
         """
+        根据整个标签体一次性生成每种颜色的三维表面，不再为每层、每个像素单独构建立方体。
 
-        try:
-            for index, image_path in tqdm(
-                    enumerate(image_paths), desc="分层建模中", unit="层", total=len(image_paths)
-            ):
-                logger.info(f"分层建模中,正在处理第 {index + 1}/{len(image_paths)} 层...")
-                current_z = index * self.layer_thickness
-                self.generate_surface(current_z=current_z, image_path=image_path)
+        :param volume: 聚类得到的标签体。
+        :type volume: LabelVolume
+        :param greedy: 是否贪心合并共面且同颜色的相邻面，仅在 surface_method 为 "faces" 时有效。
+        :type greedy: bool
+        """
+        statistics = VolumeStatistics(volume, self.layer_thickness, self.side_length, self.target)
+        counts = statistics.class_counts
+        keep = self.target_filter.palette_mask(volume.palette)
+        self.volume_data.update(statistics.class_volumes(key="hex"))
 
-            # 合并所有颜色立方体并保留颜色
-            all_meshes = []
-            all_colors = []
+        if greedy and self.decimate:
+            # 贪心合并的矩形可能跨越多个邻居，无法按交界面分块减面
+            logger.warning("减面需要逐个体素的暴露面，已忽略贪心合并。")
+            greedy = False
 
-            for color, mesh in self.color_cubes.items():
-                # 将颜色转换为 RGB 数组并归一化
-                rgba_color = np.array([int(color[i:i + 2], 16) for i in (1, 3, 5)] + [255]) / 255.0
+        if self.surface_method == "faces":
+            # 只生成颜色边界和外边界上的面，内部面在进入 VTK 之前就被剔除
+            surfaces = VoxelSurface.exposed_surfaces(
+                volume.labels, keep, side_length=self.side_length, layer_thickness=self.layer_thickness,
+                greedy=greedy, chunk_starts=self.tracked_chunks(len(volume))
+            )
+            self.set_surfaces(surfaces, volume.palette)
+            if greedy:
+                self.mesh_stats["faces_before"] = VoxelSurface.count_exposed_faces(volume.labels, keep)
+            return
 
-                # 直接截取小数点后四位（不四舍五入）
-                rgba_color = np.floor(rgba_color * 10000) / 10000
+        if greedy:
+            logger.warning("贪心合并仅支持 faces 表面生成方式，已忽略。")
 
-                # 生成与顶点数量匹配的 RGBA 数组
-                rgba_array = np.tile(rgba_color, (mesh.n_points, 1))
+        grid = self.build_voxel_grid(volume)
+        labels = grid.cell_data["label"]
+        for label, color in enumerate(volume.palette.hex_colors):
+            if not keep[label] or counts[label] == 0:
+                continue
+            logger.info(f"正在生成颜色 {color} 的表面，共 {counts[label]} 个体素...")
 
-                # 将颜色数据附加到 mesh 的 point_data
-                mesh.point_data['RGB'] = rgba_array
-                mesh.point_data.active_scalars_name = 'RGB'
+            # 提取该颜色的全部体素并取外表面
+            region = grid.extract_cells(np.flatnonzero(labels == label))
+            self.color_cubes[color] = self.optimize_mesh(region)
 
-                # 将处理好的网格和颜色保存
-                all_meshes.append(mesh)
-                all_colors.append(rgba_color)
+    def set_surfaces(self, surfaces, palette):
+        """
+        将 VoxelSurface 生成的各类别表面设置为对应颜色的网格。
 
-            combined_mesh = pv.MultiBlock(all_meshes).combine()
+        :param surfaces: 类别编号 -> (points, faces)，见 VoxelSurface.exposed_surfaces。
+        :type surfaces: Dict[int, Tuple[np.ndarray, np.ndarray]]
+        :param palette: 类别编号对应的调色板。
+        :type palette: Palette
+        """
+        for label, (points, faces) in sorted(surfaces.items()):
+            self.color_cubes[palette.hex_color(label)] = pv.PolyData(points, faces)
 
-            self.plotter.add_mesh(combined_mesh, scalars="RGB", rgb=True)
+    def build_model(self, image_paths, greedy=False):
+        """
+        根据多张图片生成三维模型并保留颜色信息；图片路径逐层构建，标签体整体构建体素网格。
+        :param image_paths: 图像路径列表，或聚类得到的标签体。
+        :param greedy: 是否贪心合并共面且同颜色的相邻面（仅标签体输入），合并前后的面数和三角形数记录在 mesh_stats 中。
+        :return: 合并后的完整 PolyData 网格（保留颜色）
+        """
+
+        try:
+            self.mesh_stats = {}
+            if isinstance(image_paths, LabelVolume):
+                # 标签体直接整体构建体素网格
+                self.generate_surface_from_volume(image_paths, greedy=greedy)
+            else:
+                if greedy:
+                    logger.warning("贪心合并仅支持标签体输入，已忽略。")
+                tracker = ProgressTracker("分层建模", len(image_paths), "层")
+                for index, image_path in tqdm(
+                        enumerate(image_paths), desc="分层建模中", unit="层", total=len(image_paths)
+                ):
+                    logger.info(f"分层建模中,正在处理第 {index + 1}/{len(image_paths)} 层...")
+                    current_z = index * self.layer_thickness
+                    self.generate_surface(current_z=current_z, image_path=image_path)
+                    self.track(tracker)
 
-            logger.info(f"立方体体积数据(颜色:体积){self.volume_data}")
-            return combined_mesh
+            return self.combine_color_cubes(image_paths if isinstance(image_paths, LabelVolume) else None)
 
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"创建立方体时出现异常: {e}")
 
+    def decimate_color_cubes(self, volume):
+        """
+        按颜色区域并行减面，减面前后的三角形数（整体和每种颜色）记录在 mesh_stats["decimation"] 中。
+
+        每种颜色的表面按面另一侧的类别分块，每个颜色区域负责它与标签体外以及与编号更大的颜色之间的交界面，
+        一个区域是一个任务；块边界上的顶点不动，交界面两侧共用同一块减面结果，见 MeshDecimator。
+        三角形数上限按比例分配到每一块，只删除共面顶点就能达到时不改变形状。
+
+        :param volume: 生成表面所用的标签体。
+        :type volume: LabelVolume
+        """
+        keep = self.target_filter.palette_mask(volume.palette)
+        color_meshes = {volume.palette.index_of(color): mesh for color, mesh in self.color_cubes.items()}
+        triangles_before = {label: MeshDecimator.triangle_count(mesh) for label, mesh in color_meshes.items()}
+        total_before = sum(triangles_before.values())
+        if total_before == 0:
+            return
+        target_reduction = 1.0
+        if self.decimate_target is not None:
+            target_reduction = min(max(1 - self.decimate_target / total_before, 0.0), 1.0)
+            if target_reduction == 0:
+                logger.info(f"三角形数 {total_before} 未超过上限 {self.decimate_target}，不需要减面")
+                return
+
+        patches = MeshDecimator.split_patches(
+            color_meshes, volume.labels, keep, self.side_length, self.layer_thickness
+        )
+        tracker = ProgressTracker("减面", len(patches), "个颜色区域")
+        workers = max(1, min(self.workers or os.cpu_count() or 1, len(patches)))
+        decimated = {}
+        if workers <= 1:
+            for label, region in patches.items():
+                decimated[label] = MeshDecimator.decimate_patches(region, target_reduction, self.decimate_error)
+                self.track(tracker)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(MeshDecimator.decimate_patches, region, target_reduction, self.decimate_error): label
+                    for label, region in patches.items()
+                }
+                try:
+                    for finished, future in enumerate(as_completed(futures), start=1):
+                        decimated[futures[future]] = future.result()
+                        self.track(tracker, finished)
+                except BaseException:
+                    # 任务被取消（进度回调抛出 JobCancelled）时不再等待排队中的颜色区域
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        regions = {}
+        for label in color_meshes:
+            color = volume.palette.hex_color(label)
+            self.color_cubes[color] = MeshDecimator.assemble(label, decimated)
+            regions[color] = {
+                "triangles_before": triangles_before[label],
+                "triangles_after": MeshDecimator.triangle_count(self.color_cubes[color]),
+            }
+        total_after = sum(region["triangles_after"] for region in regions.values())
+        max_deviation = max((deviation for region in decimated.values() for *_, deviation in region), default=0.0)
+
+        self.mesh_stats["faces_before"] = self.mesh_stats.get("faces_before", sum(
+            mesh.n_cells for mesh in color_meshes.values()
+        ))
+        self.mesh_stats["decimation"] = {
+            "triangles_before": total_before,
+            "triangles_after": total_after,
+            "max_deviation": round(max_deviation, 4),
+            "regions": regions,
+        }
+        logger.info(
+            f"减面: 三角形数 {total_before} -> {total_after}（减少 {100 * (1 - total_after / total_before):.1f}%），"
+            f"最大偏差 {max_deviation:.3f}，{workers} 个进程"
+        )
+        if self.decimate_target is not None and total_after > self.decimate_target:
+            logger.info(f"减面未达到三角形数上限 {self.decimate_target}：颜色交界线上的顶点不能删除，或继续删除会超过最大偏差")
+
+    def combine_color_cubes(self, volume=None):
+        """
+        为每种颜色的网格附加颜色数据，并合并为一个完整的网格；设置了 decimate 时先按颜色区域减面。
+
+        :param volume: 生成表面所用的标签体，减面时用来区分交界面；为 None 时不减面。
+        :type volume: LabelVolume
+        :return: 合并后的完整网格（保留颜色）
+        """
+        if self.decimate:
+            if volume is None:
+                logger.warning("减面仅支持标签体输入，已忽略。")
+            else:
+                self.decimate_color_cubes(volume)
+
+        # 合并所有颜色立方体并保留颜色
+        all_meshes = []
+        all_colors = []
+
+        for color, mesh in self.color_cubes.items():
+            # 将颜色转换为 RGB 数组并归一化
+            rgba_color = np.array([int(color[i:i + 2], 16) for i in (1, 3, 5)] + [255]) / 255.0
+
+            # 直接截取小数点后四位（不四舍五入）
+            rgba_color = np.floor(rgba_color * 10000) / 10000
+
+            # 生成与顶点数量匹配的 RGBA 数组
+            rgba_array = np.tile(rgba_color, (mesh.n_points, 1))
+
+            # 将颜色数据附加到 mesh 的 point_data
+            mesh.point_data['RGB'] = rgba_array
+            mesh.point_data.active_scalars_name = 'RGB'
+
+            # 将处理好的网格和颜色保存
+            all_meshes.append(mesh)
+            all_colors.append(rgba_color)
+
+        combined_mesh = pv.MultiBlock(all_meshes).combine()
+
+        self.model = combined_mesh
+
+        self.record_mesh_stats(combined_mesh)
+        logger.info(f"立方体体积数据(颜色:体积){self.volume_data}")
+        return combined_mesh
+
+    def record_mesh_stats(self, mesh):
+        """
+        统计最终网格的面数和三角形数（n 边形按 n-2 个三角形计），与合并前的面数一起记录到 mesh_stats。
+
+        :param mesh: 最终生成的网格。
+        """
+        faces_after = mesh.n_cells
+        triangles_after = MeshDecimator.triangle_count(mesh)
+        faces_before = self.mesh_stats.get("faces_before", faces_after)
+        # 合并前每个面都是单个体素面（四边形）
+        triangles_before = faces_before * 2 if "faces_before" in self.mesh_stats else triangles_after
+        decimation = self.mesh_stats.get("decimation")
+
+        self.mesh_stats = {
+            "faces_before": faces_before,
+            "faces_after": faces_after,
+            "triangles_before": triangles_before,
+            "triangles_after": triangles_after,
+        }
+        if decimation is not None:
+            self.mesh_stats["decimation"] = decimation
+        if faces_before != faces_after:
+            logger.info(
+                f"{'减面' if decimation is not None else '贪心合并'}: 面数 {faces_before} -> {faces_after}，三角形数 {triangles_before} -> {triangles_after}"
+                f"（减少 {100 * (1 - faces_after / max(faces_before, 1)):.1f}%）"
+            )
+        else:
+            logger.info(f"网格面数 {faces_after}，三角形数 {triangles_after}")
+        return self.mesh_stats
 
     def show_model(self):
         """
         显示生成的三维模型。
         """
+        if self.model is not None:
+            self.plotter.add_mesh(self.model, scalars="RGB", rgb=True)
         self.plotter.show()
 
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from utils.RingBuffer import RingBuffer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """
+    结构化事件通道：后台任务把状态变化和进度（阶段、完成数量、吞吐量、剩余时间）作为事件写入内存中的环形缓冲区，
+    前端通过 Server-Sent Events 或长轮询按游标读取新事件，不再轮询和解析日志文件。
+
+    每个事件是可以直接序列化为 JSON 的字典，包含 seq（序号，即游标）、time、type 以及事件自身的字段；
+    缓冲区只保留最近 capacity 个事件，读取开销与累计事件数无关。
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, capacity=2000):
+        """
+        :param capacity: 保留的事件数量。
+        :type capacity: int
+        """
+        self.buffer = RingBuffer(capacity)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        进程内共享的事件通道，任务管理和事件接口默认都使用它。
+
+        :rtype: EventBus
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def cursor(self):
+        """
+        最新事件的序号。
+
+        :rtype: int
+        """
+        return self.buffer.cursor
+
+    def publish(self, event_type, **fields):
+        """
+        发布事件。
+
+        :param event_type: 事件类型，例如 "job"（任务状态变化）、"progress"（进度）。
+        :type event_type: str
+        :param fields: 事件字段，值必须可以序列化为 JSON。
+        :return: 发布的事件。
+        :rtype: dict
+        """
+        # 加锁保证序号与写入顺序一致
+        with self._lock:
+            event = {"seq": self.buffer.cursor + 1, "time": time.time(), "type": event_type}
+            event.update(fields)
+            self.buffer.append(event)
+        return event
+
+    def since(self, cursor=0, job_id=None, limit=None):
+        """
+        读取序号大于 cursor 的事件。
+
+        :param cursor: 上次读到的序号，0 表示从缓冲区中最旧的事件开始。
+        :type cursor: int
+        :param job_id: 只返回该任务的事件，为 None 时返回全部事件。
+        :type job_id: str
+        :param limit: 最多读取的事件数量（过滤之前）。
+        :type limit: int
+        :return: (事件列表, 新游标, 被覆盖而跳过的事件数量)。
+        :rtype: Tuple[List[dict], int, int]
+        """
+        events, cursor, dropped = self.buffer.since(cursor, limit)
+        if job_id is not None:
+            events = [event for event in events if event.get("job_id") == job_id]
+        return events, cursor, dropped
+
+    def poll(self, cursor=0, job_id=None, timeout=25.0, limit=None):
+        """
+        长轮询：没有新事件时最多等待 timeout 秒，有新事件立即返回。
+
+        :return: 同 since；超时时事件列表为空，游标可能前进（跳过了其他任务的事件）。
+        :rtype: Tuple[List[dict], int, int]
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            events, cursor, dropped = self.since(cursor, job_id, limit)
+            remaining = deadline - time.monotonic()
+            if events or dropped or remaining <= 0:
+                return events, cursor, dropped
+            self.buffer.wait(cursor, remaining)
+
+    def listen(self, cursor=0, job_id=None, heartbeat=15.0, until=None):
+        """
+        持续产出新事件，用于 Server-Sent Events。
+
+        :param cursor: 起始游标。
+        :param job_id: 只产出该任务的事件。
+        :param heartbeat: 没有事件时每隔 heartbeat 秒产出一次空列表，调用方据此发送心跳，及时发现断开的连接。
+        :type heartbeat: float
+        :param until: 结束条件，参数为刚产出的事件，返回 True 时停止，例如任务结束。
+        :type until: Callable[[dict], bool]
+        :return: 依次产出 (事件列表, 新游标)。
+        :rtype: Iterator[Tuple[List[dict], int]]
+        """
+        while True:
+            events, cursor, _ = self.poll(cursor, job_id, heartbeat)
+            yield events, cursor
+            if until is not None and any(until(event) for event in events):
+                return
@@ -1,9 +1,11 @@
 import os
+import re
 import shutil
 from pathlib import Path
 import logging
 
 from utils import config
+from utils.VtkStorage import VtkStorage
 import webview
 
 logger = logging.getLogger(__name__)
@@ -12,10 +14,23 @@ class FileManager:
     文件操作类，用于处理文件的加载和保存。
     """
 
+    @staticmethod
+    def natural_sort_key(filename):
+        """
+        文件名的自然排序键：数字部分按数值比较，其余部分不区分大小写，例如 "2.png" 排在 "10.png" 之前。
+
+        :param filename: 文件名。
+        :type filename: str
+        :return: (按数字切分的各部分, 文件名)；数值相同的文件名（如 "1.png" 和 "01.png"）再按文件名排序，顺序仍然确定。
+        :rtype: Tuple[List[Union[str, int]], str]
+        """
+        # 按数字切分后字符串和数字交替出现，两个键同一位置上的类型总是相同
+        return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", filename)], filename
+
     @staticmethod
     def load_image_paths_from_folder(folder_path):
         """
-        从文件夹中加载所有图片路径。
+        从文件夹中加载所有图片路径，按文件名自然排序（"2.png" 在 "10.png" 之前），保证切片按层号顺序堆叠。
 
         :param folder_path: 文件夹路径。
         :type folder_path: str
@@ -23,55 +38,73 @@ class FileManager:
         :rtype: List[str]
         """
         image_paths = []
-        for filename in os.listdir(folder_path):
+        for filename in sorted(os.listdir(folder_path), key=FileManager.natural_sort_key):
             if filename.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
                 img_path = os.path.join(folder_path, filename)
                 image_paths.append(img_path)
         return image_paths
 
     @staticmethod
-    def save_point_cloud_vtp(point_cloud, output_path):
+    def save_point_cloud_vtp(point_cloud, output_path, codec="zlib"):
         """
-        保存点云为 XML 格式的 VTP 文件。
+        保存点云为二进制 XML 格式的 VTP 文件。
 
         :param point_cloud: PyVista 的点云数据对象。
         :type point_cloud: pv.PolyData
-        :param file_name: 保存的文件名 (.vtp)
-        :type file_name: str
+        :param output_path: 保存的文件名 (.vtp)
+        :type output_path: str
+        :param codec: 压缩方式，见 VtkStorage.CODECS。
+        :type codec: str
+        :return: 实际保存的文件路径，保存失败时为 None。
+        :rtype: str
         """
         try:
-            output_path=FileManager.change_file_extension(output_path, "vtp")
-            point_cloud.save(output_path, binary=False)  # binary=False 表示保存为 XML 格式
+            output_path = VtkStorage.save(point_cloud, output_path, codec=codec)
             logger.info(f"点云已保存为 VTP 格式: {output_path}")
+            return output_path
         except Exception as e:
             logger.info(f"保存 VTP 文件时出错: {e}")
 
     @staticmethod
-    def save_point_cloud_vtk(point_cloud, output_path):
+    def save_point_cloud_vtk(point_cloud, output_path, file_format="vtk", codec="zlib"):
         """
-        保存点云为 XML 格式的 VTP 文件。
+        保存点云为 VTK 文件。
 
         :param point_cloud: PyVista 的点云数据对象。
         :type point_cloud: pv.PolyData
         :param output_path: 保存的文件名 (.vtk)
         :type output_path: str
+        :param file_format: "vtk" 为旧版 .vtk 文件，"xml" 为二进制 XML 格式的 .vtp 文件（见 VtkStorage）。
+        :type file_format: str
+        :param codec: XML 格式的压缩方式，见 VtkStorage.CODECS。
+        :type codec: str
+        :return: 实际保存的文件路径，保存失败时为 None。
+        :rtype: str
         """
         try:
+            if file_format == "xml":
+                return FileManager.save_point_cloud_vtp(point_cloud, output_path, codec=codec)
+            if file_format != "vtk":
+                raise ValueError(f"未知的文件格式: {file_format}")
             output_path=FileManager.change_file_extension(output_path, "vtk")
             point_cloud.save(output_path)
             logger.info(f"点云已保存为 VTK 格式: {output_path}")
+            return output_path
         except Exception as e:
             logger.info(f"保存 VTK 文件时出错: {e}")
 
     @staticmethod
-    def save_as_vtk(mesh, output_path):
+    def save_as_vtk(mesh, output_path, file_format="vtk", codec="zlib"):
         """
         将 PyVista 网格保存为 VTK 文件。
         :param mesh: PyVista 网格对象，必须包含 'RGB' 数据
         :param output_path: 输出 VTK 文件的路径（应以 .vtk 结尾）
+        :param file_format: "vtk" 为旧版 .vtk 文件，"xml" 为二进制 XML 格式（立方体模型为 .vtu，见 VtkStorage）
+        :param codec: XML 格式的压缩方式，见 VtkStorage.CODECS
+        :return: 实际保存的文件路径
         """
-
-        output_path=FileManager.change_file_extension(output_path, "vtk")
+        if file_format not in ("vtk", "xml"):
+            raise ValueError(f"未知的文件格式: {file_format}")
 
         # 检查是否包含 RGB 数据
         if 'RGB' not in mesh.point_data:
@@ -80,9 +113,17 @@ class FileManager:
         # 设置 RGB 为活动标量，用于可视化时显示颜色
         mesh.point_data.active_scalars_name = 'RGB'
 
+        if file_format == "xml":
+            output_path = VtkStorage.save(mesh, output_path, codec=codec)
+            logger.info(f"网格已成功保存为 {output_path}")
+            return output_path
+
+        output_path=FileManager.change_file_extension(output_path, "vtk")
+
         # 保存为 VTK 文件
         mesh.save(output_path)
         logger.info(f"网格已成功保存为 {output_path}")
+        return output_path
 
     @staticmethod
     def save_colored_obj(mesh, output_path):
@@ -3,6 +3,11 @@ import numpy as np
 import cv2
 import os
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from utils.Palette import Palette
+from utils.LabelVolume import LabelVolume
+from utils.ColorClusterer import ColorClusterer
 
 logger = logging.getLogger(__name__)
 class ImageProcessor:
@@ -46,6 +51,80 @@ class ImageProcessor:
 
         return pixel_data
 
+    @staticmethod
+    def load_rgb_image(image_path):
+        """
+        使用 OpenCV 读取图片，并转换为 RGB 通道顺序的数组。
+
+        :param image_path: 图片的文件路径。
+        :type image_path: str
+        :return: 形状为 (height, width, 3) 的 uint8 数组。
+        :rtype: np.ndarray
+        :raises FileNotFoundError: 如果图片路径无效或图片无法加载。
+        :raises ValueError: 如果图片的通道数少于 3（非 BGR 格式）。
+        """
+        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+
+        if img is None:
+            raise FileNotFoundError(f"Image not found or cannot be read: {image_path}")
+
+        if img.ndim != 3 or img.shape[2] < 3:
+            raise ValueError(f"Image must have at least 3 channels (BGR): {image_path}")
+
+        return cv2.cvtColor(img[:, :, :3], cv2.COLOR_BGR2RGB)
+
+    @staticmethod
+    def extract_pixel_arrays(image_path):
+        """
+        以数组形式提取图片中每个像素的坐标和 RGB 颜色，不做逐像素的 Python 循环。
+
+        坐标约定与 extract_pixel_colors 一致：x 为行索引，y 为列索引，按行优先顺序排列。
+
+        :param image_path: 图片的文件路径，或已经读取好的 RGB 图像数组。
+        :type image_path: str | np.ndarray
+        :return: (coords, colors)，coords 为 (N, 2) 的 int32 坐标数组，colors 为 (N, 3) 的 uint8 RGB 数组。
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        if isinstance(image_path, np.ndarray):
+            img = image_path
+        else:
+            img = ImageProcessor.load_rgb_image(image_path)
+
+        height, width = img.shape[:2]
+
+        # 行优先展开的像素坐标 (x, y)
+        xs, ys = np.indices((height, width), dtype=np.int32)
+        coords = np.stack((xs.ravel(), ys.ravel()), axis=1)
+        colors = img.reshape(-1, 3)
+
+        return coords, colors
+
+    @staticmethod
+    def pack_rgb(colors):
+        """
+        将 (..., 3) 的 uint8 RGB 数组打包为 0xRRGGBB 形式的 uint32 数组。
+
+        :param colors: RGB 颜色数组。
+        :type colors: np.ndarray
+        :return: 打包后的 uint32 数组，形状为 colors.shape[:-1]。
+        :rtype: np.ndarray
+        """
+        colors = np.asarray(colors, dtype=np.uint32)
+        return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+    @staticmethod
+    def unpack_rgb(packed):
+        """
+        将 0xRRGGBB 形式的 uint32 数组还原为 (..., 3) 的 uint8 RGB 数组。
+
+        :param packed: 打包后的颜色数组。
+        :type packed: np.ndarray
+        :return: RGB 颜色数组。
+        :rtype: np.ndarray
+        """
+        packed = np.asarray(packed, dtype=np.uint32)
+        return np.stack(((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF), axis=-1).astype(np.uint8)
+
     @staticmethod
     def replace_top_two_rows(image_paths, hex_color='#0B00FB'):
         """
@@ -93,53 +172,204 @@ class ImageProcessor:
         :param hex_colors: 目标颜色的16进制列表。
         :type hex_colors: list[str]
         """
-        # 将16进制颜色转换为RGB
-        def hex_to_rgb(hex_color):
-            hex_color = hex_color.lstrip("#")
-            return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-
-        # 转换所有目标颜色为RGB
-        target_colors = {hex_color: hex_to_rgb(hex_color) for hex_color in hex_colors}
-
-        def closest_color(color, target_colors):
-            """
-            找到与给定颜色最接近的目标颜色。
-
-            :param color: 输入的 RGB 颜色 (r, g, b)。
-            :param target_colors: 目标颜色字典，键为颜色名，值为 RGB 值。
-            :return: 最接近的目标颜色名。
-            """
-            color = np.array(color)
-            distances = {key: np.linalg.norm(color - np.array(value)) for key, value in target_colors.items()}
-            return min(distances, key=distances.get)
+        clusterer = ColorClusterer(Palette(hex_colors))
 
-        def process_image(image_path, target_colors):
+        def process_image(image_path):
             """
             将图像中的像素聚类到指定的目标颜色，并替换原始图片。
 
             :param image_path: 输入图像路径。
-            :param target_colors: 目标颜色字典，键为颜色名，值为 RGB 值。
             """
             # 打开图像并转换为 RGB 模式
-            image = Image.open(image_path).convert("RGB")
-            pixels = np.array(image)
-            height, width, _ = pixels.shape
+            pixels = np.array(Image.open(image_path).convert("RGB"))
 
-            # 将每个像素点聚类到目标颜色
-            clustered_pixels = np.zeros_like(pixels)
-            for i in range(height):
-                for j in range(width):
-                    clustered_pixels[i, j] = target_colors[closest_color(pixels[i, j], target_colors)]
+            # 一次性将所有像素聚类到目标颜色
+            clustered_pixels = clusterer.palette.to_rgb(clusterer.assign(pixels))
 
             # 替换原图
-            clustered_image = Image.fromarray(np.uint8(clustered_pixels))
+            clustered_image = Image.fromarray(clustered_pixels)
             clustered_image.save(image_path)
 
         # 遍历文件夹中的所有图片
         for filename in os.listdir(input_folder):
             if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
                 image_path = os.path.join(input_folder, filename)
-                process_image(image_path, target_colors)
+                process_image(image_path)
+
+    @staticmethod
+    def cluster_image_to_labels(image, palette, clusterer=None):
+        """
+        将一张 RGB 图像的每个像素归类到调色板中最接近的颜色，返回类别编号图。
+
+        距离与 cluster_images_to_colors 相同（RGB 欧氏距离），距离相同时取调色板中靠前的颜色。
+
+        :param image: 形状为 (height, width, 3) 的 uint8 RGB 图像。
+        :type image: np.ndarray
+        :param palette: 目标调色板。
+        :type palette: Palette
+        :param clusterer: 使用的聚类引擎，默认为该调色板的查找表引擎。
+        :type clusterer: ColorClusterer
+        :return: 形状为 (height, width) 的 uint8 类别编号数组。
+        :rtype: np.ndarray
+        """
+        if clusterer is None:
+            clusterer = ColorClusterer(palette)
+        return clusterer.assign(image)
+
+    @staticmethod
+    def preprocess_slice(image_path, clusterer, top_label=None, top_rows=2):
+        """
+        单张切片的预处理：读取一次图片、聚类为类别编号，再替换最上面若干行。
+
+        作为进程池的任务函数使用，只返回类别编号数组，不写回磁盘。
+
+        :param image_path: 图片路径。
+        :type image_path: str
+        :param clusterer: 聚类引擎。
+        :type clusterer: ColorClusterer
+        :param top_label: 最上面若干行替换成的类别编号，为 None 时不替换。
+        :type top_label: int
+        :param top_rows: 替换的行数。
+        :type top_rows: int
+        :return: 形状为 (height, width) 的 uint8 类别编号数组。
+        :rtype: np.ndarray
+        """
+        labels = clusterer.assign(ImageProcessor.load_rgb_image(image_path))
+        if top_label is not None:
+            labels[:top_rows, :] = top_label
+        return labels
+
+    @staticmethod
+    def cluster_images_to_labels(image_paths, hex_colors=None, method="lut", chunk_size=1 << 20,
+                                 top_color=None, top_rows=2, workers=1, metric="rgb", cache=None, progress=None):
+        """
+        将一组图片聚类为调色板类别编号，直接返回内存中的标签体，不再覆盖原图片。
+
+        workers 大于 1 时使用进程池并行处理各层切片，结果按输入顺序写入标签体，与串行处理完全一致。
+        提供 cache 时，源图片内容和预处理参数都相同的切片直接从缓存读取，只有未命中的切片才会读取图片并聚类。
+
+        :param image_paths: 按层顺序排列的图片路径列表，所有图片尺寸必须一致。
+        :type image_paths: List[str]
+        :param hex_colors: 目标颜色的16进制列表，默认使用 Palette.DEFAULT_COLORS。
+        :type hex_colors: list[str]
+        :param method: 聚类计算方式，见 ColorClusterer。
+        :type method: str
+        :param chunk_size: 每块处理的像素数量，用于限制内存占用。
+        :type chunk_size: int
+        :param top_color: 最上面若干行替换成的 16 进制颜色（必须在调色板中），为 None 时不替换。
+        :type top_color: str
+        :param top_rows: 替换的行数。
+        :type top_rows: int
+        :param workers: 进程数，None 表示使用全部 CPU 核心，1 表示在当前进程中串行处理。
+        :type workers: int
+        :param metric: 颜色距离度量，"rgb" 或 "lab"，见 ColorAnalyzer.nearest_palette_indices。
+        :type metric: str
+        :param cache: 预处理切片的磁盘缓存，为 None 时不使用缓存。
+        :type cache: SliceCache
+        :param progress: 进度回调 progress(已完成的切片数, 切片总数)，每完成一张切片调用一次。
+        :type progress: Callable[[int, int], None]
+        :return: 聚类后的标签体。
+        :rtype: LabelVolume
+        :raises ValueError: 如果图片列表为空或图片尺寸不一致。
+        """
+        if not image_paths:
+            raise ValueError("图片列表为空，无法聚类。")
+
+        palette = Palette(hex_colors)
+        clusterer = ColorClusterer(palette, method=method, chunk_size=chunk_size, metric=metric)
+        top_label = palette.index_of(top_color) if top_color is not None else None
+
+        volume = None
+        done = 0
+
+        def collect(index, labels):
+            nonlocal volume, done
+            if volume is None:
+                volume = LabelVolume.empty(
+                    len(image_paths), *labels.shape, palette=palette,
+                    slice_names=[os.path.basename(path) for path in image_paths]
+                )
+            elif labels.shape != volume.shape[1:]:
+                raise ValueError(f"图片尺寸不一致: {image_paths[index]} 为 {labels.shape}，应为 {volume.shape[1:]}")
+            volume.labels[index] = labels
+            done += 1
+            if progress is not None:
+                progress(done, len(image_paths))
+
+        # 先读取缓存命中的切片，剩下的才需要聚类
+        pending = list(range(len(image_paths)))
+        keys = None
+        if cache is not None:
+            keys = [cache.key(path, palette, (metric, top_label, top_rows)) for path in image_paths]
+            pending = []
+            for index, key in enumerate(keys):
+                labels = cache.get(key)
+                if labels is None:
+                    pending.append(index)
+                else:
+                    collect(index, labels)
+            logger.info(f"切片缓存命中 {len(image_paths) - len(pending)}/{len(image_paths)} 张")
+
+        def collect_pending(index, labels):
+            collect(index, labels)
+            if keys is not None:
+                cache.put(keys[index], labels)
+
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        pending_paths = [image_paths[index] for index in pending]
+
+        if workers <= 1:
+            for index, image_path in zip(pending, pending_paths):
+                collect_pending(index, ImageProcessor.preprocess_slice(image_path, clusterer, top_label, top_rows))
+        else:
+            # 查找表只在主进程计算一次，随进程初始化分发给各个子进程
+            lut = ColorClusterer.lookup_table(palette, metric=metric) if method == "lut" else None
+            chunksize = max(1, len(pending_paths) // (workers * 4))
+            with ProcessPoolExecutor(
+                    max_workers=workers, initializer=ColorClusterer.preload_lookup_table, initargs=(palette, lut, metric)
+            ) as executor:
+                results = executor.map(
+                    ImageProcessor.preprocess_slice, pending_paths, repeat(clusterer), repeat(top_label),
+                    repeat(top_rows), chunksize=chunksize
+                )
+                try:
+                    for index, labels in zip(pending, results):
+                        collect_pending(index, labels)
+                except BaseException:
+                    # 任务被取消（进度回调抛出 JobCancelled）时不再等待排队中的切片
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        if cache is not None and pending:
+            cache.evict()
+
+        logger.info(
+            f"聚类完成（{workers} 个进程），标签体尺寸 {volume.shape}，占用内存 {volume.nbytes / 1024 ** 2:.1f} MB"
+        )
+        return volume
+
+    @staticmethod
+    def save_label_images(volume, output_folder):
+        """
+        将标签体的每一层还原为调色板颜色并保存为 PNG 图片，用于调试或断点保存。
+
+        :param volume: 标签体。
+        :type volume: LabelVolume
+        :param output_folder: 输出文件夹，不存在时自动创建。
+        :type output_folder: str
+        :return: 保存的图片路径列表。
+        :rtype: List[str]
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        saved_paths = []
+        for index in range(len(volume)):
+            name = volume.slice_names[index] if volume.slice_names else f"{index:04d}.png"
+            save_path = os.path.join(output_folder, f"{os.path.splitext(name)[0]}.png")
+            cv2.imwrite(save_path, cv2.cvtColor(volume.to_rgb(index), cv2.COLOR_RGB2BGR))
+            saved_paths.append(save_path)
+
+        logger.info(f"预处理结果已保存到: {output_folder}")
+        return saved_paths
 
     @staticmethod
     def divide_images_into_folders(input_folder, n):
@@ -0,0 +1,327 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pyvista as pv
+from utils.FileManager import FileManager
+from utils.PointCloudWriter import PointCloudWriter
+from utils.ProgressTracker import ProgressTracker
+from utils.VtkStorage import VtkStorage
+from utils.SliceCache import SliceCache
+from utils.VolumeStatistics import VolumeStatistics
+from utils.VoxelSurface import VoxelSurface
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalBuilder:
+    """
+    增量建模类：记录每层切片的指纹，输入文件夹中追加或重新拍摄了部分切片时，只重新计算受影响的层，
+    再拼接到已保存的模型中，结果与完整建模完全一致。
+
+    状态保存在模型旁边的 "<模型文件名>.incremental" 文件夹中：
+    - manifest.json：建模参数、每层切片的指纹以及模型文件的大小和修改时间，点云还记录每层点在文件中的起始位置；
+    - chunks/*.npz：立方体模型每块（chunk_layers 层）的暴露面，文件名由块内及上下相邻各一层的指纹决定，
+      因此某层改变时，只有包含该层或以其为邻居的块需要重新计算；
+    - slices/*.npy：每张切片聚类后的类别编号（见 SliceCache），未改变的切片不再重新聚类。
+    建模参数改变、模型文件被替换或状态缺失时，自动退化为完整建模。
+    """
+
+    # 状态格式的版本号，格式变化时递增，使旧状态全部失效
+    VERSION = 1
+
+    def __init__(self, output_path, params, chunk_layers=32, file_format="vtk", codec="zlib"):
+        """
+        :param output_path: 模型输出路径。
+        :type output_path: str
+        :param params: 影响建模结果的全部参数，值必须可以序列化为 JSON。
+        :type params: dict
+        :param chunk_layers: 立方体模型按块缓存暴露面时每块的层数。
+        :type chunk_layers: int
+        :param file_format: 模型文件格式，见 FileManager.save_as_vtk。
+        :type file_format: str
+        :param codec: XML 格式的压缩方式，见 VtkStorage.CODECS。
+        :type codec: str
+        """
+        self.output_base, _ = os.path.splitext(output_path)
+        self.state_folder = f"{self.output_base}.incremental"
+        self.chunk_folder = os.path.join(self.state_folder, "chunks")
+        self.manifest_path = os.path.join(self.state_folder, "manifest.json")
+        self.params = params
+        self.chunk_layers = chunk_layers
+        self.file_format = file_format
+        self.codec = codec
+
+    @staticmethod
+    def slice_cache(output_path):
+        """
+        :param output_path: 模型输出路径。
+        :type output_path: str
+        :return: 保存在增量状态文件夹中的预处理切片缓存。
+        :rtype: SliceCache
+        """
+        output_base, _ = os.path.splitext(output_path)
+        return SliceCache(os.path.join(f"{output_base}.incremental", "slices"))
+
+    @staticmethod
+    def slice_fingerprints(image_paths):
+        """
+        :param image_paths: 按层顺序排列的源图片路径列表。
+        :return: 每层切片的内容指纹。
+        :rtype: List[str]
+        """
+        return [SliceCache.file_hash(image_path) for image_path in image_paths]
+
+    @staticmethod
+    def _file_signature(file_path):
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def load_manifest(self, model_path=None):
+        """
+        读取上次建模的状态。
+
+        :param model_path: 需要校验的模型文件，为 None 时不校验。
+        :type model_path: str
+        :return: 状态字典；状态缺失、参数不同或模型文件已被替换时返回 None。
+        :rtype: dict
+        """
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取增量建模状态异常: {e}")
+            return None
+
+        if manifest.get("version") != self.VERSION or manifest.get("params") != self.params:
+            logger.info("建模参数已改变，进行完整建模")
+            return None
+        if model_path is not None and (
+                not os.path.exists(model_path) or manifest.get("model") != self._file_signature(model_path)
+        ):
+            logger.info("模型文件已被替换，进行完整建模")
+            return None
+        return manifest
+
+    def save_manifest(self, model_path, fingerprints, **extra):
+        """
+        保存本次建模的状态。
+
+        :param model_path: 本次保存的模型文件。
+        :type model_path: str
+        :param fingerprints: 每层切片的指纹。
+        :type fingerprints: List[str]
+        """
+        os.makedirs(self.state_folder, exist_ok=True)
+        manifest = {
+            "version": self.VERSION,
+            "params": self.params,
+            "model": self._file_signature(model_path),
+            "fingerprints": list(fingerprints),
+        }
+        manifest.update(extra)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    @staticmethod
+    def match_layers(old_fingerprints, fingerprints):
+        """
+        为每一层找出上次建模中内容相同的层：优先取同一位置，其次取尚未使用的任意位置（切片插入或删除后层号平移）。
+
+        :return: 每层对应的旧层编号，没有可复用的层时为 None。
+        :rtype: List[int]
+        """
+        available = {}
+        for j, fingerprint in enumerate(old_fingerprints):
+            available.setdefault(fingerprint, []).append(j)
+
+        plan = [None] * len(fingerprints)
+        used = set()
+        for k, fingerprint in enumerate(fingerprints):
+            if k < len(old_fingerprints) and old_fingerprints[k] == fingerprint:
+                plan[k] = k
+                used.add(k)
+        for k, fingerprint in enumerate(fingerprints):
+            if plan[k] is not None:
+                continue
+            candidates = [j for j in available.get(fingerprint, ()) if j not in used]
+            if candidates:
+                plan[k] = candidates[0]
+                used.add(candidates[0])
+        return plan
+
+    def build_point_cloud(self, builder, volume, fingerprints, stream=False):
+        """
+        增量生成点云：内容未变的层直接复制已保存模型中的点（层号改变时重新计算 z 坐标），其余层重新生成。
+
+        流式模式下，如果只是在末尾追加了切片，直接在已有 PLY 文件末尾追加新层的点。
+
+        :param builder: 点云生成器，参数必须与 params 一致。
+        :type builder: PointCloudBuilder
+        :param volume: 全部切片的标签体。
+        :type volume: LabelVolume
+        :param fingerprints: 每层切片的指纹。
+        :type fingerprints: List[str]
+        :param stream: 是否流式写入 PLY 文件，否则保存为 VTK 文件。
+        :type stream: bool
+        :return: 实际保存的模型文件路径。
+        :rtype: str
+        """
+        if stream:
+            model_path = f"{self.output_base}.ply"
+        else:
+            model_path = f"{self.output_base}.{'vtp' if self.file_format == 'xml' else 'vtk'}"
+        manifest = self.load_manifest(model_path)
+        old_fingerprints = manifest["fingerprints"] if manifest else []
+        old_offsets = manifest["point_offsets"] if manifest else [0]
+        plan = self.match_layers(old_fingerprints, fingerprints)
+
+        per_pixel = builder.layer_thickness * len(builder.stencil)
+        counts = [
+            old_offsets[j + 1] - old_offsets[j] if j is not None
+            else builder.count_label_pixels(volume[k], volume.palette) * per_pixel
+            for k, j in enumerate(plan)
+        ]
+        offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).tolist()
+        rebuilt = [k for k, j in enumerate(plan) if j is None]
+        logger.info(f"增量建模：共 {len(plan)} 层，复用 {len(plan) - len(rebuilt)} 层，重新生成 {len(rebuilt)} 层")
+
+        # 只在末尾追加了切片时，流式模式直接在已有文件末尾写入新层，不需要读取已有的点
+        appending = (
+            stream and manifest is not None and len(plan) >= len(old_fingerprints)
+            and all(plan[j] == j for j in range(len(old_fingerprints)))
+        )
+        if manifest is None or appending:
+            old_points = old_colors = None
+        elif stream:
+            records = PointCloudWriter.load(model_path)
+            old_points = np.column_stack((records["x"], records["y"], records["z"]))
+            old_colors = np.column_stack((records["red"], records["green"], records["blue"]))
+            del records
+        else:
+            old_model = pv.read(model_path)
+            old_points = np.asarray(old_model.points, dtype=np.float32)
+            old_colors = VtkStorage.colors_uint8(old_model)
+            del old_model
+
+        tracker = ProgressTracker("增量生成点云", len(plan), "层", item_unit="点")
+
+        def layer_segment(k):
+            j = plan[k]
+            if j is None:
+                points, colors = builder.generate_label_layer(volume, k)
+            else:
+                start, end = old_offsets[j], old_offsets[j + 1]
+                points, colors = old_points[start:end], old_colors[start:end]
+                if j != k:
+                    points = points.copy()
+                    points[:, 2] = builder.layer_z(k, (end - start) // per_pixel)
+            builder.track(tracker, k + 1, items=len(points))
+            return points, colors
+
+        if stream:
+            if appending:
+                with PointCloudWriter(model_path, append=True) as writer:
+                    for k in range(len(old_fingerprints), len(plan)):
+                        writer.write(*layer_segment(k))
+            else:
+                temp_path = os.path.join(self.state_folder, "rebuild.ply")
+                os.makedirs(self.state_folder, exist_ok=True)
+                with PointCloudWriter(temp_path) as writer:
+                    for k in range(len(plan)):
+                        writer.write(*layer_segment(k))
+                old_points = old_colors = None
+                os.replace(temp_path, model_path)
+        else:
+            points = np.empty((offsets[-1], 3), dtype=np.float32)
+            colors = np.empty((offsets[-1], 3), dtype=np.uint8)
+            for k in range(len(plan)):
+                points[offsets[k]:offsets[k + 1]], colors[offsets[k]:offsets[k + 1]] = layer_segment(k)
+            point_cloud = pv.PolyData(points)
+            point_cloud["RGB"] = colors.astype(np.float32) / 255.0
+            FileManager.save_point_cloud_vtk(point_cloud, model_path, self.file_format, self.codec)
+
+        builder.calculate_label_volume(volume)
+        self.save_manifest(model_path, fingerprints, point_offsets=offsets)
+        return model_path
+
+    def _chunk_key(self, fingerprints, k0):
+        """
+        块的缓存键：由建模参数以及块内和上下相邻各一层的指纹决定，与块所在的层号无关。
+        """
+        window = [
+            fingerprints[k] if 0 <= k < len(fingerprints) else None
+            for k in range(k0 - 1, k0 + self.chunk_layers + 1)
+        ]
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(json.dumps({"params": self.params, "chunk_layers": self.chunk_layers, "window": window},
+                                 sort_keys=True).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def build_cube(self, builder, volume, fingerprints, greedy=False):
+        """
+        增量生成立方体模型：按块缓存暴露面，只重新计算包含改变的层或以其为邻居的块，再拼接全部块生成网格。
+
+        :param builder: 立方体建模类，参数必须与 params 一致。
+        :type builder: CubeBuilder
+        :param volume: 全部切片的标签体。
+        :type volume: LabelVolume
+        :param fingerprints: 每层切片的指纹。
+        :type fingerprints: List[str]
+        :param greedy: 是否贪心合并共面且同颜色的相邻面。
+        :type greedy: bool
+        :return: 实际保存的模型文件路径。
+        :rtype: str
+        """
+        os.makedirs(self.chunk_folder, exist_ok=True)
+        keep = builder.target_filter.palette_mask(volume.palette)
+
+        chunks = []
+        keys = []
+        rebuilt = 0
+        tracker = ProgressTracker("增量生成表面", len(volume), "层")
+        for k0 in range(0, len(volume), self.chunk_layers):
+            key = self._chunk_key(fingerprints, k0)
+            chunk_path = os.path.join(self.chunk_folder, f"{key}.npz")
+            rects = None
+            if os.path.exists(chunk_path):
+                try:
+                    with np.load(chunk_path) as data:
+                        rects = {name: data[name] for name in data.files}
+                except Exception as e:
+                    logger.error(f"读取增量建模块异常: {e}")
+            if rects is None:
+                rects = VoxelSurface.chunk_rectangles(volume.labels, keep, k0, self.chunk_layers, greedy)
+                np.savez(chunk_path, **rects)
+                rebuilt += 1
+            chunks.append((k0, rects))
+            keys.append(key)
+            builder.track(tracker, min(k0 + self.chunk_layers, len(volume)))
+        logger.info(f"增量建模：共 {len(chunks)} 块，复用 {len(chunks) - rebuilt} 块，重新计算 {rebuilt} 块")
+
+        # 删除不再使用的块
+        for name in os.listdir(self.chunk_folder):
+            if name.endswith(".npz") and name[:-4] not in keys:
+                os.remove(os.path.join(self.chunk_folder, name))
+
+        builder.mesh_stats = {}
+        statistics = VolumeStatistics(volume, builder.layer_thickness, builder.side_length, builder.target)
+        builder.volume_data.update(statistics.class_volumes(key="hex"))
+        surfaces = VoxelSurface.assemble_surfaces(
+            VoxelSurface.iter_chunk_quads(chunks, volume.shape), volume.shape, builder.side_length,
+            builder.layer_thickness, "合并后的" if greedy else "暴露"
+        )
+        builder.set_surfaces(surfaces, volume.palette)
+        if greedy:
+            builder.mesh_stats["faces_before"] = int(sum(int(rects["n_faces"]) for _, rects in chunks))
+        cube_model = builder.combine_color_cubes(volume)
+
+        model_path = FileManager.save_as_vtk(cube_model, self.output_base, self.file_format, self.codec)
+        self.save_manifest(model_path, fingerprints, chunks=keys)
+        return model_path
@@ -0,0 +1,288 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.EventBus import EventBus
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """
+    任务被取消时由进度回调抛出，用于中断正在运行的任务。
+    """
+
+
+class JobQueueFull(Exception):
+    """
+    排队中的任务数量达到上限时，提交新任务抛出。
+    """
+
+
+class Job:
+    """
+    一个后台任务的状态记录。
+
+    state 为 "queued"、"running"、"succeeded"、"failed" 或 "cancelled"；
+    progress 为 0 ~ 1 的进度，message 为当前步骤的说明，details 为当前阶段的详细进度（见 ProgressTracker.snapshot），
+    result 为任务函数的返回值。设置了 bus 时，状态变化和进度更新都会作为事件发布。
+    """
+
+    FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+    def __init__(self, kind, params=None, bus=None):
+        """
+        :param kind: 任务类型，例如 "point_cloud"、"cube"。
+        :type kind: str
+        :param params: 任务参数，只用于查看，值必须可以序列化为 JSON。
+        :type params: dict
+        :param bus: 发布任务事件的事件通道，为 None 时不发布。
+        :type bus: EventBus
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.state = "queued"
+        self.progress = 0.0
+        self.message = "排队中"
+        self.details = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.bus = bus
+
+    @property
+    def done(self):
+        """
+        任务是否已经结束（成功、失败或取消）。
+
+        :rtype: bool
+        """
+        return self.state in self.FINISHED_STATES
+
+    @property
+    def eta(self):
+        """
+        按运行以来的平均速度估计的整个任务剩余时间（秒），无法估计时为 None。
+
+        :rtype: float
+        """
+        if self.started is None or self.done or self.progress <= 0:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed * (1 - self.progress) / self.progress, 1)
+
+    def report(self, fraction, message=None, details=None):
+        """
+        更新任务进度并发布进度事件，传给任务函数作为进度回调。任务已被请求取消时抛出 JobCancelled。
+
+        :param fraction: 0 ~ 1 的进度，小于当前进度时忽略（进度只增不减）。
+        :type fraction: float
+        :param message: 当前步骤的说明。
+        :type message: str
+        :param details: 当前阶段的详细进度，例如 ProgressTracker.snapshot() 的结果。
+        :type details: dict
+        :raises JobCancelled: 如果任务已被请求取消。
+        """
+        if self.cancel_event.is_set():
+            raise JobCancelled("任务已取消")
+        self.progress = max(self.progress, min(max(float(fraction), 0.0), 1.0))
+        if message is not None:
+            self.message = message
+        self.details = details or {}
+        self.publish("progress", details=self.details)
+
+    def set_state(self, state, message):
+        """
+        更新任务状态并发布状态事件。
+        """
+        self.state = state
+        self.message = message
+        now = time.time()
+        if state == "running":
+            self.started = now
+        elif state in self.FINISHED_STATES:
+            self.finished = now
+        self.publish("job")
+
+    def publish(self, event_type, **fields):
+        """
+        发布该任务的事件，事件中带有任务编号、状态、整体进度和剩余时间。
+        """
+        if self.bus is None:
+            return
+        self.bus.publish(
+            event_type, job_id=self.id, kind=self.kind, state=self.state, progress=self.progress,
+            message=self.message, eta=self.eta, **fields
+        )
+
+    def to_dict(self):
+        """
+        将任务状态转换为可以直接序列化为 JSON 的字典。
+
+        :rtype: dict
+        """
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state,
+            "progress": self.progress,
+            "message": self.message,
+            "details": self.details,
+            "eta": self.eta,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    后台任务管理类：用有界的线程池运行建模等耗时任务，提交后立即返回任务编号，
+    之后通过任务编号查询状态、进度和结果，或取消任务。
+
+    - 同时运行的任务数不超过 max_workers，其余任务按提交顺序排队；排队的任务数超过 max_pending 时拒绝提交；
+    - 排队中的任务取消后不再运行；运行中的任务在下一次报告进度时抛出 JobCancelled 中断（协作式取消）；
+    - 只保留最近 history 个已结束任务的记录。
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, history=100, bus=None):
+        """
+        :param max_workers: 同时运行的任务数。
+        :type max_workers: int
+        :param max_pending: 排队等待的任务数上限。
+        :type max_pending: int
+        :param history: 保留的已结束任务记录数。
+        :type history: int
+        :param bus: 发布任务事件的事件通道，默认为 EventBus.shared()。
+        :type bus: EventBus
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = int(max_pending)
+        self.history = int(history)
+        self.bus = bus or EventBus.shared()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, params=None):
+        """
+        提交任务。
+
+        :param kind: 任务类型。
+        :type kind: str
+        :param func: 任务函数，唯一的参数为进度回调 report(fraction, message, details)，返回值作为任务结果（必须可以序列化为 JSON）。
+        :type func: Callable[[Callable[[float, str], None]], Any]
+        :param params: 任务参数，只用于查看。
+        :type params: dict
+        :return: 任务编号。
+        :rtype: str
+        :raises JobQueueFull: 如果排队中的任务数量已达到上限。
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.state == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"任务队列已满（{pending} 个任务排队中），请稍后再试")
+            job = Job(kind, params, self.bus)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, func)
+        job.publish("job")
+        logger.info(f"任务已提交: {job.id}（{kind}）")
+        return job.id
+
+    def _run(self, job, func):
+        """
+        在工作线程中运行任务，并记录结果或异常。
+        """
+        if job.cancel_event.is_set():
+            job.set_state("cancelled", "已取消")
+            return
+        job.set_state("running", "运行中")
+        logger.info(f"任务开始运行: {job.id}（{job.kind}）")
+        try:
+            job.result = func(job.report)
+            if job.cancel_event.is_set():
+                raise JobCancelled("任务已取消")
+            job.progress = 1.0
+            job.set_state("succeeded", "已完成")
+        except Exception as e:
+            # 任务函数可能把取消引起的异常包装成其他异常或返回失败，已请求取消时一律记为取消
+            if isinstance(e, JobCancelled) or job.cancel_event.is_set():
+                job.set_state("cancelled", "已取消")
+                return
+            job.error = str(e)
+            job.set_state("failed", f"失败: {e}")
+            logger.error(f"任务运行异常: {job.id}: {e}")
+        finally:
+            logger.info(f"任务结束: {job.id}（{job.state}，用时 {job.finished - job.started:.2f} 秒）")
+            self._trim()
+
+    def _trim(self):
+        """
+        只保留最近 history 个已结束任务的记录。
+        """
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.done]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        """
+        :param job_id: 任务编号。
+        :type job_id: str
+        :return: 任务记录，不存在时返回 None。
+        :rtype: Job
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """
+        :return: 全部任务记录，按提交顺序排列。
+        :rtype: List[Job]
+        """
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的任务立即取消，运行中的任务在下一次报告进度时中断。
+
+        :param job_id: 任务编号。
+        :type job_id: str
+        :return: 是否已请求取消；任务不存在或已经结束时返回 False。
+        :rtype: bool
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel_event.set()
+        if job.future.cancel():
+            job.set_state("cancelled", "已取消")
+        else:
+            job.message = "正在取消"
+            job.publish("job")
+        logger.info(f"任务已请求取消: {job_id}")
+        return True
+
+    def shutdown(self, cancel=True):
+        """
+        关闭线程池。
+
+        :param cancel: 是否先取消全部未结束的任务。
+        :type cancel: bool
+        """
+        if cancel:
+            for job in self.jobs():
+                self.cancel(job.id)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,106 @@
+import numpy as np
+from utils.Palette import Palette
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LabelVolume:
+    """
+    标签体数据类，用 uint8 类别编号的三维数组 (slice, x, y) 加调色板表示聚类后的整组切片。
+
+    相比逐像素保存 RGB 元组或十六进制字符串，每个像素只占 1 个字节，且可以直接做数组运算。
+    """
+
+    def __init__(self, labels, palette=None, slice_names=None):
+        """
+        :param labels: 形状为 (n_slices, height, width) 的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :param palette: 类别编号对应的调色板，默认为 Palette()。
+        :type palette: Palette
+        :param slice_names: 每层切片对应的源文件名，可选。
+        :type slice_names: list[str]
+        """
+        labels = np.asarray(labels)
+        if labels.ndim != 3:
+            raise ValueError(f"标签数组必须是三维 (slice, x, y)，实际维度为 {labels.ndim}")
+        if labels.dtype != np.uint8:
+            raise ValueError(f"标签数组必须是 uint8 类型，实际为 {labels.dtype}")
+
+        self.labels = labels
+        self.palette = palette if palette is not None else Palette()
+        self.slice_names = list(slice_names) if slice_names is not None else None
+
+    @classmethod
+    def empty(cls, n_slices, height, width, palette=None, slice_names=None):
+        """
+        创建一个未初始化的标签体，用于逐层填充。
+        """
+        return cls(np.empty((n_slices, height, width), dtype=np.uint8), palette, slice_names)
+
+    def __len__(self):
+        return self.labels.shape[0]
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __getitem__(self, index):
+        return self.labels[index]
+
+    @property
+    def shape(self):
+        return self.labels.shape
+
+    @property
+    def nbytes(self):
+        return self.labels.nbytes
+
+    def fill_rows(self, hex_color, rows=2):
+        """
+        将每层切片最上面的若干行替换为指定颜色，对应 ImageProcessor.replace_top_two_rows。
+
+        :param hex_color: 指定的 16 进制颜色值，必须在调色板中。
+        :type hex_color: str
+        :param rows: 替换的行数，默认为 2。
+        :type rows: int
+        """
+        self.labels[:, :rows, :] = self.palette.index_of(hex_color)
+
+    def split(self, n):
+        """
+        将标签体纵向等分成 n 份，划分方式与 ImageProcessor.divide_images_into_folders 一致。
+
+        返回的每一份都是原数组的视图，不复制数据。
+
+        :param n: 等分数量。
+        :type n: int
+        :rtype: list[LabelVolume]
+        """
+        height = self.labels.shape[1]
+        slice_height = height // n
+        sections = []
+        for i in range(n):
+            y_start = i * slice_height
+            y_end = (i + 1) * slice_height if i != n - 1 else height
+            sections.append(LabelVolume(self.labels[:, y_start:y_end, :], self.palette, self.slice_names))
+        return sections
+
+    def class_counts(self):
+        """
+        统计每个类别的像素（体素）数量。
+
+        :return: 长度为 len(palette) 的 int64 数组。
+        :rtype: np.ndarray
+        """
+        return np.bincount(self.labels.ravel(), minlength=len(self.palette))[:len(self.palette)]
+
+    def to_rgb(self, index):
+        """
+        将指定层还原为 RGB 图像。
+
+        :param index: 层编号。
+        :type index: int
+        :return: 形状为 (height, width, 3) 的 uint8 数组。
+        :rtype: np.ndarray
+        """
+        return self.palette.to_rgb(self.labels[index])
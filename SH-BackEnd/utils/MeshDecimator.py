@@ -0,0 +1,196 @@
+import numpy as np
+import pyvista as pv
+from vtkmodules.vtkFiltersCore import vtkDecimatePro
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MeshDecimator:
+    """
+    立方体模型的减面类：按颜色区域减少体素表面的三角形数，保持颜色区域之间的交界线不动。
+
+    每种颜色的表面按面另一侧的类别分成若干块（与另一种颜色的交界面、与标签体外或不生成表面的类别之间的面），
+    每块单独减面，块边界上的顶点（几块交界面相接的曲线）不会被删除或移动：
+    - 两种颜色的交界面只减面一次，另一种颜色使用翻转后的同一块网格，两侧的表面完全重合，不会出现缝隙或互相穿插；
+    - 默认只删除共面的顶点（体素的棱都是特征边），几何形状和颜色区域完全不变；
+      达不到三角形数上限且允许误差时，才在误差范围内删除台阶上的顶点，实际偏差超过误差的块退回只删除共面顶点的结果。
+    颜色在减面之后才附加到每个顶点上（见 CubeBuilder.combine_color_cubes），每种颜色的顶点颜色不受影响。
+
+    面的位置与 VoxelSurface 一致：体素 (k, i, j) 的中心位于 (i * side_length, j * side_length, k * layer_thickness)。
+    """
+
+    # 特征角（度）：45 度时体素的棱都是特征边，只有共面的顶点会被删除；135 度时台阶上的顶点也可以删除
+    FEATURE_ANGLE = 45
+    LOSSY_FEATURE_ANGLE = 135
+
+    @staticmethod
+    def triangle_count(mesh):
+        """
+        :param mesh: 只包含多边形的表面，或由多边形组成的 UnstructuredGrid（例如合并后的立方体模型）。
+        :type mesh: pv.DataSet
+        :return: 网格三角化后的三角形数（n 边形按 n-2 个三角形计）。
+        :rtype: int
+        """
+        if not mesh.n_cells:
+            return 0
+        cells = mesh.GetPolys() if isinstance(mesh, pv.PolyData) else mesh.GetCells()
+        # 偏移数组相邻元素之差即每个单元的顶点数
+        offsets = pv.convert_array(cells.GetOffsetsArray())
+        return int(np.sum(np.diff(offsets) - 2))
+
+    @staticmethod
+    def face_neighbours(mesh, label, labels, keep, side_length=1, layer_thickness=1):
+        """
+        找出颜色表面上每个面另一侧体素的类别。
+
+        :param mesh: 类别 label 的表面，每个面都是一个体素面或体素面的一部分（贪心合并的矩形可能跨越多个邻居，不适用）。
+        :type mesh: pv.PolyData
+        :param label: 表面所属的类别编号。
+        :type label: int
+        :param labels: 形状为 (n_slices, height, width) 的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :param keep: 按类别编号索引的布尔数组，表示该类别是否生成表面。
+        :type keep: np.ndarray
+        :return: (n_cells,) 的 int64 数组；另一侧位于标签体外或属于不生成表面的类别时为 -1。
+        :rtype: np.ndarray
+        """
+        spacing = np.array([side_length, side_length, layer_thickness], dtype=np.float64)
+        # 以体素为单位的面中心坐标 (i, j, k)：面所在的轴上是半整数，另外两个轴上落在体素面以内
+        centers = np.asarray(mesh.cell_centers().points, dtype=np.float64) / spacing
+        axis = np.argmax(np.abs(centers - np.round(centers)), axis=1)
+        rows = np.arange(len(centers))
+        n_slices, height, width = labels.shape
+
+        neighbours = np.full(len(centers), -1, dtype=np.int64)
+        for offset in (-0.5, 0.5):
+            side = centers.copy()
+            side[rows, axis] += offset
+            i, j, k = np.round(side).astype(np.int64).T
+            inside = (k >= 0) & (k < n_slices) & (i >= 0) & (i < height) & (j >= 0) & (j < width)
+            side_labels = np.full(len(centers), -1, dtype=np.int64)
+            side_labels[inside] = labels[k[inside], i[inside], j[inside]]
+            side_labels[inside & ~keep[np.maximum(side_labels, 0)]] = -1
+            # 面两侧一侧是该类别自身，另一侧就是邻居
+            other = side_labels != label
+            neighbours[other] = side_labels[other]
+        return neighbours
+
+    @classmethod
+    def split_patches(cls, color_meshes, labels, keep, side_length=1, layer_thickness=1):
+        """
+        把每种颜色的表面按面另一侧的类别分块。两种颜色的交界面只属于类别编号较小的颜色。
+
+        :param color_meshes: 类别编号 -> 该类别的表面。
+        :type color_meshes: Dict[int, pv.PolyData]
+        :return: 类别编号 -> [(另一侧类别, 三角化的表面块)]，只包含该类别负责减面的块。
+        :rtype: Dict[int, List[Tuple[int, pv.PolyData]]]
+        """
+        patches = {}
+        for label, mesh in color_meshes.items():
+            neighbours = cls.face_neighbours(mesh, label, labels, keep, side_length, layer_thickness)
+            patches[label] = []
+            for neighbour in np.unique(neighbours):
+                if 0 <= neighbour < label:
+                    continue
+                # 不附带 vtkOriginalPointIds、vtkOriginalCellIds，避免这些内部数组被保存到模型文件中
+                patch = mesh.extract_cells(
+                    np.flatnonzero(neighbours == neighbour), pass_point_ids=False, pass_cell_ids=False
+                ).extract_surface(pass_pointid=False, pass_cellid=False, algorithm="dataset_surface")
+                patches[label].append((int(neighbour), patch.triangulate().clean()))
+        return patches
+
+    @classmethod
+    def decimate_pro(cls, patch, target_reduction, feature_angle, max_error=None):
+        """
+        用 vtkDecimatePro 减面，保持拓扑，不删除边界上的顶点。
+
+        :param target_reduction: 目标减少的三角形比例，0 ~ 1。
+        :param feature_angle: 特征角（度），特征边上的顶点只能沿特征边删除。
+        :param max_error: 删除顶点允许的绝对误差，为 None 时不限制。
+        :rtype: pv.PolyData
+        """
+        decimate = vtkDecimatePro()
+        decimate.SetInputData(patch)
+        decimate.SetTargetReduction(target_reduction)
+        decimate.SetFeatureAngle(feature_angle)
+        decimate.PreserveTopologyOn()
+        decimate.SplittingOff()
+        decimate.BoundaryVertexDeletionOff()
+        if max_error is not None:
+            decimate.SetErrorIsAbsolute(True)
+            decimate.SetAbsoluteError(max_error)
+        decimate.Update()
+        return pv.wrap(decimate.GetOutput())
+
+    @staticmethod
+    def deviation(original, decimated):
+        """
+        :return: 原始顶点到减面后表面的最大距离。
+        :rtype: float
+        """
+        if original.n_points == 0 or decimated.n_cells == 0:
+            return 0.0
+        return float(np.abs(original.compute_implicit_distance(decimated)["implicit_distance"]).max())
+
+    @classmethod
+    def decimate_patch(cls, patch, target_reduction, max_error=0.0):
+        """
+        减面一块表面：先只删除共面的顶点，已经达到目标时不改变形状；否则在 max_error 范围内继续删除台阶上的顶点。
+
+        :param patch: 三角化的表面块。
+        :type patch: pv.PolyData
+        :param target_reduction: 目标减少的三角形比例，0 ~ 1。
+        :type target_reduction: float
+        :param max_error: 允许的最大偏差，0 表示只删除共面的顶点，None 表示不限制偏差。
+        :type max_error: float
+        :return: (减面后的表面块, 原始顶点到减面结果的最大距离)。
+        :rtype: Tuple[pv.PolyData, float]
+        """
+        lossless = cls.decimate_pro(patch, target_reduction, cls.FEATURE_ANGLE, 0.0)
+        if max_error == 0 or lossless.n_cells <= patch.n_cells * (1 - target_reduction):
+            return lossless, 0.0
+
+        lossy = cls.decimate_pro(patch, target_reduction, cls.LOSSY_FEATURE_ANGLE, max_error)
+        if lossy.n_cells >= lossless.n_cells:
+            return lossless, 0.0
+        # vtkDecimatePro 的误差是顶点到局部平均平面的距离，实际偏差可能更大，超过时退回不改变形状的结果
+        deviation = cls.deviation(patch, lossy)
+        if max_error is not None and deviation > max_error:
+            return lossless, 0.0
+        return lossy, deviation
+
+    @classmethod
+    def decimate_patches(cls, patches, target_reduction, max_error=0.0):
+        """
+        减面一个颜色区域负责的全部表面块，可在子进程中运行。
+
+        :param patches: [(另一侧类别, 表面块)]，见 split_patches。
+        :type patches: List[Tuple[int, pv.PolyData]]
+        :return: [(另一侧类别, 减面后的表面块, 最大偏差)]。
+        :rtype: List[Tuple[int, pv.PolyData, float]]
+        """
+        return [
+            (neighbour, *cls.decimate_patch(patch, target_reduction, max_error))
+            for neighbour, patch in patches
+        ]
+
+    @staticmethod
+    def assemble(label, decimated):
+        """
+        拼接一种颜色减面后的表面：该颜色负责的块，加上编号较小的颜色与它的交界面（翻转法向）。
+
+        :param label: 类别编号。
+        :type label: int
+        :param decimated: 类别编号 -> decimate_patches 的结果。
+        :type decimated: Dict[int, List[Tuple[int, pv.PolyData, float]]]
+        :rtype: pv.PolyData
+        """
+        parts = [patch for _, patch, _ in decimated[label]]
+        for other, patches in decimated.items():
+            if other < label:
+                parts.extend(patch.flip_faces() for neighbour, patch, _ in patches if neighbour == label)
+        parts = [part for part in parts if part.n_cells]
+        if not parts:
+            return pv.PolyData()
+        return pv.merge(parts, merge_points=True) if len(parts) > 1 else parts[0]
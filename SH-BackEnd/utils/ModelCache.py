@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from utils.SliceCache import SliceCache
+from utils import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCache:
+    """
+    建模结果缓存：以源图片内容和全部建模参数计算指纹，保存生成的模型文件及其统计结果。
+
+    再次以相同的输入和参数建模时，直接把缓存中的文件复制到新的输出路径，不再重新建模。
+    每个条目是缓存文件夹下以指纹命名的子文件夹，包含模型文件和 entry.json 元数据；
+    模型文件按相对输出路径的后缀保存（例如 ".vtk"、".stats.json"、"_part_1.ply"），恢复时拼接到新的输出路径后面。
+    缓存总大小超过 max_bytes 时按最近使用时间（entry.json 的 mtime）淘汰最旧的条目。
+    """
+
+    DEFAULT_FOLDER = os.path.join(config.CACHE_ROOT, "models")
+
+    # 建模结果格式的版本号，生成逻辑变化导致结果不同时递增，使旧条目全部失效
+    VERSION = 1
+
+    ENTRY_FILE = "entry.json"
+
+    def __init__(self, cache_folder=None, max_bytes=4 << 30):
+        """
+        :param cache_folder: 缓存文件夹，默认为 DEFAULT_FOLDER。
+        :type cache_folder: str
+        :param max_bytes: 缓存总大小上限（字节），默认为 4 GB。
+        :type max_bytes: int
+        """
+        self.cache_folder = cache_folder or self.DEFAULT_FOLDER
+        self.max_bytes = int(max_bytes)
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    @classmethod
+    def fingerprint(cls, image_paths, params):
+        """
+        计算一次建模的指纹。
+
+        :param image_paths: 按层顺序排列的源图片路径列表。
+        :type image_paths: List[str]
+        :param params: 影响建模结果的全部参数，值必须可以序列化为 JSON。
+        :type params: dict
+        :return: 十六进制指纹。
+        :rtype: str
+        """
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(json.dumps({"version": cls.VERSION, "params": params}, sort_keys=True).encode("utf-8"))
+        for image_path in image_paths:
+            hasher.update(SliceCache.file_hash(image_path).encode("ascii"))
+        return hasher.hexdigest()
+
+    @staticmethod
+    def is_fingerprint(fingerprint):
+        """
+        :return: 是否为 fingerprint 生成的指纹（40 位十六进制小写字符串）。
+        :rtype: bool
+        """
+        return isinstance(fingerprint, str) and re.fullmatch(r"[0-9a-f]{40}", fingerprint) is not None
+
+    def _entry_folder(self, fingerprint):
+        return os.path.join(self.cache_folder, fingerprint)
+
+    def lookup(self, fingerprint):
+        """
+        查找缓存条目并刷新其最近使用时间。
+
+        :param fingerprint: 建模指纹。
+        :type fingerprint: str
+        :return: 条目元数据；未命中或条目不完整时返回 None。
+        :rtype: dict
+        """
+        entry_folder = self._entry_folder(fingerprint)
+        entry_path = os.path.join(entry_folder, self.ENTRY_FILE)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if not all(os.path.exists(os.path.join(entry_folder, name)) for name in entry["files"].values()):
+                raise FileNotFoundError("缓存条目缺少模型文件")
+            os.utime(entry_path)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取建模缓存异常: {e}")
+            return None
+
+    def restore(self, fingerprint, output_base):
+        """
+        将缓存的模型文件复制到新的输出路径。
+
+        :param fingerprint: 建模指纹。
+        :type fingerprint: str
+        :param output_base: 不带后缀的输出路径。
+        :type output_base: str
+        :return: 复制得到的文件路径列表；未命中时返回 None。
+        :rtype: List[str]
+        """
+        entry = self.lookup(fingerprint)
+        if entry is None:
+            return None
+
+        entry_folder = self._entry_folder(fingerprint)
+        restored = []
+        for suffix, name in entry["files"].items():
+            target_path = f"{output_base}{suffix}"
+            output_dir = os.path.dirname(target_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            shutil.copyfile(os.path.join(entry_folder, name), target_path)
+            restored.append(target_path)
+        logger.info(f"建模缓存命中，已复制 {len(restored)} 个文件: {restored}")
+        return restored
+
+    def store(self, fingerprint, output_base, file_paths, params=None):
+        """
+        保存一次建模生成的文件。先写入临时文件夹再重命名，写入失败不会留下不完整的条目。
+
+        :param fingerprint: 建模指纹。
+        :type fingerprint: str
+        :param output_base: 不带后缀的输出路径，文件按相对该路径的后缀保存。
+        :type output_base: str
+        :param file_paths: 生成的文件路径列表，都必须以 output_base 开头。
+        :type file_paths: List[str]
+        :param params: 建模参数，记录在元数据中便于查看。
+        :type params: dict
+        :return: 是否保存成功。
+        :rtype: bool
+        """
+        entry_folder = self._entry_folder(fingerprint)
+        temp_folder = f"{entry_folder}.{uuid.uuid4().hex}.tmp"
+        try:
+            files = {}
+            size = 0
+            os.makedirs(temp_folder)
+            for index, file_path in enumerate(file_paths):
+                if not file_path or not file_path.startswith(output_base) or not os.path.exists(file_path):
+                    raise ValueError(f"无法缓存模型文件: {file_path}")
+                suffix = file_path[len(output_base):]
+                name = f"{index}{os.path.splitext(file_path)[1]}"
+                shutil.copyfile(file_path, os.path.join(temp_folder, name))
+                files[suffix] = name
+                size += os.path.getsize(file_path)
+
+            entry = {
+                "fingerprint": fingerprint,
+                "params": params or {},
+                "files": files,
+                "size": size,
+                "created": time.time(),
+            }
+            with open(os.path.join(temp_folder, self.ENTRY_FILE), "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+
+            shutil.rmtree(entry_folder, ignore_errors=True)
+            os.replace(temp_folder, entry_folder)
+            logger.info(f"建模结果已缓存: {fingerprint}（{size / 1024 ** 2:.1f} MB）")
+        except Exception as e:
+            logger.error(f"写入建模缓存异常: {e}")
+            shutil.rmtree(temp_folder, ignore_errors=True)
+            return False
+
+        # 条目已经写入，淘汰旧条目失败不影响本次建模
+        try:
+            self.evict()
+        except Exception as e:
+            logger.error(f"淘汰建模缓存异常: {e}")
+        return True
+
+    def entries(self):
+        """
+        列出全部缓存条目。条目的指纹以文件夹名为准；元数据损坏或不完整的条目会被跳过。
+
+        :return: 条目元数据列表，按最近使用时间从旧到新排序，每个条目附带 "last_used" 字段。
+        :rtype: List[dict]
+        """
+        entries = []
+        with os.scandir(self.cache_folder) as it:
+            for folder in it:
+                entry_path = os.path.join(folder.path, self.ENTRY_FILE)
+                if (not self.is_fingerprint(folder.name) or not folder.is_dir(follow_symlinks=False)
+                        or not os.path.exists(entry_path)):
+                    continue
+                try:
+                    with open(entry_path, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                    size = entry["size"]
+                    if not isinstance(entry["files"], dict) or not isinstance(size, int) or size < 0:
+                        raise ValueError(f"缓存条目元数据无效: {entry_path}")
+                    entry["fingerprint"] = folder.name
+                    entry["last_used"] = os.path.getmtime(entry_path)
+                    entries.append(entry)
+                except Exception as e:
+                    logger.error(f"读取建模缓存异常: {e}")
+        entries.sort(key=lambda entry: entry["last_used"])
+        return entries
+
+    def size(self):
+        """
+        :return: 缓存总大小（字节）。
+        :rtype: int
+        """
+        return sum(entry["size"] for entry in self.entries())
+
+    def remove(self, fingerprint):
+        """
+        删除一个缓存条目。
+
+        :param fingerprint: 建模指纹。
+        :type fingerprint: str
+        :return: 条目是否存在。
+        :rtype: bool
+        :raises ValueError: 如果 fingerprint 不是指纹，或对应的文件夹不在缓存文件夹内。
+        """
+        if not self.is_fingerprint(fingerprint):
+            raise ValueError(f"无效的建模指纹: {fingerprint!r}")
+        entry_folder = self._entry_folder(fingerprint)
+        cache_folder = os.path.realpath(self.cache_folder)
+        if os.path.dirname(os.path.realpath(entry_folder)) != cache_folder:
+            raise ValueError(f"缓存条目不在缓存文件夹内: {entry_folder}")
+        if not os.path.isdir(entry_folder):
+            return False
+        shutil.rmtree(entry_folder, ignore_errors=True)
+        return True
+
+    def evict(self, max_bytes=None):
+        """
+        按最近使用时间淘汰最旧的条目，直到缓存总大小不超过上限。
+
+        :param max_bytes: 大小上限，默认为 self.max_bytes。
+        :type max_bytes: int
+        :return: 删除的条目数量。
+        :rtype: int
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        removed = 0
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            if self.remove(entry["fingerprint"]):
+                total -= entry["size"]
+                removed += 1
+        if removed:
+            logger.info(f"建模缓存已淘汰 {removed} 个条目，当前大小 {total / 1024 ** 2:.1f} MB")
+        return removed
+
+    def clear(self):
+        """
+        删除全部缓存条目。
+
+        :return: 删除的条目数量。
+        :rtype: int
+        """
+        return self.evict(max_bytes=-1)
@@ -0,0 +1,204 @@
+import os
+import time
+
+import numpy as np
+import pyvista as pv
+
+from utils.CubeBuilder import CubeBuilder
+from utils.LabelVolume import LabelVolume
+from utils.PointCloudWriter import PointCloudWriter
+from utils.VolumeStore import VolumeStore
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoader:
+    """
+    模型加载类，供可视化窗口先显示降采样的预览，再分块载入完整数据。
+
+    - 流式点云（PointCloudWriter 写出的 PLY 文件）预览时以内存映射方式按固定步长抽取点，抽样结束即解除映射；
+      完整数据按块顺序读取并直接转换到最终的坐标和颜色数组中，内存峰值只比最终模型多一块，不会像 pv.read 那样先读入整个文件；
+    - 标签体文件（VolumeStore）每个体素只有 1 个字节，读取很快，预览在降采样的标签体上生成立方体表面；
+    - 其他格式（.vtk、.vtp、.vtu 等以及其他程序写出的 PLY 文件）没有可以映射的原始数组，仍由 pv.read 整体读取。
+    每一步的耗时（秒）记录在 timings 中。
+    """
+
+    # 预览最多显示的点数和体素数
+    PREVIEW_POINTS = 500_000
+    PREVIEW_VOXELS = 2_000_000
+
+    def __init__(self, file_path):
+        """
+        :param file_path: 模型文件路径。
+        :type file_path: str
+        """
+        self.file_path = file_path
+        self.extension = os.path.splitext(file_path)[1].lower()
+        self.timings = {}
+        self.mapped = None
+        self._n_points = None
+        self._store = None
+        self._labels = None
+
+    def _timed(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.timings[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def open(self):
+        """
+        打开文件：流式点云 PLY 文件只读取文件头，标签体文件只读取元数据，不读取点或标签。
+
+        :return: 是否可以先显示预览再分块载入，结果同时保存在 mapped 中。
+        :rtype: bool
+        """
+        if self.mapped is not None:
+            return self.mapped
+        self.mapped = False
+        if self.extension == ".ply":
+            try:
+                start = time.perf_counter()
+                with open(self.file_path, "rb") as f:
+                    self._n_points = PointCloudWriter.read_header(f)[0]
+                self.timings["open"] = round(time.perf_counter() - start, 3)
+                self.mapped = True
+                logger.info(f"已打开点云文件: {self.file_path}（{self._n_points} 个点）")
+            except ValueError as e:
+                logger.info(f"PLY 文件不能内存映射，将整体读取: {e}")
+        elif self.extension.lstrip(".") in VolumeStore.FORMATS:
+            self._store = self._timed("open", VolumeStore, self.file_path)
+            self.mapped = True
+            logger.info(f"已打开标签体文件: {self.file_path}（形状 {self._store.shape}）")
+        return self.mapped
+
+    def _volume_labels(self):
+        # 标签体只读取一次，预览和完整模型共用
+        if self._labels is None:
+            self._labels = self._timed("read_labels", self._store.load)
+        return self._labels
+
+    def iter_records(self, chunk_points=1 << 22):
+        """
+        按块顺序读取流式点云的记录，不经过内存映射，读过的数据不会驻留在内存中。
+
+        :param chunk_points: 每块的点数。
+        :type chunk_points: int
+        :return: 依次产出字段为 PointCloudWriter.VERTEX_DTYPE 的记录数组。
+        :rtype: Iterator[np.ndarray]
+        """
+        with open(self.file_path, "rb") as f:
+            n_points, _, data_offset = PointCloudWriter.read_header(f)
+            f.seek(data_offset)
+            for k0 in range(0, n_points, chunk_points):
+                yield np.fromfile(f, dtype=PointCloudWriter.VERTEX_DTYPE, count=min(chunk_points, n_points - k0))
+
+    @staticmethod
+    def records_to_point_cloud(chunks, n_points, progress=None):
+        """
+        将 PointCloudWriter.VERTEX_DTYPE 记录数组逐块转换为带 uint8 "RGB" 颜色的 PolyData。
+
+        :param chunks: 依次排列的记录数组。
+        :type chunks: Iterable[np.ndarray]
+        :param n_points: 总点数。
+        :type n_points: int
+        :param progress: 进度回调 progress(已转换点数, 总点数)，每块调用一次。
+        :type progress: Callable[[int, int], None]
+        :rtype: pv.PolyData
+        """
+        points = np.empty((n_points, 3), dtype=np.float32)
+        colors = np.empty((n_points, 3), dtype=np.uint8)
+        k0 = 0
+        for chunk in chunks:
+            k1 = k0 + len(chunk)
+            for axis, name in enumerate(("x", "y", "z")):
+                points[k0:k1, axis] = chunk[name]
+            for channel, name in enumerate(("red", "green", "blue")):
+                colors[k0:k1, channel] = chunk[name]
+            k0 = k1
+            if progress is not None:
+                progress(k1, n_points)
+        if k0 != n_points:
+            raise ValueError(f"点云文件不完整: 应有 {n_points} 个点，实际读取 {k0} 个")
+        point_cloud = pv.PolyData()
+        point_cloud.points = points
+        point_cloud.verts = ModelLoader.vertex_cells(n_points)
+        point_cloud["RGB"] = colors
+        return point_cloud
+
+    @staticmethod
+    def vertex_cells(n_points):
+        """
+        把全部点放在一个多点单元中，连接数组在点数允许时使用 int32，每个点只占 4 字节；
+        pv.PolyData(points) 默认为每个点建立一个单元，偏移和连接数组都是 int64，每个点占 16 字节。
+
+        :param n_points: 点数。
+        :type n_points: int
+        :rtype: pv.CellArray
+        """
+        dtype = np.int32 if n_points < np.iinfo(np.int32).max else np.int64
+        offsets = np.array([0, n_points], dtype=dtype)
+        return pv.CellArray.from_arrays(offsets, np.arange(n_points, dtype=dtype), deep=False)
+
+    def preview(self):
+        """
+        生成降采样的预览：点云等步长抽取不超过 PREVIEW_POINTS 个点，标签体等步长降采样到不超过 PREVIEW_VOXELS 个体素。
+
+        :return: 预览模型；文件不能映射或数据量本身不超过上限时返回 None，直接载入完整模型即可。
+        :rtype: pv.DataSet
+        """
+        if not self.open():
+            return None
+
+        start = time.perf_counter()
+        if self._n_points is not None:
+            step = -(-self._n_points // self.PREVIEW_POINTS)
+            if step <= 1:
+                return None
+            # 映射只在抽样期间存在，返回后解除，被读入的页不会留在内存中
+            sample = PointCloudWriter.load(self.file_path)[::step]
+            preview = self.records_to_point_cloud([sample], len(sample))
+            del sample
+        else:
+            n_voxels = int(np.prod(self._store.shape))
+            step = int(np.ceil((n_voxels / self.PREVIEW_VOXELS) ** (1 / 3)))
+            if step <= 1:
+                return None
+            volume = self._volume_labels()
+            labels = np.ascontiguousarray(volume.labels[::step, ::step, ::step])
+            # 降采样后的体素 (k, i, j) 对应原体素 (k * step, i * step, j * step)，坐标与完整模型一致
+            builder = CubeBuilder(side_length=step, layer_thickness=self._store.layer_thickness * step)
+            preview = builder.build_model(LabelVolume(labels, volume.palette), greedy=True)
+        self.timings["preview"] = round(time.perf_counter() - start, 3)
+        logger.info(f"预览已生成（步长 {step}），耗时 {self.timings['preview']:.2f} 秒")
+        return preview
+
+    def load(self, progress=None, chunk_points=1 << 22):
+        """
+        载入完整模型。
+
+        :param progress: 进度回调 progress(已完成数量, 总数量)，每载入一块调用一次，调用方可以借此刷新窗口。
+        :type progress: Callable[[int, int], None]
+        :param chunk_points: 点云每块的点数。
+        :type chunk_points: int
+        :rtype: pv.DataSet
+        """
+        if not self.open():
+            model = self._timed("load", pv.read, self.file_path)
+            logger.info(f"模型已读取: {self.file_path}，耗时 {self.timings['load']:.2f} 秒")
+            return model
+
+        start = time.perf_counter()
+        if self._n_points is not None:
+            model = self.records_to_point_cloud(self.iter_records(chunk_points), self._n_points, progress)
+        else:
+            def report(tracker):
+                if progress is not None:
+                    progress(tracker.done, tracker.total)
+
+            builder = CubeBuilder(side_length=1, layer_thickness=self._store.layer_thickness, progress=report)
+            model = builder.build_model(self._volume_labels(), greedy=True)
+        self.timings["load"] = round(time.perf_counter() - start, 3)
+        logger.info(f"完整模型已载入: {self.file_path}，耗时 {self.timings['load']:.2f} 秒")
+        return model
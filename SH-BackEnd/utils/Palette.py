@@ -0,0 +1,92 @@
+import numpy as np
+from utils.ColorAnalyzer import ColorAnalyzer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Palette:
+    """
+    调色板类，保存聚类使用的目标颜色表，类别编号即颜色在表中的下标。
+    """
+
+    # 默认的四色聚类调色板：绿色、青色、蓝色、白色
+    DEFAULT_COLORS = ("#9CFF9B", "#0FFDFE", "#0B00FB", "#FFFFFF")
+
+    def __init__(self, hex_colors=None):
+        """
+        :param hex_colors: 目标颜色的16进制列表，默认为 DEFAULT_COLORS。
+        :type hex_colors: list[str]
+        """
+        if hex_colors is None:
+            hex_colors = self.DEFAULT_COLORS
+        if not 0 < len(hex_colors) <= 256:
+            raise ValueError(f"调色板颜色数量必须在 1-256 之间: {len(hex_colors)}")
+
+        self.rgb = ColorAnalyzer.hex_to_rgb_array(hex_colors)
+
+    def __len__(self):
+        return len(self.rgb)
+
+    def __eq__(self, other):
+        return isinstance(other, Palette) and np.array_equal(self.rgb, other.rgb)
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"Palette({self.hex_colors})"
+
+    @property
+    def hex_colors(self):
+        """
+        调色板中每种颜色的小写十六进制字符串，格式与 extract_pixel_colors 一致。
+
+        :rtype: list[str]
+        """
+        return [self.hex_color(i) for i in range(len(self))]
+
+    def hex_color(self, index):
+        """
+        :param index: 类别编号。
+        :type index: int
+        :return: 对应颜色的十六进制字符串，例如 "#0b00fb"。
+        :rtype: str
+        """
+        r, g, b = (int(c) for c in self.rgb[index])
+        return f"#{r:02x}{g:02x}{b:02x}"
+
+    def index_of(self, hex_color):
+        """
+        查找颜色在调色板中的类别编号。
+
+        :param hex_color: 十六进制颜色字符串。
+        :type hex_color: str
+        :return: 类别编号。
+        :rtype: int
+        :raises ValueError: 如果调色板中没有该颜色。
+        """
+        rgb = np.array(ColorAnalyzer.hex_to_rgb(hex_color), dtype=np.uint8)
+        matches = np.flatnonzero(np.all(self.rgb == rgb, axis=1))
+        if len(matches) == 0:
+            raise ValueError(f"调色板中不存在颜色: {hex_color}")
+        return int(matches[0])
+
+    def to_rgb(self, labels):
+        """
+        将类别编号数组还原为 RGB 数组。
+
+        :param labels: 任意形状的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :return: 形状为 labels.shape + (3,) 的 uint8 RGB 数组。
+        :rtype: np.ndarray
+        """
+        return self.rgb[labels]
+
+    def key(self):
+        """
+        返回可哈希的调色板标识，用于缓存。
+
+        :rtype: tuple
+        """
+        return tuple(map(tuple, self.rgb.tolist()))
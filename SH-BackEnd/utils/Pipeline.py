@@ -1,103 +1,444 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
 from utils.CubeBuilder import CubeBuilder
 from utils.FileManager import FileManager
 from utils.ImageProcessor import ImageProcessor
+from utils.IncrementalBuilder import IncrementalBuilder
+from utils.JobManager import JobCancelled
+from utils.ModelCache import ModelCache
 from utils.PointCloudBuilder import PointCloudBuilder
+from utils.PointCloudPyramid import PointCloudPyramid
+from utils.ProgressTracker import ProgressTracker
+from utils.SliceCache import SliceCache
+from utils.VolumeStatistics import VolumeStatistics
+from utils.VolumeStore import VolumeStore
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Pipeline:
-    def __init__(self, folder_path,output_path,layer_thickness=1, offset=0.3, target=None, model_type=None):
+    def __init__(self, folder_path,output_path,layer_thickness=1, offset=0.3, target=None, model_type=None, workers=None,
+                 checkpoint_folder=None, stencil=3, stream=False, greedy=False, cache_folder=None,
+                 model_cache_folder=None, incremental=False, progress=None, file_format="vtk",
+                 codec="zlib", lod_levels=0, decimate=False, decimate_target=None, decimate_error=0.0):
         """
         初始化 Pipeline 实例。
+
+        :param workers: 预处理使用的进程数，None 表示使用全部 CPU 核心，1 表示串行处理。
+        :param checkpoint_folder: 预处理结果的输出文件夹，仅用于调试或断点保存；为 None 时整个流程不写中间文件。
+        :param stencil: 点云每个像素的加密模板，见 PointCloudBuilder.make_stencil。
+        :param stream: 是否流式生成点云，逐块写入 PLY 文件而不在内存中保留整个点云。
+        :param greedy: 立方体模型是否贪心合并共面且同颜色的相邻面。
+        :param cache_folder: 预处理切片的缓存文件夹，源图片未改变时直接读取聚类结果；默认为 None，不使用缓存，
+                             需要时传入 SliceCache.DEFAULT_FOLDER。
+        :param model_cache_folder: 建模结果的缓存文件夹，输入和参数都相同时直接复制已生成的模型；默认为 None，不使用缓存，
+                                   需要时传入 ModelCache.DEFAULT_FOLDER。
+        :param incremental: 是否增量建模：输入文件夹中追加或修改了部分切片时，只重新计算受影响的层并拼接到已保存的模型中。
+        :param progress: 进度回调 progress(进度, 说明, 阶段详情)，进度为 0 ~ 1；预处理占前一半，建模占后一半，
+                         阶段详情见 ProgressTracker.snapshot（完成数量、吞吐量、剩余时间）。
+        :param file_format: 模型文件格式，"vtk" 为旧版 .vtk 文件，"xml" 为压缩的二进制 XML 文件（点云 .vtp，立方体 .vtu）；
+                            标签体文件对应为 .npz 和 .vti，见 create_volume。
+        :param codec: XML 格式的压缩方式，"zlib"、"lz4"、"lzma" 或 "none"，见 VtkStorage。
+        :param lod_levels: 点云多分辨率金字塔的级数，与模型一起保存，供可视化时按视距选择；为 0 时不生成，见 PointCloudPyramid。
+        :param decimate: 立方体模型是否按颜色区域减面，颜色区域之间的交界线和顶点颜色保持不变，见 CubeBuilder.decimate_color_cubes；
+                         减面需要逐个体素的暴露面，开启时不使用贪心合并。
+        :param decimate_target: 减面后立方体模型的三角形数上限（分段建模时平均分配到各段），为 None 时尽量减少。
+        :param decimate_error: 减面允许的最大偏差，0 表示只删除共面的顶点、形状不变，None 表示不限制。
         """
         self.layer_thickness = layer_thickness
         self.offset = offset
+        self.stencil = stencil
+        self.stream = stream
+        self.greedy = greedy
+        if decimate and greedy:
+            logger.warning("减面需要逐个体素的暴露面，已关闭贪心合并。")
+            self.greedy = False
         self.target = target
         self.model_type = model_type
         self.output_path = output_path
         self.folder_path = folder_path
-        self.temp_folder = None
+        self.workers = workers
+        self.checkpoint_folder = checkpoint_folder
+        self.cache_folder = cache_folder
+        self.model_cache_folder = model_cache_folder
+        self.incremental = incremental
+        self.progress = progress
+        self.file_format = file_format
+        self.codec = codec
+        self.lod_levels = lod_levels
+        self.decimate = decimate
+        self.decimate_target = decimate_target
+        self.decimate_error = decimate_error
         self.image_paths = []
+        self.label_volume = None
+        self.statistics = None
+
+
+
+    # 预处理、建模在整个流程进度中结束的位置，剩余部分为保存模型
+    PREPROCESS_SHARE = 0.5
+    BUILD_SHARE = 0.95
+
+    def _report(self, fraction, message, details=None):
+        """
+        报告整个流程的进度。
+        """
+        if self.progress is not None:
+            self.progress(fraction, message, details)
+
+    def _stage_progress(self, start, end):
+        """
+        阶段进度回调：把 ProgressTracker 的阶段进度映射到整个流程的 [start, end] 区间后报告。
 
+        :rtype: Callable[[ProgressTracker], None]
+        """
+        def report(tracker):
+            fraction = tracker.done / tracker.total if tracker.total else 1.0
+            self._report(start + (end - start) * fraction, tracker.describe(), tracker.snapshot())
 
+        return report
 
     def preprocess_images(self):
         """
-        图片预处理：复制图片到临时文件夹、聚类颜色、处理图片。
+        图片预处理：直接读取源图片（每张只解码一次）、聚类颜色为标签体、处理最上面两行。
+
+        整个过程只在内存中进行，不复制或改写源图片；设置了 checkpoint_folder 时才把聚类结果另存为图片。
+        设置了 cache_folder 时，已经预处理过的切片直接从缓存读取，与 layer_thickness、target 等建模参数无关；
+        未设置 cache_folder 的增量建模使用模型旁边增量状态文件夹中的缓存，只重新聚类追加或修改过的切片。
         """
-        # 创建 temp 文件夹并复制图片
-        self.temp_folder = FileManager.copy_images_to_temp(self.folder_path)
-        # 加载图片路径列表
-        self.image_paths = FileManager.load_image_paths_from_folder(self.temp_folder)
-        # 聚类图片颜色
-        ImageProcessor.cluster_images_to_colors(self.temp_folder)
-        # 替换图片最上面两行像素颜色
-        ImageProcessor.replace_top_two_rows(self.image_paths)
+        # 加载源图片路径列表
+        self.image_paths = FileManager.load_image_paths_from_folder(self.folder_path)
+        # 逐层并行：读取图片、聚类为标签、替换最上面两行像素颜色，结果按层顺序保存在内存中的标签体里
+        if self.cache_folder:
+            cache = SliceCache(self.cache_folder)
+        elif self.incremental:
+            cache = IncrementalBuilder.slice_cache(self.output_path)
+        else:
+            cache = None
+        tracker = ProgressTracker("预处理", len(self.image_paths), "张")
+        report = self._stage_progress(0.0, self.PREPROCESS_SHARE)
+        report(tracker)
+
+        def progress(done, total):
+            if tracker.update(done):
+                report(tracker)
+
+        self.label_volume = ImageProcessor.cluster_images_to_labels(
+            self.image_paths, top_color='#0B00FB', top_rows=2, workers=self.workers, cache=cache, progress=progress
+        )
+        if self.checkpoint_folder:
+            ImageProcessor.save_label_images(self.label_volume, self.checkpoint_folder)
+        # 体积统计只依赖标签体，预处理后统计一次，随模型一起保存
+        self.statistics = VolumeStatistics(self.label_volume, self.layer_thickness, target=self.target)
+        self._report(self.PREPROCESS_SHARE, "图片预处理完成")
         logger.info("图片预处理完成。")
 
+    def load_volume(self, volume_path, layer_thickness=None):
+        """
+        读取 create_volume 保存的标签体文件，代替 preprocess_images，之后可以直接生成点云或立方体模型。
+
+        层厚默认使用标签体文件中保存的值，其余建模参数（target 等）仍使用 Pipeline 的设置；
+        增量建模需要逐张切片的源图片，从标签体建模时忽略。
+
+        :param volume_path: .npz 或 .vti 标签体文件路径。
+        :type volume_path: str
+        :param layer_thickness: 覆盖保存的层厚，为 None 时使用保存的层厚；与保存的值不同时记录警告。
+        :type layer_thickness: int
+        """
+        if self.incremental:
+            logger.warning("增量建模需要源图片，从标签体文件建模时已忽略。")
+            self.incremental = False
+        store = VolumeStore(volume_path)
+        if layer_thickness is None:
+            self.layer_thickness = store.layer_thickness
+        else:
+            self.layer_thickness = int(layer_thickness)
+            if self.layer_thickness != store.layer_thickness:
+                logger.warning(
+                    f"层厚 {self.layer_thickness} 与标签体保存的层厚 {store.layer_thickness} 不同，已按 {self.layer_thickness} 建模。"
+                )
+        # 建模缓存的指纹按标签体文件的内容计算
+        self.image_paths = [volume_path]
+        self.label_volume = store.load()
+        self.statistics = VolumeStatistics(self.label_volume, self.layer_thickness, target=self.target)
+        self._report(self.PREPROCESS_SHARE, "标签体读取完成")
+        logger.info(f"标签体读取完成: {volume_path}")
+
+    def create_volume(self):
+        """
+        标签体保存流程：只保存 uint8 标签体、调色板和层厚，不生成几何，点云和立方体模型之后用 load_volume 按需生成。
+
+        file_format 为 "xml" 时保存为 .vti，否则保存为分块压缩的 .npz。
+
+        :return: 生成的标签体文件和统计结果文件的路径；失败时返回 None。
+        :rtype: List[str]
+        """
+        try:
+            self._report(self.PREPROCESS_SHARE, "正在保存标签体")
+            volume_format = "vti" if self.file_format == "xml" else "npz"
+
+            def build():
+                volume_path = VolumeStore.save(
+                    self.label_volume, self.output_path, self.layer_thickness, file_format=volume_format,
+                    codec=self.codec
+                )
+                return [volume_path, self.statistics.save_json(self.output_path)]
+
+            file_paths = self._run_cached(self._build_params("volume"), build)
+            self._report(1.0, "标签体保存完成")
+            logger.info("标签体保存完成。")
+            return file_paths
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"保存标签体时出现异常: {e}")
+
     def create_point_cloud(self):
         """
-        点云创建、保存及清理流程。
+        点云创建及保存流程。
+
+        :return: 生成的模型文件和统计结果文件的路径；失败时返回 None。
+        :rtype: List[str]
         """
         try:
-            builder = PointCloudBuilder(self.layer_thickness, self.offset, self.target)
-            point_cloud = builder.build_point_cloud(self.image_paths)
-            FileManager.save_point_cloud_vtk(point_cloud, self.output_path)
+            self._report(self.PREPROCESS_SHARE, "正在生成点云")
+            def build():
+                if self.incremental:
+                    builder = PointCloudBuilder(self.layer_thickness, self.offset, self.target, stencil=self.stencil,
+                                                progress=self._stage_progress(self.PREPROCESS_SHARE, self.BUILD_SHARE))
+                    model_path = IncrementalBuilder(
+                        self.output_path, self._build_params("model"), file_format=self.file_format, codec=self.codec
+                    ).build_point_cloud(
+                        builder, self.label_volume, IncrementalBuilder.slice_fingerprints(self.image_paths),
+                        stream=self.stream
+                    )
+                    model_paths = [model_path] + self._build_pyramid(model_path)
+                else:
+                    model_paths = self._build_point_cloud(self.label_volume, self.output_path)
+                return model_paths + [self.statistics.save_json(self.output_path)]
+
+            file_paths = self._run_cached(self._build_params("model"), build)
+            self._report(1.0, "点云创建并保存完成")
             logger.info("点云创建并保存完成。")
+            return file_paths
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"创建点云时出现异常: {e}")
-        finally:
-            self._cleanup_temp_folder()
+
+    def _build_point_cloud(self, volume, output_path):
+        """
+        根据 stream 设置生成点云并保存，返回实际保存的文件路径（模型在前，之后为金字塔文件）。
+        """
+        builder = PointCloudBuilder(self.layer_thickness, self.offset, self.target, stencil=self.stencil,
+                                    progress=self._stage_progress(self.PREPROCESS_SHARE, self.BUILD_SHARE))
+        if self.stream:
+            model_path = builder.stream_point_cloud(volume, output_path)
+            return [model_path] + self._build_pyramid(model_path)
+        point_cloud = builder.build_point_cloud(volume)
+        self._report(self.BUILD_SHARE, "正在保存点云")
+        model_path = FileManager.save_point_cloud_vtk(point_cloud, output_path, self.file_format, self.codec)
+        return [model_path] + self._build_pyramid(model_path, point_cloud)
+
+    def _build_pyramid(self, model_path, point_cloud=None):
+        """
+        设置了 lod_levels 时为点云生成多分辨率金字塔，返回清单和各级文件的路径；否则返回空列表。
+        """
+        if not self.lod_levels or not model_path:
+            return []
+        self._report(self.BUILD_SHARE, "正在生成点云金字塔")
+        return PointCloudPyramid.save(model_path, point_cloud, levels=self.lod_levels, codec=self.codec)
 
     def create_cube(self):
         """
-        立方体建模、保存及清理流程。
+        立方体建模及保存流程。
+
+        :return: 生成的模型文件和统计结果文件的路径；失败时返回 None。
+        :rtype: List[str]
         """
         try:
-            builder = CubeBuilder(side_length=1, layer_thickness=self.layer_thickness, target=self.target)
-            cube_model = builder.build_model(self.image_paths)
-            FileManager.save_as_vtk(cube_model, self.output_path)
+            self._report(self.PREPROCESS_SHARE, "正在生成立方体模型")
+            def build():
+                builder = CubeBuilder(side_length=1, layer_thickness=self.layer_thickness, target=self.target,
+                                      progress=self._stage_progress(self.PREPROCESS_SHARE, self.BUILD_SHARE),
+                                      decimate=self.decimate, decimate_target=self.decimate_target,
+                                      decimate_error=self.decimate_error, workers=self.workers)
+                if self.incremental:
+                    model_path = IncrementalBuilder(
+                        self.output_path, self._build_params("model"), file_format=self.file_format, codec=self.codec
+                    ).build_cube(
+                        builder, self.label_volume, IncrementalBuilder.slice_fingerprints(self.image_paths),
+                        greedy=self.greedy
+                    )
+                else:
+                    cube_model = builder.build_model(self.label_volume, greedy=self.greedy)
+                    self._report(self.BUILD_SHARE, "正在保存立方体模型")
+                    model_path = FileManager.save_as_vtk(cube_model, self.output_path, self.file_format, self.codec)
+                return [model_path, self.statistics.save_json(self.output_path)]
+
+            file_paths = self._run_cached(self._build_params("model"), build)
+            self._report(1.0, "立方体建模并保存完成")
             logger.info("立方体建模并保存完成。")
+            return file_paths
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"创建立方体时出现异常: {e}")
-        finally:
-            self._cleanup_temp_folder()
+
+    def _build_params(self, operation, **extra):
+        """
+        影响建模结果的全部参数，用于计算建模缓存的指纹。
+        """
+        params = dict(
+            operation=operation, model_type=self.model_type, layer_thickness=self.layer_thickness,
+            offset=self.offset, target=self.target, stencil=np.asarray(self.stencil).tolist(), stream=self.stream,
+            greedy=self.greedy, top_color='#0B00FB', top_rows=2, file_format=self.file_format, codec=self.codec,
+            lod_levels=self.lod_levels, decimate=self.decimate, decimate_target=self.decimate_target,
+            decimate_error=self.decimate_error,
+        )
+        params.update(extra)
+        return params
+
+    def _run_cached(self, params, build):
+        """
+        在建模结果缓存的保护下建模：输入图片和参数都没有变化时直接复制缓存的文件，否则调用 build 建模并缓存结果。
+        增量建模不使用建模结果缓存：缓存只保存模型文件，不保存增量建模的清单和分块，命中后下一次增量建模只能完整重建；
+        增量建模本身已经复用未改变的部分。
+
+        :param params: 影响建模结果的全部参数。
+        :type params: dict
+        :param build: 无参数的建模函数，返回生成的全部文件路径；部分失败时返回 None，结果不会被缓存。
+        :type build: Callable[[], List[str]]
+        :return: 输出的文件路径列表。
+        :rtype: List[str]
+        """
+        if not self.model_cache_folder or self.incremental:
+            return build()
+
+        cache = ModelCache(self.model_cache_folder)
+        output_base, _ = os.path.splitext(self.output_path)
+        fingerprint = ModelCache.fingerprint(self.image_paths, params)
+        restored = cache.restore(fingerprint, output_base)
+        if restored is not None:
+            return restored
+
+        file_paths = build()
+        if file_paths and all(file_paths):
+            cache.store(fingerprint, output_base, file_paths, params)
+        return file_paths
 
     def create_section(self, n):
         """
-        分段立方体建模流程。
+        分段建模流程：在内存中纵向等分标签体，各分段在独立的子进程中并行建模并保存。
+
+        各分段互不依赖，进程数为 min(n, workers)，总耗时接近最慢的单个分段。
+        点云分段在子进程中流式写入 PLY 文件；分段文件名为 "<输出文件名>_part_<i>"，保留原后缀。
+
+        :param n: 分段数量。
+        :type n: int
+        :return: 生成的全部文件路径；失败时返回 None。
+        :rtype: List[str]
         """
         try:
-            ImageProcessor.divide_images_into_folders(self.temp_folder, n)
-            for i in range(1, n + 1):
-                # 生成分段文件夹路径
-                section_folder = f"{self.temp_folder}/temp{i}"
-                self.image_paths = FileManager.load_image_paths_from_folder(section_folder)
-
-                if self.model_type=="point_cloud":
-                    put_path=f"{self.output_path}_part_{i}"
-                    builder = PointCloudBuilder(self.layer_thickness, self.offset, self.target)
-                    point_cloud = builder.build_point_cloud(self.image_paths)
-                    FileManager.save_point_cloud_vtk(point_cloud, put_path)
-
-                elif self.model_type=="cube":
-                    put_path=f"{self.output_path}_part_{i}"
-                    builder = CubeBuilder(side_length=1, layer_thickness=self.layer_thickness, target=self.target)
-                    cube_model = builder.build_model(self.image_paths)
-                    FileManager.save_as_vtk(cube_model, put_path)
-
-                logger.info(f"分段 {i} 建模完成并保存。")
+            if self.model_type not in ("point_cloud", "cube"):
+                raise ValueError(f"未知的模型类型: {self.model_type}")
 
+            self._report(self.PREPROCESS_SHARE, f"正在分 {n} 段建模")
+            file_paths = self._run_cached(self._build_params("section", n=n), lambda: self._build_sections(n))
+            self._report(1.0, "分段建模完成")
+            return file_paths
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error in create_cube_section: {e}")
-        finally:
-            self._cleanup_temp_folder()
 
-    def _cleanup_temp_folder(self):
+    def _build_sections(self, n):
         """
-        删除临时文件夹。
+        并行构建全部分段，返回生成的文件路径列表；有分段失败时返回 None。
         """
-        if self.temp_folder:
-            FileManager.delete_temp_folder(self.temp_folder)
-            logger.info("临时文件夹已删除。")
+        # 在内存中纵向等分标签体，每一份都是数组视图
+        sections = self.label_volume.split(n)
+        base_name, extension = os.path.splitext(self.output_path)
+        put_paths = [f"{base_name}_part_{i}{extension}" for i in range(1, n + 1)]
+        options = dict(
+            model_type=self.model_type, layer_thickness=self.layer_thickness, offset=self.offset,
+            target=self.target, stencil=self.stencil, stream=self.stream, greedy=self.greedy, file_format=self.file_format,
+            codec=self.codec, decimate=self.decimate, decimate_error=self.decimate_error,
+            decimate_target=None if self.decimate_target is None else max(1, self.decimate_target // n),
+        )
+        workers = min(self.workers or os.cpu_count() or 1, n)
+
+        tracker = ProgressTracker("分段建模", n, "段")
+        report = self._stage_progress(self.PREPROCESS_SHARE, 1.0)
+
+        def section_done(finished):
+            if tracker.update(finished):
+                report(tracker)
+
+        if workers <= 1:
+            file_paths = []
+            for i, (section, put_path) in enumerate(zip(sections, put_paths), start=1):
+                file_paths.extend(Pipeline.build_section(section, put_path, **options))
+                logger.info(f"分段 {i} 建模完成并保存。")
+                section_done(i)
+            return file_paths
+
+        file_paths = []
+        failed = False
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(Pipeline.build_section, section, put_path, **options): i
+                for i, (section, put_path) in enumerate(zip(sections, put_paths), start=1)
+            }
+            try:
+                for finished, future in enumerate(as_completed(futures), start=1):
+                    i = futures[future]
+                    try:
+                        file_paths.extend(future.result())
+                        logger.info(f"分段 {i} 建模完成并保存。")
+                    except Exception as e:
+                        failed = True
+                        logger.error(f"分段 {i} 建模时出现异常: {e}")
+                    section_done(finished)
+            except BaseException:
+                # 任务被取消（进度回调抛出 JobCancelled）时不再等待排队中的分段
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        return None if failed else sorted(file_paths)
+
+    @staticmethod
+    def build_section(section, put_path, model_type, layer_thickness=1, offset=0.3, target=None, stencil=3,
+                      stream=False, greedy=False, file_format="vtk", codec="zlib", decimate=False, decimate_target=None,
+                      decimate_error=0.0):
+        """
+        构建并保存单个分段的模型及其体积统计，可在子进程中运行；分段已经并行构建，分段内的减面串行进行。
+
+        :param section: 分段的标签体。
+        :type section: LabelVolume
+        :param put_path: 分段模型的输出路径。
+        :type put_path: str
+        :param model_type: "point_cloud" 或 "cube"。
+        :type model_type: str
+        :param stream: 点云是否流式写入 PLY 文件；否则在内存中生成后按 file_format 和 codec 保存。
+        :type stream: bool
+        :return: 实际保存的模型文件和统计结果文件的路径。
+        :rtype: List[str]
+        """
+        if model_type == "point_cloud":
+            builder = PointCloudBuilder(layer_thickness, offset, target, stencil=stencil)
+            if stream:
+                saved_path = builder.stream_point_cloud(section, put_path)
+            else:
+                saved_path = FileManager.save_point_cloud_vtk(
+                    builder.build_point_cloud(section), put_path, file_format, codec
+                )
+        else:
+            builder = CubeBuilder(side_length=1, layer_thickness=layer_thickness, target=target, decimate=decimate,
+                                  decimate_target=decimate_target, decimate_error=decimate_error)
+            cube_model = builder.build_model(section, greedy=greedy)
+            saved_path = FileManager.save_as_vtk(cube_model, put_path, file_format, codec)
+
+        return [saved_path, VolumeStatistics(section, layer_thickness, target=target).save_json(put_path)]
@@ -1,9 +1,13 @@
 import pyvista as pv
 import numpy as np
 from utils.ImageProcessor import ImageProcessor
-from utils.ColorAnalyzer import ColorAnalyzer
+from utils.TargetFilter import TargetFilter
+from utils.LabelVolume import LabelVolume
+from utils.PointCloudWriter import PointCloudWriter
+from utils.ProgressTracker import ProgressTracker
+from utils.JobManager import JobCancelled
+from utils.VolumeStatistics import VolumeStatistics
 from tqdm import tqdm
-from collections import defaultdict
 import logging
 
 
@@ -13,24 +17,202 @@ class PointCloudBuilder:
     点云生成类，用于根据图像生成三维点云。
     """
 
-    def __init__(self, layer_thickness,offset=0.3,target=None):
+    def __init__(self, layer_thickness,offset=0.3,target=None,stencil=3,progress=None):
         """
         初始化点云生成类。
 
         :param layer_thickness: 每层的厚度，控制图像层的堆叠间隔。
         :type layer_thickness: int
+        :param stencil: 每个像素加密生成的点的偏移模板，见 make_stencil，默认为 3（3x3x3）。
+        :type stencil: int | Tuple[int, int, int] | np.ndarray
+        :param progress: 进度回调，参数为当前阶段的 ProgressTracker，每层生成后按 ProgressTracker 的发布间隔调用。
+        :type progress: Callable[[ProgressTracker], None]
         """
         self.layer_thickness = layer_thickness  # 每层的厚度
         self.offset=offset
-        self.points = []  # 存储所有点的 (x, y, z) 坐标
-        self.colors = []  # 存储所有点的颜色 (r, g, b)
-        self.plotter = pv.Plotter()  # 负责点云的可视化
+        self.stencil = self.make_stencil(stencil, offset)  # 每个像素的点偏移模板 (k, 3)
+        self.points = np.empty((0, 3), dtype=np.float32)  # 存储所有点的 (x, y, z) 坐标
+        self.colors = np.empty((0, 3), dtype=np.uint8)  # 存储所有点的颜色 (r, g, b)
+        self._plotter = None  # 负责点云的可视化，首次使用时才创建
         self.volume_data = {}  # 存储每种颜色对应的体积数据
         self.target=target
+        self.target_filter = TargetFilter(target)  # 编译后的目标流过滤规则，两种建模类共用
+        self.progress = progress
+
+    @property
+    def plotter(self):
+        """
+        可视化使用的 pv.Plotter，首次访问时才创建，建模和保存过程不需要。
+        """
+        if self._plotter is None:
+            self._plotter = pv.Plotter()
+        return self._plotter
+
+    def track(self, tracker, done=None, items=0):
+        """
+        更新阶段进度，到了发布时间且设置了 progress 回调时报告。
+
+        :param tracker: 当前阶段的进度跟踪器。
+        :type tracker: ProgressTracker
+        :param done: 已完成的数量，为 None 时加 1。
+        :param items: 本次新生成的点数。
+        """
+        if tracker.update(done, items) and self.progress is not None:
+            self.progress(tracker)
+
+    @staticmethod
+    def make_stencil(stencil, offset):
+        """
+        生成像素加密使用的偏移模板。
+
+        - 整数 n：在 [-offset, offset] 范围内生成 n x n x n 的均匀网格（n=1 时只有中心点）；
+        - 三元组 (nx, ny, nz)：各方向分别取 nx、ny、nz 个点的均匀网格；
+        - (k, 3) 数组：直接作为 k 个点的偏移。
+
+        网格按 dx、dy、dz 的嵌套顺序展开，n=3 时与原来的 3x3x3 三重循环顺序一致。
+
+        :param stencil: 模板设置。
+        :param offset: 网格模板的最大偏移量。
+        :type offset: float
+        :return: (k, 3) 的 float32 偏移数组。
+        :rtype: np.ndarray
+        :raises ValueError: 如果模板设置无效。
+        """
+        def axis_offsets(n):
+            if n < 1:
+                raise ValueError(f"点云模板每个方向至少需要 1 个点: {stencil}")
+            return np.linspace(-offset, offset, n) if n > 1 else np.zeros(1)
+
+        if np.isscalar(stencil):
+            stencil = (int(stencil),) * 3
+
+        stencil_array = np.asarray(stencil)
+        if stencil_array.ndim == 1 and len(stencil_array) == 3 and np.issubdtype(stencil_array.dtype, np.integer):
+            dx, dy, dz = np.meshgrid(*(axis_offsets(int(n)) for n in stencil_array), indexing="ij")
+            stencil_array = np.stack((dx.ravel(), dy.ravel(), dz.ravel()), axis=1)
+
+        if stencil_array.ndim != 2 or stencil_array.shape[1] != 3 or len(stencil_array) == 0:
+            raise ValueError(f"无效的点云模板: {stencil}")
+
+        return stencil_array.astype(np.float32)
+
+    def extract_layer_pixels(self, image_path):
+        """
+        读取单张图片，返回需要保留的像素坐标和颜色。
+
+        颜色判断通过目标流过滤的全颜色空间保留表完成，每个像素只需一次查表。
+
+        :param image_path: 图像路径。
+        :type image_path: str
+        :return: (coords, colors)，分别为 (N, 2) 的像素坐标和 (N, 3) 的 uint8 RGB 颜色。
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        coords, colors = ImageProcessor.extract_pixel_arrays(image_path)
+        mask = self.target_filter.rgb_mask(colors)
+
+        return coords[mask], colors[mask]
+
+    def extract_label_pixels(self, labels, palette):
+        """
+        从单层类别编号图中取出需要保留的像素坐标和颜色。
+
+        过滤条件编译为按类别编号索引的保留表，见 TargetFilter.palette_mask。
+
+        :param labels: 形状为 (height, width) 的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :param palette: 类别编号对应的调色板。
+        :type palette: Palette
+        :return: (coords, colors)，分别为 (N, 2) 的像素坐标和 (N, 3) 的 uint8 RGB 颜色。
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        xs, ys = np.nonzero(self.target_filter.label_mask(labels, palette))
+        coords = np.stack((xs, ys), axis=1).astype(np.int32)
+
+        return coords, palette.rgb[labels[xs, ys]]
+
+    def count_label_pixels(self, labels, palette):
+        """
+        统计单层类别编号图中需要保留的像素数量，用于预先分配点云数组。
+
+        :param labels: 形状为 (height, width) 的 uint8 类别编号数组。
+        :param palette: 类别编号对应的调色板。
+        :rtype: int
+        """
+        return int(np.count_nonzero(self.target_filter.label_mask(labels, palette)))
+
+    def densify_layer(self, current_z, coords, colors, out_points, out_colors, start=0):
+        """
+        将一层像素按偏移模板加密为点，直接写入预先分配好的数组中。
+
+        :param current_z: 当前层的高度。
+        :type current_z: int
+        :param coords: (N, 2) 的像素坐标。
+        :type coords: np.ndarray
+        :param colors: (N, 3) 的 uint8 RGB 颜色。
+        :type colors: np.ndarray
+        :param out_points: (M, 3) 的 float32 输出点数组。
+        :type out_points: np.ndarray
+        :param out_colors: (M, 3) 的 uint8 输出颜色数组。
+        :type out_colors: np.ndarray
+        :param start: 写入的起始位置。
+        :type start: int
+        :return: 写入后的结束位置。
+        :rtype: int
+        """
+        n_pixels, n_stencil = len(coords), len(self.stencil)
+        end = start + n_pixels * n_stencil
+
+        base = np.empty((n_pixels, 1, 3), dtype=np.float32)
+        base[:, 0, :2] = coords
+        base[:, 0, 2] = current_z
+
+        # 广播：每个像素中心加上模板中的全部偏移
+        np.add(base, self.stencil[None, :, :], out=out_points[start:end].reshape(n_pixels, n_stencil, 3))
+        out_colors[start:end].reshape(n_pixels, n_stencil, 3)[:] = colors[:, None, :]
+
+        return end
+
+    def generate_label_layer(self, volume, index):
+        """
+        生成标签体中一层切片（含 layer_thickness 个子层）的全部点，点的顺序与 build_point_cloud 中该层的顺序一致。
+
+        :param volume: 聚类得到的标签体。
+        :type volume: LabelVolume
+        :param index: 层编号。
+        :type index: int
+        :return: (points, colors)，分别为 (M, 3) 的 float32 坐标和 (M, 3) 的 uint8 颜色。
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        coords, colors = self.extract_label_pixels(volume[index], volume.palette)
+        n_points = len(coords) * self.layer_thickness * len(self.stencil)
+        points = np.empty((n_points, 3), dtype=np.float32)
+        point_colors = np.empty((n_points, 3), dtype=np.uint8)
+
+        cursor = 0
+        current_z = index * self.layer_thickness
+        for i in range(current_z, current_z + self.layer_thickness):
+            cursor = self.densify_layer(i, coords, colors, points, point_colors, cursor)
+        return points, point_colors
+
+    def layer_z(self, index, n_pixels):
+        """
+        计算一层切片全部点的 z 坐标，与 densify_layer 的计算方式完全一致，用于把已有的点平移到新的层位置。
+
+        :param index: 层编号。
+        :type index: int
+        :param n_pixels: 该层保留的像素数量。
+        :type n_pixels: int
+        :return: (layer_thickness * n_pixels * len(stencil),) 的 float32 数组。
+        :rtype: np.ndarray
+        """
+        current_z = index * self.layer_thickness
+        sublayers = np.arange(current_z, current_z + self.layer_thickness, dtype=np.float32)
+        z = sublayers[:, None, None] + self.stencil[None, None, :, 2]
+        return np.broadcast_to(z, (self.layer_thickness, n_pixels, len(self.stencil))).ravel()
 
     def generate_layer(self, current_z, image_path):
         """
-        根据单张图片生成点云，增加点的密度，在 3x3x3 范围内生成。
+        根据单张图片生成点云，增加点的密度，在偏移模板范围内（默认 3x3x3）生成。
 
         :param current_z: 当前层的高度。
         :type current_z: int
@@ -39,35 +221,15 @@ class PointCloudBuilder:
         """
 
         try:
-            pixels = ImageProcessor.extract_pixel_colors(image_path)
-
-            # 定义 3x3x3 范围内的偏移
-            offsets = [-self.offset, 0.0, self.offset]
-
-            for pixel in pixels:
-                color = pixel[5]  # Hex颜色值
-                if ColorAnalyzer.is_nearly_white(color):
-                    continue  # 跳过接近白色的像素
-                if self.target is not None:
-                    if self.target == "matrix_flow":
-                        if ColorAnalyzer.is_color_in_range(color, "#0B00FB", 50):
-                            continue
-                    if self.target == "preferential_flow":
-                        if ColorAnalyzer.is_color_in_range(color, "#9CFF9B", 50):
-                            continue
-                        elif ColorAnalyzer.is_color_in_range(color, "#0FFDFE", 50):
-                            continue
-                # 提取 RGB 值
-                r = pixel[2]
-                g = pixel[3]
-                b = pixel[4]
-
-                # 在 3x3x3 的范围内生成点
-                for dx in offsets:
-                    for dy in offsets:
-                        for dz in offsets:
-                            self.points.append((pixel[0] + dx, pixel[1] + dy, current_z + dz))
-                            self.colors.append((r, g, b))
+            coords, colors = self.extract_layer_pixels(image_path)
+
+            n_points = len(coords) * len(self.stencil)
+            points = np.empty((n_points, 3), dtype=np.float32)
+            point_colors = np.empty((n_points, 3), dtype=np.uint8)
+            self.densify_layer(current_z, coords, colors, points, point_colors)
+
+            self.points = np.concatenate((self.points, points))
+            self.colors = np.concatenate((self.colors, point_colors))
 
         except Exception as e:
             logger.error(f"逐层建模时出现异常: {e}")
@@ -76,59 +238,175 @@ class PointCloudBuilder:
         """
         根据多张图片生成三维点云并返回。
 
-        :param image_paths: 图像路径列表。
-        :type image_paths: List[str]
+        先统计每层保留的像素数量，一次性分配全部点和颜色数组，再逐层写入，避免中间列表和拼接。
+
+        :param image_paths: 图像路径列表，或聚类得到的标签体。
+        :type image_paths: List[str] | LabelVolume
         :return: 返回生成的点云数据对象。
         :rtype: pv.PolyData
         """
 
         try:
+            if isinstance(image_paths, LabelVolume):
+                palette = image_paths.palette
+                layer_counts = [self.count_label_pixels(labels, palette) for labels in image_paths]
+
+                def layer_pixels(index):
+                    return self.extract_label_pixels(image_paths[index], palette)
+            else:
+                # 图片路径需要先读取才能知道像素数量，保留读取结果供第二遍使用
+                layers = []
+                for image_path in image_paths:
+                    try:
+                        layers.append(self.extract_layer_pixels(image_path))
+                    except Exception as e:
+                        logger.error(f"逐层建模时出现异常: {e}")
+                        layers.append((np.empty((0, 2), dtype=np.int32), np.empty((0, 3), dtype=np.uint8)))
+                layer_counts = [len(coords) for coords, _ in layers]
+
+                def layer_pixels(index):
+                    return layers[index]
+
+            # 一次性分配全部点和颜色数组
+            n_points = sum(layer_counts) * self.layer_thickness * len(self.stencil)
+            self.points = np.empty((n_points, 3), dtype=np.float32)
+            self.colors = np.empty((n_points, 3), dtype=np.uint8)
+            logger.info(f"预分配点云数组: {n_points} 个点，占用内存 {n_points * 15 / 1024 ** 2:.1f} MB")
+
             # 生成点云
-            for index, image_path in tqdm(
-                    enumerate(image_paths), desc="生成点云层", unit="层", total=len(image_paths), position=0
-            ):
-                logger.info(f"分层建模中,正在处理第 {index + 1}/{len(image_paths)} 层...")
+            cursor = 0
+            tracker = ProgressTracker("生成点云", len(layer_counts), "层", item_unit="点")
+            for index in tqdm(range(len(layer_counts)), desc="生成点云层", unit="层", position=0):
+                logger.info(f"分层建模中,正在处理第 {index + 1}/{len(layer_counts)} 层...")
                 # 计算当前层的高度坐标
                 current_z = index * self.layer_thickness
-                # 按照层厚度生成点云
+                # 每张图片只读取一次，再按照层厚度生成点云
+                coords, colors = layer_pixels(index)
+                layer_start = cursor
                 for i in range(current_z, current_z + self.layer_thickness):
-                    self.generate_layer(current_z=i, image_path=image_path)
-
-            # 转换点和颜色为 NumPy 数组
-            points_array = np.array(self.points)
-            colors_array = np.array(self.colors)
+                    cursor = self.densify_layer(i, coords, colors, self.points, self.colors, cursor)
+                self.track(tracker, items=cursor - layer_start)
 
-            # 确保颜色为浮点数并归一化
-            colors_array = np.clip(colors_array / 255.0, 0, 1)
+            # 颜色归一化为 0-1 的浮点数
+            normalized_colors = self.colors.astype(np.float32) / 255.0
 
             # 创建点云数据对象
-            point_cloud = pv.PolyData(points_array)
-            point_cloud["RGB"] = colors_array  # 添加 RGB 属性
+            point_cloud = pv.PolyData(self.points)
+            point_cloud["RGB"] = normalized_colors  # 添加 RGB 属性
 
             # 验证属性
             if "RGB" not in point_cloud.point_data.keys():
                 raise ValueError("点云对象中未找到 RGB 属性，请检查颜色数据处理流程。")
 
-            self.calculate_volume()
+            if isinstance(image_paths, LabelVolume):
+                self.calculate_label_volume(image_paths)
+            else:
+                self.calculate_volume()
             return point_cloud
 
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"创建点云时出现异常: {e}")
 
-    def calculate_volume(self):
+    def iter_point_chunks(self, image_paths, chunk_points=1 << 22):
+        """
+        逐层生成点云，以生成器的方式分块产出点和颜色，不在内存中保留已产出的点。
+
+        每块最多 chunk_points 个点；生成器耗尽后 volume_data 中为各颜色的体积。
+
+        :param image_paths: 图像路径列表，或聚类得到的标签体。
+        :type image_paths: List[str] | LabelVolume
+        :param chunk_points: 每块的最大点数。
+        :type chunk_points: int
+        :return: 依次产出 (points, colors)，分别为 (M, 3) 的 float32 坐标和 (M, 3) 的 uint8 颜色。
+        :rtype: Iterator[Tuple[np.ndarray, np.ndarray]]
+        """
+        palette = image_paths.palette if isinstance(image_paths, LabelVolume) else None
+        chunk_pixels = max(1, chunk_points // len(self.stencil))
+        pixel_counts = {}
+        tracker = ProgressTracker("流式生成点云", len(image_paths), "层", item_unit="点")
+
+        for index, layer in tqdm(
+                enumerate(image_paths), desc="流式生成点云层", unit="层", total=len(image_paths), position=0
+        ):
+            logger.info(f"分层建模中,正在处理第 {index + 1}/{len(image_paths)} 层...")
+            try:
+                if palette is not None:
+                    coords, colors = self.extract_label_pixels(layer, palette)
+                else:
+                    coords, colors = self.extract_layer_pixels(layer)
+            except Exception as e:
+                logger.error(f"逐层建模时出现异常: {e}")
+                self.track(tracker)
+                continue
+
+            # 按像素统计体积：每个像素在每个子层上对应一个体积单位（标签体在最后整体统计）
+            if palette is None:
+                packed_colors, counts = np.unique(ImageProcessor.pack_rgb(colors), return_counts=True)
+                for packed_color, count in zip(packed_colors.tolist(), counts.tolist()):
+                    pixel_counts[packed_color] = pixel_counts.get(packed_color, 0) + count * self.layer_thickness
+
+            current_z = index * self.layer_thickness
+            for i in range(current_z, current_z + self.layer_thickness):
+                for start in range(0, len(coords), chunk_pixels):
+                    block_coords = coords[start:start + chunk_pixels]
+                    n_points = len(block_coords) * len(self.stencil)
+                    points = np.empty((n_points, 3), dtype=np.float32)
+                    point_colors = np.empty((n_points, 3), dtype=np.uint8)
+                    self.densify_layer(i, block_coords, colors[start:start + chunk_pixels], points, point_colors)
+                    yield points, point_colors
+            self.track(tracker, items=len(coords) * len(self.stencil) * self.layer_thickness)
+
+        if palette is not None:
+            self.calculate_label_volume(image_paths)
+            return
+
+        self.volume_data = {
+            tuple(int(c) for c in ImageProcessor.unpack_rgb(packed_color)): float(count)
+            for packed_color, count in sorted(pixel_counts.items())
+        }
+        for color, volume in self.volume_data.items():
+            logger.info(f"颜色 {color} 的体积为 {volume:.2f} 立方米。")
+
+    def stream_point_cloud(self, image_paths, output_path, chunk_points=1 << 22):
+        """
+        流式生成点云并逐块追加写入 PLY 文件，峰值内存与切片数量无关。
+
+        :param image_paths: 图像路径列表，或聚类得到的标签体。
+        :type image_paths: List[str] | LabelVolume
+        :param output_path: 输出文件路径，后缀会被改为 .ply。
+        :type output_path: str
+        :param chunk_points: 每块的最大点数。
+        :type chunk_points: int
+        :return: 实际写入的文件路径。
+        :rtype: str
+        """
+        with PointCloudWriter(output_path) as writer:
+            for points, colors in self.iter_point_chunks(image_paths, chunk_points):
+                writer.write(points, colors)
+        return writer.output_path
+
+    def calculate_volume(self, colors_array=None):
         """
         统计相同颜色的点数，并计算每种颜色的体积。
 
-        每 27 个点视为一个 1x1x1 的立方米体积。
+        每个像素按偏移模板生成的一组点（默认 27 个）视为一个 1x1x1 的立方米体积。
+
+        :param colors_array: (N, 3) 的 uint8 点颜色数组，默认使用已生成的全部点颜色。
+        :type colors_array: np.ndarray
         """
-        # 统计每种颜色对应的点数
-        color_point_count = defaultdict(int)
+        if colors_array is None:
+            colors_array = self.colors
 
-        for color in self.colors:
-            color_point_count[color] += 1
+        # 统计每种颜色对应的点数
+        packed_colors, counts = np.unique(ImageProcessor.pack_rgb(colors_array), return_counts=True)
+        rgb_colors = ImageProcessor.unpack_rgb(packed_colors)
 
         # 计算每种颜色的体积
-        self.volume_data = {color: count / 27 for color, count in color_point_count.items()}
+        self.volume_data = {
+            tuple(int(c) for c in color): int(count) / len(self.stencil) for color, count in zip(rgb_colors, counts)
+        }
 
         # 打印结果
         for color, volume in self.volume_data.items():
@@ -136,4 +414,17 @@ class PointCloudBuilder:
 
         return self.volume_data
 
+    def calculate_label_volume(self, volume):
+        """
+        直接根据标签体统计每种颜色的体积，结果与 calculate_volume 相同，但不需要遍历生成的点。
+
+        :param volume: 聚类得到的标签体。
+        :type volume: LabelVolume
+        """
+        statistics = VolumeStatistics(volume, self.layer_thickness, target=self.target)
+        self.volume_data = statistics.class_volumes(key="rgb")
 
+        for color, color_volume in self.volume_data.items():
+            logger.info(f"颜色 {color} 的体积为 {color_volume:.2f} 立方米。")
+
+        return self.volume_data
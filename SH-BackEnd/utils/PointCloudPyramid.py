@@ -0,0 +1,232 @@
+import json
+import os
+
+import numpy as np
+import pyvista as pv
+
+from utils.ModelLoader import ModelLoader
+from utils.VtkStorage import VtkStorage
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PointCloudPyramid:
+    """
+    点云多分辨率金字塔：按体素网格逐级降采样，每级保存为一个压缩的 .vtp 文件，与模型放在同一文件夹，
+    清单文件 "<模型文件名>.lod.json" 记录各级文件相对模型文件名的后缀、点数和体素边长；
+    只记录后缀，模型和金字塔一起改名或从建模缓存复制到新的输出路径后清单仍然有效。
+
+    第 i 级（从 0 开始，由细到粗生成）的体素边长为 base_size * 2 ** i，每个体素只保留第一个点（颜色仍是调色板颜色）。
+    体素以像素中心对齐：坐标 c 落在编号 floor((c + 0.5) / size) 的体素中，与 CubeBuilder 的立方体一致。
+    清单中的级别按由粗到细排列，最后一级为完整模型；可视化时先显示最粗的一级，再按视距选择，见 select_level。
+    """
+
+    VERSION = 1
+    MANIFEST_SUFFIX = ".lod.json"
+
+    @staticmethod
+    def voxel_keys(points, voxel_size):
+        """
+        计算每个点所在体素的编号。
+
+        :param points: (N, 3) 的坐标数组。
+        :type points: np.ndarray
+        :param voxel_size: 体素边长。
+        :type voxel_size: float
+        :return: (N,) 的 int64 编号，同一体素中的点编号相同。
+        :rtype: np.ndarray
+        """
+        cells = np.floor((points + 0.5) / voxel_size).astype(np.int64)
+        cells -= cells.min(axis=0)
+        extent = cells.max(axis=0) + 1
+        return (cells[:, 0] * extent[1] + cells[:, 1]) * extent[2] + cells[:, 2]
+
+    @classmethod
+    def downsample(cls, points, colors, voxel_size):
+        """
+        体素网格降采样：每个体素保留第一个点，保留下来的点按原顺序排列。
+
+        :param points: (N, 3) 的坐标数组。
+        :param colors: (N, 3) 的 uint8 颜色数组。
+        :param voxel_size: 体素边长。
+        :type voxel_size: float
+        :return: (points, colors)。
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        if len(points) == 0:
+            return points, colors
+        _, first = np.unique(cls.voxel_keys(points, voxel_size), return_index=True)
+        first.sort()
+        return points[first], colors[first]
+
+    @classmethod
+    def build_levels(cls, chunks, levels=4, base_size=1.0, min_points=10_000):
+        """
+        生成各级降采样点云。
+
+        第 0 级先在每块内降采样，合并后再整体降采样一次，块边界上的重复点也会被合并，
+        内存占用只与单块和第 0 级的点数有关；之后每一级都由上一级降采样得到。
+
+        :param chunks: 依次产出 (points, colors) 的可迭代对象，例如整个点云或流式点云的各块。
+        :type chunks: Iterable[Tuple[np.ndarray, np.ndarray]]
+        :param levels: 最多生成的级数。
+        :type levels: int
+        :param base_size: 第 0 级的体素边长。
+        :type base_size: float
+        :param min_points: 某一级的点数少于该值时不再继续降采样。
+        :type min_points: int
+        :return: 由细到粗的 (体素边长, points, colors) 列表。
+        :rtype: List[Tuple[float, np.ndarray, np.ndarray]]
+        """
+        reduced = [cls.downsample(points, colors, base_size) for points, colors in chunks]
+        if not reduced:
+            return []
+        points = np.concatenate([points for points, _ in reduced])
+        colors = np.concatenate([colors for _, colors in reduced])
+        points, colors = cls.downsample(points, colors, base_size)
+
+        pyramid = [(base_size, points, colors)]
+        while len(pyramid) < levels and len(pyramid[-1][1]) >= min_points:
+            voxel_size = pyramid[-1][0] * 2
+            points, colors = cls.downsample(pyramid[-1][1], pyramid[-1][2], voxel_size)
+            if len(points) == len(pyramid[-1][1]):
+                break
+            pyramid.append((voxel_size, points, colors))
+        return pyramid
+
+    @staticmethod
+    def iter_model_chunks(model_path, chunk_points=1 << 22):
+        """
+        分块读取已保存的点云模型：流式点云 PLY 文件按块顺序读取，其他格式整体读取后作为一块。
+
+        :param model_path: 点云模型路径。
+        :type model_path: str
+        :return: 依次产出 (points, colors)，colors 为 uint8。
+        :rtype: Iterator[Tuple[np.ndarray, np.ndarray]]
+        """
+        loader = ModelLoader(model_path)
+        if model_path.lower().endswith(".ply") and loader.open():
+            for records in loader.iter_records(chunk_points):
+                points = np.stack((records["x"], records["y"], records["z"]), axis=1)
+                colors = np.stack((records["red"], records["green"], records["blue"]), axis=1)
+                yield points, colors
+            return
+        model = pv.read(model_path)
+        yield np.asarray(model.points, dtype=np.float32), VtkStorage.colors_uint8(model)
+
+    @classmethod
+    def manifest_path(cls, model_path):
+        """
+        :return: 模型对应的清单文件路径。
+        :rtype: str
+        """
+        base_name, _ = os.path.splitext(model_path)
+        return f"{base_name}{cls.MANIFEST_SUFFIX}"
+
+    @classmethod
+    def save(cls, model_path, point_cloud=None, levels=4, base_size=1.0, codec="zlib"):
+        """
+        为已保存的点云模型生成金字塔和清单文件。
+
+        :param model_path: 点云模型路径，各级文件保存为 "<模型文件名>_lod<i>.vtp"。
+        :type model_path: str
+        :param point_cloud: 内存中的点云（颜色数组 "RGB"），为 None 时从 model_path 分块读取。
+        :type point_cloud: pv.PolyData
+        :param levels: 最多生成的级数。
+        :param base_size: 第 0 级的体素边长。
+        :param codec: 各级文件的压缩方式，见 VtkStorage.CODECS。
+        :return: 清单文件和各级文件的路径。
+        :rtype: List[str]
+        """
+        if point_cloud is not None:
+            chunks = [(np.asarray(point_cloud.points), VtkStorage.colors_uint8(point_cloud))]
+        else:
+            chunks = cls.iter_model_chunks(model_path)
+        n_points = 0
+
+        def counted(chunks):
+            nonlocal n_points
+            for points, colors in chunks:
+                n_points += len(points)
+                yield points, colors
+
+        pyramid = cls.build_levels(counted(chunks), levels, base_size)
+
+        base_name, _ = os.path.splitext(model_path)
+        entries = []
+        file_paths = []
+        for index, (voxel_size, points, colors) in enumerate(pyramid):
+            level = pv.PolyData(points)
+            level["RGB"] = colors
+            level_path = VtkStorage.save(level, f"{base_name}_lod{index}", codec=codec)
+            file_paths.append(level_path)
+            entries.append({
+                "suffix": level_path[len(base_name):], "n_points": int(len(points)), "voxel_size": voxel_size,
+            })
+        entries.reverse()
+        entries.append({"suffix": model_path[len(base_name):], "n_points": int(n_points), "voxel_size": None})
+
+        manifest_path = cls.manifest_path(model_path)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"version": cls.VERSION, "levels": entries}, f, ensure_ascii=False, indent=2)
+        logger.info(f"点云金字塔已保存: {manifest_path}，各级点数 {[entry['n_points'] for entry in entries]}")
+        return [manifest_path] + file_paths
+
+    @classmethod
+    def level_path(cls, manifest_path, level):
+        """
+        :param manifest_path: 清单文件路径。
+        :type manifest_path: str
+        :param level: 清单中的一级。
+        :type level: dict
+        :return: 该级文件的路径。
+        :rtype: str
+        """
+        return f"{manifest_path[:-len(cls.MANIFEST_SUFFIX)]}{level['suffix']}"
+
+    @classmethod
+    def load_manifest(cls, model_path):
+        """
+        读取模型对应的清单。
+
+        :param model_path: 点云模型路径或清单文件路径。
+        :type model_path: str
+        :return: 清单；没有清单或版本不同时返回 None。
+        :rtype: dict
+        """
+        manifest_path = model_path if model_path.endswith(cls.MANIFEST_SUFFIX) else cls.manifest_path(model_path)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return manifest if manifest.get("version") == cls.VERSION else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取点云金字塔清单异常: {e}")
+            return None
+
+    @staticmethod
+    def select_level(levels, distance, view_angle=30.0, viewport=1000, pixel_tolerance=2.0):
+        """
+        按视距选择级别：体素边长在屏幕上不超过 pixel_tolerance 个像素的最粗一级，都超过时选择完整模型（最后一级）。
+
+        :param levels: 清单中由粗到细排列的级别。
+        :type levels: List[dict]
+        :param distance: 相机到模型的距离。
+        :type distance: float
+        :param view_angle: 相机的竖直视角（度）。
+        :type view_angle: float
+        :param viewport: 视口的像素高度。
+        :type viewport: int
+        :param pixel_tolerance: 允许的体素屏幕尺寸（像素）。
+        :type pixel_tolerance: float
+        :return: 选中级别的下标。
+        :rtype: int
+        """
+        # 距离 distance 处一个像素对应的长度
+        pixel_size = 2 * max(distance, 1e-6) * np.tan(np.radians(view_angle) / 2) / max(viewport, 1)
+        for index, level in enumerate(levels):
+            if level["voxel_size"] is not None and level["voxel_size"] <= pixel_tolerance * pixel_size:
+                return index
+        return len(levels) - 1
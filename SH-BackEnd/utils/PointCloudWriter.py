@@ -0,0 +1,166 @@
+import os
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PointCloudWriter:
+    """
+    流式点云写入类，将点和颜色分块追加写入二进制 PLY 文件，内存占用只与单块大小有关。
+
+    文件头中的点数先用定长占位，关闭文件时再回填实际点数，因此无需预先知道总点数。
+    以追加模式打开本类写出的文件时，可以在末尾继续写入点，只需回填新的点数。
+    """
+
+    # 每个点的记录格式：float32 坐标 + uint8 颜色，共 15 字节
+    VERTEX_DTYPE = np.dtype([
+        ("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+        ("red", "u1"), ("green", "u1"), ("blue", "u1"),
+    ])
+
+    # 点数占位宽度，足够容纳 uint64 的最大值
+    COUNT_WIDTH = 20
+
+    # 文件头中的属性声明，读取已有文件时用于校验格式
+    PROPERTIES = (
+        b"property float x", b"property float y", b"property float z",
+        b"property uchar red", b"property uchar green", b"property uchar blue",
+    )
+
+    def __init__(self, output_path, append=False):
+        """
+        :param output_path: 输出文件路径，后缀会被改为 .ply。
+        :type output_path: str
+        :param append: 是否在已有文件的末尾追加，文件必须由本类写出。
+        :type append: bool
+        """
+        base_name, _ = os.path.splitext(output_path)
+        self.output_path = f"{base_name}.ply"
+        self.append = append
+        self.n_points = 0
+        self._file = None
+        self._count_offset = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _header(self, n_points):
+        return (
+            "ply\n"
+            "format binary_little_endian 1.0\n"
+            "comment SoilHydro3D streaming point cloud\n"
+            f"element vertex {n_points:0{self.COUNT_WIDTH}d}\n"
+            "property float x\n"
+            "property float y\n"
+            "property float z\n"
+            "property uchar red\n"
+            "property uchar green\n"
+            "property uchar blue\n"
+            "end_header\n"
+        ).encode("ascii")
+
+    @classmethod
+    def read_header(cls, file):
+        """
+        读取并校验本类写出的 PLY 文件头。
+
+        :param file: 以二进制模式打开的文件对象，读取后位于文件头末尾。
+        :return: (点数, 点数字段的偏移, 数据区的偏移)。
+        :rtype: Tuple[int, int, int]
+        :raises ValueError: 如果文件不是本类写出的格式。
+        """
+        file.seek(0)
+        lines = []
+        while True:
+            line = file.readline()
+            if not line or len(lines) > 32:
+                raise ValueError("不是有效的 PLY 文件")
+            lines.append(line)
+            if line == b"end_header\n":
+                break
+
+        header = b"".join(lines)
+        properties = tuple(line.rstrip(b"\n") for line in lines if line.startswith(b"property"))
+        if lines[0] != b"ply\n" or b"format binary_little_endian 1.0\n" not in lines or properties != cls.PROPERTIES:
+            raise ValueError("PLY 文件格式与点云写入类不一致")
+
+        count_offset = header.index(b"element vertex ") + len(b"element vertex ")
+        count_end = header.index(b"\n", count_offset)
+        if count_end - count_offset != cls.COUNT_WIDTH:
+            raise ValueError("PLY 文件的点数字段不是定长格式")
+        return int(header[count_offset:count_end]), count_offset, len(header)
+
+    @classmethod
+    def load(cls, ply_path):
+        """
+        以内存映射方式读取本类写出的 PLY 文件，不把全部点读入内存。
+
+        :param ply_path: PLY 文件路径。
+        :type ply_path: str
+        :return: 字段为 VERTEX_DTYPE 的只读记录数组。
+        :rtype: np.memmap
+        """
+        with open(ply_path, "rb") as f:
+            n_points, _, data_offset = cls.read_header(f)
+        if n_points == 0:
+            return np.empty(0, dtype=cls.VERTEX_DTYPE)
+        return np.memmap(ply_path, dtype=cls.VERTEX_DTYPE, mode="r", offset=data_offset, shape=(n_points,))
+
+    def open(self):
+        """
+        创建输出文件并写入文件头；追加模式下打开已有文件并定位到末尾。
+        """
+        if self.append:
+            self._file = open(self.output_path, "r+b")
+            self.n_points, self._count_offset, _ = self.read_header(self._file)
+            self._file.seek(0, os.SEEK_END)
+            return
+
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        self._file = open(self.output_path, "wb")
+        header = self._header(0)
+        self._count_offset = header.index(b"element vertex ") + len(b"element vertex ")
+        self._file.write(header)
+        self.n_points = 0
+
+    def write(self, points, colors):
+        """
+        追加写入一块点。
+
+        :param points: (N, 3) 的点坐标数组。
+        :type points: np.ndarray
+        :param colors: (N, 3) 的 uint8 RGB 颜色数组。
+        :type colors: np.ndarray
+        """
+        if self._file is None:
+            raise RuntimeError("点云文件尚未打开")
+        if len(points) != len(colors):
+            raise ValueError(f"点数与颜色数不一致: {len(points)} != {len(colors)}")
+        if len(points) == 0:
+            return
+
+        records = np.empty(len(points), dtype=self.VERTEX_DTYPE)
+        records["x"], records["y"], records["z"] = points[:, 0], points[:, 1], points[:, 2]
+        records["red"], records["green"], records["blue"] = colors[:, 0], colors[:, 1], colors[:, 2]
+        records.tofile(self._file)
+        self.n_points += len(points)
+
+    def close(self):
+        """
+        回填文件头中的点数并关闭文件。
+        """
+        if self._file is None:
+            return
+        self._file.seek(self._count_offset)
+        self._file.write(f"{self.n_points:0{self.COUNT_WIDTH}d}".encode("ascii"))
+        self._file.close()
+        self._file = None
+        logger.info(f"点云已流式保存为 PLY 格式: {self.output_path}（{self.n_points} 个点）")
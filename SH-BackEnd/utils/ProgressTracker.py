@@ -0,0 +1,113 @@
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressTracker:
+    """
+    单个阶段（预处理、生成点云、生成表面等）的进度跟踪类：记录已完成的数量，计算吞吐量和剩余时间。
+
+    吞吐量和剩余时间按阶段开始以来的平均速度计算；除数量外还可以累计处理的元素数（例如点数、面数），
+    得到第二个吞吐量（点/秒）。update 返回是否到了发布的时间，调用方据此限制事件频率。
+    """
+
+    def __init__(self, stage, total, unit="层", item_unit=None, min_interval=0.2):
+        """
+        :param stage: 阶段名称。
+        :type stage: str
+        :param total: 总数量。
+        :type total: int
+        :param unit: 数量的单位，例如 "层"、"张"、"块"。
+        :type unit: str
+        :param item_unit: 累计元素的单位，例如 "点"、"面"；为 None 时不统计元素吞吐量。
+        :type item_unit: str
+        :param min_interval: 两次发布之间的最短间隔（秒），阶段完成时总会发布。
+        :type min_interval: float
+        """
+        self.stage = stage
+        self.total = max(0, int(total))
+        self.unit = unit
+        self.item_unit = item_unit
+        self.min_interval = min_interval
+        self.done = 0
+        self.items = 0
+        self.started = time.perf_counter()
+        self._published = None
+
+    @property
+    def elapsed(self):
+        """
+        阶段开始以来的时间（秒）。
+
+        :rtype: float
+        """
+        return time.perf_counter() - self.started
+
+    @property
+    def finished(self):
+        """
+        :rtype: bool
+        """
+        return self.done >= self.total
+
+    def update(self, done=None, items=0):
+        """
+        更新进度。
+
+        :param done: 已完成的数量，为 None 时在当前数量上加 1。
+        :type done: int
+        :param items: 本次新处理的元素数量。
+        :type items: int
+        :return: 是否应当发布本次进度：距离上次发布超过 min_interval，或者阶段已完成。
+        :rtype: bool
+        """
+        self.done = min(self.total, self.done + 1 if done is None else int(done))
+        self.items += int(items)
+        now = time.perf_counter()
+        if self.finished or self._published is None or now - self._published >= self.min_interval:
+            self._published = now
+            return True
+        return False
+
+    def snapshot(self):
+        """
+        当前进度，可以直接序列化为 JSON。
+
+        :return: 包含 stage、done、total、unit、fraction、elapsed、rate（单位/秒）、eta（秒，无法估计时为 None），
+                 统计元素时另有 items、item_unit、item_rate（元素/秒）。
+        :rtype: dict
+        """
+        elapsed = self.elapsed
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        snapshot = {
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "unit": self.unit,
+            "fraction": self.done / self.total if self.total else 1.0,
+            "elapsed": round(elapsed, 3),
+            "rate": round(rate, 3),
+            "eta": round((self.total - self.done) / rate, 1) if rate > 0 else None,
+        }
+        if self.item_unit is not None:
+            snapshot.update(
+                items=self.items, item_unit=self.item_unit,
+                item_rate=round(self.items / elapsed, 1) if elapsed > 0 else 0.0,
+            )
+        return snapshot
+
+    def describe(self):
+        """
+        进度的文字说明，例如 "生成点云 12/120 层（3.5 层/s，2.1e+06 点/s，剩余 31 秒）"。
+
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        details = [f"{snapshot['rate']:.1f} {self.unit}/s"]
+        if self.item_unit is not None:
+            details.append(f"{snapshot['item_rate']:.3g} {self.item_unit}/s")
+        if snapshot["eta"] is not None and not self.finished:
+            details.append(f"剩余 {snapshot['eta']:.0f} 秒")
+        return f"{self.stage} {self.done}/{self.total} {self.unit}（{'，'.join(details)}）"
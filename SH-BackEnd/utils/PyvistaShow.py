@@ -1,4 +1,7 @@
+import numpy as np
 import pyvista as pv
+from utils.ModelLoader import ModelLoader
+from utils.PointCloudPyramid import PointCloudPyramid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,28 +13,110 @@ class PyvistaShow:
         :param window_title: 窗口标题
         """
         self.plotter = pv.Plotter(title=window_title)
+        self.timings = {}  # 最近一次加载各步骤的耗时（秒），见 ModelLoader.timings
+
+    def show_progressive(self, file_path, **mesh_kwargs):
+        """
+        显示模型：可以内存映射的文件（流式点云 PLY、标签体）先显示降采样的预览，窗口保持响应，
+        完整数据分块载入后替换预览；其他文件整体读取后显示。
+
+        :param file_path: 模型文件路径。
+        :param mesh_kwargs: 传给 plotter.add_mesh 的显示参数。
+        """
+        loader = ModelLoader(file_path)
+        self.timings = loader.timings
+        preview = loader.preview()
+        if preview is None:
+            self.plotter.add_mesh(loader.load(), **mesh_kwargs)
+            self.plotter.show()
+            return
+
+        actor = self.plotter.add_mesh(preview, **mesh_kwargs)
+        self.plotter.show(interactive_update=True, auto_close=False)
+
+        def refresh(done, total):
+            # 窗口在载入过程中被关闭时停止载入
+            if self.plotter.render_window is None:
+                raise InterruptedError("窗口已关闭")
+            self.plotter.update(force_redraw=False)
+
+        try:
+            model = loader.load(progress=refresh)
+        except InterruptedError:
+            logger.info("窗口已关闭，停止载入完整模型")
+            return
+        if self.plotter.render_window is None:
+            return
+        self.plotter.remove_actor(actor)
+        self.plotter.add_mesh(model, **mesh_kwargs)
+        self.plotter.render()
+        logger.info(f"完整模型已替换预览，加载耗时: {self.timings}")
+        if self.plotter.iren is not None:
+            self.plotter.iren.start()
+
+    def show_lod(self, manifest_path, pixel_tolerance=2.0, **mesh_kwargs):
+        """
+        按多分辨率金字塔显示点云：先显示最粗的一级，相机每次变化后按相机到模型中心的距离选择级别
+        （见 PointCloudPyramid.select_level），只有级别变化时才替换显示的点云；已读取的级别保留在内存中，来回缩放时不重复读取。
+
+        :param manifest_path: 金字塔清单文件路径。
+        :param pixel_tolerance: 允许的体素屏幕尺寸（像素），越大越早切换到较粗的级别。
+        :param mesh_kwargs: 传给 plotter.add_mesh 的显示参数。
+        """
+        levels = PointCloudPyramid.load_manifest(manifest_path)["levels"]
+        loaded = {}
+        shown = {"index": None, "actor": None}
+
+        def show_level(index):
+            if index == shown["index"]:
+                return
+            if index not in loaded:
+                loader = ModelLoader(PointCloudPyramid.level_path(manifest_path, levels[index]))
+                loaded[index] = loader.load()
+                self.timings[f"level_{index}"] = loader.timings["load"]
+                logger.info(f"已读取点云第 {index} 级（{levels[index]['n_points']} 个点）")
+            if shown["actor"] is not None:
+                self.plotter.remove_actor(shown["actor"], render=False)
+            shown["actor"] = self.plotter.add_mesh(loaded[index], reset_camera=False, render=False, **mesh_kwargs)
+            shown["index"] = index
+
+        def on_camera_modified(camera, event):
+            center = np.asarray(loaded[shown["index"]].center)
+            distance = float(np.linalg.norm(np.asarray(camera.GetPosition()) - center))
+            show_level(PointCloudPyramid.select_level(
+                levels, distance, camera.GetViewAngle(), self.plotter.window_size[1], pixel_tolerance
+            ))
+
+        self.timings = {}
+        show_level(0)
+        self.plotter.reset_camera()
+        on_camera_modified(self.plotter.camera, None)
+        self.plotter.camera.AddObserver("ModifiedEvent", on_camera_modified)
+        self.plotter.show()
 
     def show_point_cloud(self, file_name, point_size=5):
         """
-        读取 VTK 或 VTP 文件并显示点云。
+        读取 VTK、VTP 或 PLY 文件并显示点云；模型旁边有多分辨率金字塔时按视距选择级别显示，
+        否则流式保存的 PLY 文件先显示预览。
 
-        :param file_name: VTK 或 VTP 文件的路径。
+        :param file_name: VTK、VTP 或 PLY 文件的路径。
         :param point_size: 点的大小，用于控制点在显示窗口中的可视化效果。
         """
         try:
-            # 读取 VTK 或 VTP 文件
-            point_cloud = pv.read(file_name)
-
-            # 可视化点云
-            self.plotter.add_mesh(
-                point_cloud,
+            mesh_kwargs = dict(
                 scalars="RGB",  # 假设点云或网格中有 RGB 属性
                 rgb=True,  # 使用 RGB 颜色渲染
                 point_size=point_size,  # 设置点大小
                 render_points_as_spheres=True,
             )
+            # 可视化点云
+            manifest_path = PointCloudPyramid.manifest_path(file_name)
+            if PointCloudPyramid.load_manifest(manifest_path) is not None:
+                # 体素在屏幕上不大于一个点时，每个体素显示一个点与完整模型看起来相同
+                self.show_lod(manifest_path, pixel_tolerance=point_size, **mesh_kwargs)
+            else:
+                self.show_progressive(file_name, **mesh_kwargs)
             logger.info(f"点云已加载")
-            self.plotter.show()
 
         except Exception as e:
             logger.info(f"读取或显示点云时出错: {e}")
@@ -44,7 +129,9 @@ class PyvistaShow:
 
         try:
             # 加载 VTK 文件
-            mesh = pv.read(file_path)
+            loader = ModelLoader(file_path)
+            self.timings = loader.timings
+            mesh = loader.load()
 
             # 检查是否包含 RGB 颜色
             if "RGB" in mesh.point_data:  # 假设颜色存储在点数据中，字段名为 'RGB'
@@ -58,3 +145,17 @@ class PyvistaShow:
 
         except Exception as e:
             logger.error(f"读取或显示立方体时出错: {e}")
+
+    def show_volume(self, file_path):
+        """
+        读取标签体文件（.npz 或 .vti），在内存中生成立方体表面并显示，不需要事先保存模型文件；
+        体素较多时先显示降采样标签体的表面。
+
+        :param file_path: 标签体文件路径。
+        """
+        try:
+            self.show_progressive(file_path, scalars="RGB", rgb=True)
+            logger.info(f"标签体已加载")
+
+        except Exception as e:
+            logger.error(f"读取或显示标签体时出错: {e}")
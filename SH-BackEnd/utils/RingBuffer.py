@@ -0,0 +1,87 @@
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    线程安全的定长环形缓冲区，每个元素带有从 1 开始连续递增的序号。
+
+    读取方保存上次读到的序号（游标），每次只取游标之后的新元素，读取开销只与新元素数量有关，
+    与累计写入的总数无关；超出容量的旧元素被覆盖，读取方落后太多时会跳过被覆盖的部分。
+    wait 可以阻塞等待新元素，用于长轮询和 Server-Sent Events。
+    """
+
+    def __init__(self, capacity=1000):
+        """
+        :param capacity: 最多保留的元素数量。
+        :type capacity: int
+        """
+        if capacity <= 0:
+            raise ValueError(f"环形缓冲区容量必须大于 0: {capacity}")
+        self.capacity = int(capacity)
+        self._items = [None] * self.capacity
+        self._next_seq = 1  # 下一个写入元素的序号
+        self._condition = threading.Condition()
+
+    @property
+    def cursor(self):
+        """
+        最新元素的序号，缓冲区为空时为 0。
+
+        :rtype: int
+        """
+        with self._condition:
+            return self._next_seq - 1
+
+    def append(self, item):
+        """
+        写入一个元素并唤醒等待中的读取方。
+
+        :return: 该元素的序号。
+        :rtype: int
+        """
+        with self._condition:
+            seq = self._next_seq
+            self._items[seq % self.capacity] = item
+            self._next_seq += 1
+            self._condition.notify_all()
+        return seq
+
+    def since(self, cursor=0, limit=None):
+        """
+        读取序号大于 cursor 的元素。
+
+        :param cursor: 上次读到的序号，0 表示从缓冲区中最旧的元素开始。
+        :type cursor: int
+        :param limit: 最多返回的元素数量，None 表示不限制。
+        :type limit: int
+        :return: (元素列表, 新游标, 被覆盖而跳过的元素数量)；新游标为最后一个返回元素的序号。
+        :rtype: Tuple[list, int, int]
+        """
+        with self._condition:
+            oldest = max(1, self._next_seq - self.capacity)
+            start = max(int(cursor) + 1, oldest)
+            # 游标超过最新序号（例如服务重启后沿用旧游标）时从头读取
+            if start > self._next_seq:
+                start = oldest
+            end = self._next_seq if limit is None else min(self._next_seq, start + max(0, int(limit)))
+            items = [self._items[seq % self.capacity] for seq in range(start, end)]
+            dropped = max(0, start - int(cursor) - 1)
+            return items, end - 1 if items else max(start - 1, 0), dropped
+
+    def wait(self, cursor=0, timeout=None):
+        """
+        等待序号大于 cursor 的新元素。
+
+        :param cursor: 上次读到的序号。
+        :type cursor: int
+        :param timeout: 最长等待时间（秒），None 表示一直等待。
+        :type timeout: float
+        :return: 是否有新元素；cursor 超过最新序号（游标来自服务重启之前）时立即返回 True，由 since 从头读取。
+        :rtype: bool
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._next_seq - 1 != int(cursor), timeout)
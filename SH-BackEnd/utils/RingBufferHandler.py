@@ -0,0 +1,64 @@
+import logging
+import uuid
+
+from utils.RingBuffer import RingBuffer
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    把日志记录保存在内存环形缓冲区中的日志处理器，供 /get_logs 按游标增量读取。
+
+    只保留最近 capacity 条日志，读取开销只与新日志的数量有关，与日志文件大小无关。
+    session 在每次启动时重新生成，前端发现 session 变化（后端已重启）时应从头读取。
+    """
+
+    def __init__(self, capacity=5000, level=logging.NOTSET):
+        """
+        :param capacity: 保留的日志条数。
+        :type capacity: int
+        :param level: 处理器的最低日志级别。
+        :type level: int
+        """
+        super().__init__(level)
+        self.buffer = RingBuffer(capacity)
+        self.session = uuid.uuid4().hex
+
+    def emit(self, record):
+        try:
+            self.buffer.append((record.levelno, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+    @staticmethod
+    def parse_level(level):
+        """
+        将级别名称（"INFO"、"warning" 等）或数字转换为日志级别数值。
+
+        :rtype: int
+        :raises ValueError: 如果级别名称未知。
+        """
+        if level is None or level == "":
+            return logging.NOTSET
+        if isinstance(level, int) or str(level).isdigit():
+            return int(level)
+        levelno = logging.getLevelName(str(level).upper())
+        if not isinstance(levelno, int):
+            raise ValueError(f"未知的日志级别: {level}")
+        return levelno
+
+    def lines(self, since=0, level=None, limit=None):
+        """
+        读取游标 since 之后的日志。
+
+        :param since: 上次读到的游标，0 表示从缓冲区中最旧的日志开始。
+        :type since: int
+        :param level: 最低日志级别，名称或数值，为 None 时返回全部级别。
+        :type level: str | int
+        :param limit: 最多读取的日志条数（过滤之前）。
+        :type limit: int
+        :return: (格式化后的日志行列表, 新游标, 被覆盖而跳过的日志条数)。
+        :rtype: Tuple[List[str], int, int]
+        """
+        levelno = self.parse_level(level)
+        records, cursor, dropped = self.buffer.since(since, limit)
+        return [line for record_level, line in records if record_level >= levelno], cursor, dropped
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+import uuid
+
+import numpy as np
+from utils import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SliceCache:
+    """
+    预处理切片的磁盘缓存，按内容寻址：每张切片聚类后的 uint8 类别编号数组保存为一个 .npy 文件，
+    文件名由源图片内容的哈希、调色板和预处理参数共同决定。
+
+    源图片内容不变时，即使换了 layer_thickness、target 等建模参数也能直接命中；图片被修改后哈希随之变化，
+    旧条目不会再被读取，最终被淘汰。缓存总大小超过 max_bytes 时按最近使用时间（文件 mtime）淘汰最旧的条目。
+    """
+
+    DEFAULT_FOLDER = os.path.join(config.CACHE_ROOT, "slices")
+
+    # 进程内的文件哈希记录：(路径, 大小, 修改时间) -> 内容哈希，避免同一进程重复读取未修改的图片
+    _hash_memo = {}
+    _hash_lock = threading.Lock()
+
+    def __init__(self, cache_folder=None, max_bytes=2 << 30):
+        """
+        :param cache_folder: 缓存文件夹，默认为 DEFAULT_FOLDER。
+        :type cache_folder: str
+        :param max_bytes: 缓存总大小上限（字节），默认为 2 GB。
+        :type max_bytes: int
+        """
+        self.cache_folder = cache_folder or self.DEFAULT_FOLDER
+        self.max_bytes = int(max_bytes)
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    @classmethod
+    def file_hash(cls, file_path, block_size=1 << 20):
+        """
+        计算文件内容的哈希值。
+
+        :param file_path: 文件路径。
+        :type file_path: str
+        :return: 十六进制哈希字符串。
+        :rtype: str
+        """
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with cls._hash_lock:
+            digest = cls._hash_memo.get(memo_key)
+        if digest is not None:
+            return digest
+
+        hasher = hashlib.blake2b(digest_size=20)
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+
+        with cls._hash_lock:
+            cls._hash_memo[memo_key] = digest
+        return digest
+
+    @classmethod
+    def key(cls, image_path, palette, params=()):
+        """
+        计算切片的缓存键。
+
+        :param image_path: 源图片路径。
+        :type image_path: str
+        :param palette: 聚类使用的调色板。
+        :type palette: Palette
+        :param params: 其他会影响预处理结果的参数，例如 (距离度量, 顶部类别编号, 顶部行数)。
+        :type params: tuple
+        :return: 十六进制缓存键。
+        :rtype: str
+        """
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(cls.file_hash(image_path).encode("ascii"))
+        hasher.update(repr((palette.key(), tuple(params))).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_folder, f"{key}.npy")
+
+    def get(self, key):
+        """
+        读取缓存的类别编号数组，并刷新其最近使用时间。
+
+        :param key: 缓存键。
+        :type key: str
+        :return: 类别编号数组；未命中或文件损坏时返回 None。
+        :rtype: np.ndarray
+        """
+        entry_path = self._entry_path(key)
+        try:
+            labels = np.load(entry_path, allow_pickle=False)
+            os.utime(entry_path)
+            return labels
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取切片缓存异常: {e}")
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key, labels):
+        """
+        写入一张切片的类别编号数组。先写入临时文件再重命名，并发写入同一条目时也不会读到不完整的文件。
+
+        写入后不会立即淘汰，批量写入完成后调用 evict。
+
+        :param key: 缓存键。
+        :type key: str
+        :param labels: 类别编号数组。
+        :type labels: np.ndarray
+        """
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(labels), allow_pickle=False)
+            os.replace(temp_path, entry_path)
+        except Exception as e:
+            logger.error(f"写入切片缓存异常: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def entries(self):
+        """
+        列出全部缓存条目。
+
+        :return: (路径, 大小, 最近使用时间) 列表，按最近使用时间从旧到新排序。
+        :rtype: List[Tuple[str, int, float]]
+        """
+        entries = []
+        with os.scandir(self.cache_folder) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".npy"):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda item: item[2])
+        return entries
+
+    def size(self):
+        """
+        :return: 缓存总大小（字节）。
+        :rtype: int
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        """
+        按最近使用时间淘汰最旧的条目，直到缓存总大小不超过上限。
+
+        :param max_bytes: 大小上限，默认为 self.max_bytes。
+        :type max_bytes: int
+        :return: 删除的条目数量。
+        :rtype: int
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for entry_path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                logger.error(f"删除切片缓存异常: {e}")
+        if removed:
+            logger.info(f"切片缓存已淘汰 {removed} 个条目，当前大小 {total / 1024 ** 2:.1f} MB")
+        return removed
+
+    def clear(self):
+        """
+        删除全部缓存条目。
+
+        :return: 删除的条目数量。
+        :rtype: int
+        """
+        return self.evict(max_bytes=0)
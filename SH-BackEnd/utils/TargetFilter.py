@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from utils.ColorAnalyzer import ColorAnalyzer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TargetFilter:
+    """
+    目标流过滤类，将 target 设置（"matrix_flow"、"preferential_flow" 等）编译为颜色保留表，供两种建模类共用。
+
+    过滤规则：接近白色的颜色始终剔除；target 对应的每个 (颜色, 容差) 范围内的颜色也剔除。
+    规则只在编译时计算一次，之后对整层或整个标签体都只需一次数组索引：
+    - palette_mask：按调色板类别编号索引的保留表；
+    - color_lut：覆盖全部 256³ 种颜色的保留表，用于未聚类的原始图片。
+    """
+
+    # target -> 需要剔除的 (颜色, 容差) 列表；未登记的 target（例如 "1"）不额外剔除任何颜色
+    TARGETS = {
+        "matrix_flow": (("#0B00FB", 50),),
+        "preferential_flow": (("#9CFF9B", 50), ("#0FFDFE", 50)),
+    }
+
+    # 全颜色空间保留表的缓存，键为过滤规则
+    _lut_cache = OrderedDict()
+    _lut_cache_size = 4
+    _lut_lock = threading.Lock()
+
+    def __init__(self, target=None, white_threshold=200):
+        """
+        :param target: 保留模式，见 TARGETS；为 None 或未登记时只剔除接近白色的颜色。
+        :type target: str
+        :param white_threshold: 白色判断阈值，RGB 三个分量都大于该值时视为白色。
+        :type white_threshold: int
+        """
+        self.target = target
+        self.white_threshold = white_threshold
+        self.excluded = tuple(
+            (ColorAnalyzer.hex_to_rgb(color), tolerance) for color, tolerance in self.TARGETS.get(target, ())
+        )
+        self._palette_masks = {}
+
+    @classmethod
+    def register(cls, target, excluded_colors):
+        """
+        登记新的保留模式。
+
+        :param target: 保留模式名称。
+        :type target: str
+        :param excluded_colors: 需要剔除的 (十六进制颜色, 容差) 列表。
+        :type excluded_colors: list[Tuple[str, int]]
+        """
+        for color, _ in excluded_colors:
+            ColorAnalyzer.hex_to_rgb(color)  # 提前检查颜色格式
+        cls.TARGETS[target] = tuple((color, int(tolerance)) for color, tolerance in excluded_colors)
+
+    def key(self):
+        """
+        返回可哈希的过滤规则标识，用于缓存。
+
+        :rtype: tuple
+        """
+        return self.white_threshold, self.excluded
+
+    def keep_rgb(self, rgb):
+        """
+        判断一组颜色是否需要保留。
+
+        :param rgb: 形状为 (..., 3) 的 RGB 数组。
+        :type rgb: np.ndarray
+        :return: 形状为 rgb.shape[:-1] 的布尔数组。
+        :rtype: np.ndarray
+        """
+        rgb = np.asarray(rgb, dtype=np.int16)
+        keep = ~ColorAnalyzer.nearly_white_mask(rgb, self.white_threshold)
+        for target_rgb, tolerance in self.excluded:
+            keep &= ~ColorAnalyzer.in_range_mask(rgb, target_rgb, tolerance)
+        return keep
+
+    def keep_color(self, hex_color):
+        """
+        判断单个十六进制颜色是否需要保留。
+
+        :param hex_color: 十六进制颜色字符串，例如 "#0B00FB"。
+        :type hex_color: str
+        :rtype: bool
+        """
+        return bool(self.keep_rgb(ColorAnalyzer.hex_to_rgb(hex_color)))
+
+    def palette_mask(self, palette):
+        """
+        编译调色板的保留表。
+
+        :param palette: 调色板。
+        :type palette: Palette
+        :return: 长度为 len(palette) 的布尔数组，下标为类别编号。
+        :rtype: np.ndarray
+        """
+        key = palette.key()
+        if key not in self._palette_masks:
+            self._palette_masks[key] = self.keep_rgb(palette.rgb)
+        return self._palette_masks[key]
+
+    def label_mask(self, labels, palette):
+        """
+        :param labels: 任意形状的 uint8 类别编号数组。
+        :param palette: 类别编号对应的调色板。
+        :return: 与 labels 形状相同的布尔保留掩码。
+        :rtype: np.ndarray
+        """
+        return self.palette_mask(palette)[labels]
+
+    def color_lut(self, chunk_size=1 << 20):
+        """
+        编译覆盖全部 256³ 种颜色的保留表，按过滤规则缓存。
+
+        :return: 长度为 2^24 的布尔数组，下标为 0xRRGGBB 打包颜色。
+        :rtype: np.ndarray
+        """
+        key = self.key()
+        with self._lut_lock:
+            lut = self._lut_cache.get(key)
+            if lut is not None:
+                self._lut_cache.move_to_end(key)
+                return lut
+
+            lut = np.empty(1 << 24, dtype=bool)
+            for start in range(0, len(lut), chunk_size):
+                packed = np.arange(start, min(start + chunk_size, len(lut)), dtype=np.uint32)
+                colors = np.stack(((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF), axis=1)
+                lut[start:start + len(packed)] = self.keep_rgb(colors)
+            lut.flags.writeable = False
+
+            self._lut_cache[key] = lut
+            while len(self._lut_cache) > self._lut_cache_size:
+                self._lut_cache.popitem(last=False)
+            return lut
+
+    def rgb_mask(self, rgb):
+        """
+        通过全颜色空间保留表，计算原始 RGB 图像（或像素数组）的保留掩码。
+
+        :param rgb: 形状为 (..., 3) 的 uint8 RGB 数组。
+        :type rgb: np.ndarray
+        :return: 形状为 rgb.shape[:-1] 的布尔数组。
+        :rtype: np.ndarray
+        """
+        rgb = np.asarray(rgb, dtype=np.uint32)
+        return self.color_lut()[(rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]]
@@ -0,0 +1,240 @@
+import json
+import os
+
+import numpy as np
+from utils.TargetFilter import TargetFilter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VolumeStatistics:
+    """
+    体积统计类，直接在标签体上用 bincount 统计每个颜色类别的体积以及沿深度方向的分布。
+
+    标签体的维度为 (层, x, y)：层方向对应建模时的 z 轴；图片的行（x）方向为深度方向，
+    第 0 行为土壤表面（预处理时最上面两行被替换为基质流颜色）。统计只遍历标签体一次，
+    结果全部为数组，可以直接转换为 JSON 供前端读取，不需要重新建模。
+    """
+
+    def __init__(self, volume, layer_thickness=1, side_length=1, target=None):
+        """
+        :param volume: 聚类得到的标签体。
+        :type volume: LabelVolume
+        :param layer_thickness: 每层切片的厚度，与建模时一致。
+        :type layer_thickness: int
+        :param side_length: 像素在 x、y 方向的边长。
+        :type side_length: float
+        :param target: 保留模式，见 TargetFilter；只影响 kept 标记和总体积，各类别仍全部统计。
+        :type target: str
+        """
+        self.palette = volume.palette
+        self.shape = volume.shape
+        self.layer_thickness = layer_thickness
+        self.side_length = side_length
+        self.target = target
+        self.kept = TargetFilter(target).palette_mask(volume.palette)
+
+        # slice_counts[k, c]：第 k 层中类别 c 的像素数；depth_counts[r, c]：第 r 行（深度）中类别 c 的像素数
+        self.slice_counts, self.depth_counts = self.count_labels(volume.labels, len(self.palette))
+
+    @staticmethod
+    def count_labels(labels, n_classes):
+        """
+        一次遍历标签体，同时统计每层和每行中各类别的像素数。
+
+        逐层统计，临时数组只有一层大小，与层数无关。
+
+        :param labels: 形状为 (n_slices, height, width) 的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :param n_classes: 类别数量。
+        :type n_classes: int
+        :return: (slice_counts, depth_counts)，形状分别为 (n_slices, n_classes) 和 (height, n_classes) 的 int64 数组。
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        n_slices, height, width = labels.shape
+        slice_counts = np.zeros((n_slices, n_classes), dtype=np.int64)
+        depth_counts = np.zeros((height, n_classes), dtype=np.int64)
+        row_offsets = (np.arange(height, dtype=np.int32) * n_classes)[:, None]
+        keys = np.empty((height, width), dtype=np.int32)
+
+        for k in range(n_slices):
+            # 编码为 (行, 类别) 的一维下标 label + row * n_classes 后一次 bincount
+            np.add(labels[k], row_offsets, out=keys)
+            counts = np.bincount(keys.ravel(), minlength=height * n_classes)
+            counts = counts[:height * n_classes].reshape(height, n_classes)
+
+            slice_counts[k] = counts.sum(axis=0)
+            depth_counts += counts
+
+        return slice_counts, depth_counts
+
+    @property
+    def voxel_volume(self):
+        """
+        单个体素的体积。
+
+        :rtype: float
+        """
+        return self.side_length ** 2 * self.layer_thickness
+
+    @property
+    def class_counts(self):
+        """
+        每个类别的体素数量。
+
+        :rtype: np.ndarray
+        """
+        return self.slice_counts.sum(axis=0)
+
+    def class_volumes(self, key="hex"):
+        """
+        每个保留类别的体积，只包含体素数量大于 0 的类别，格式与建模类的 volume_data 一致。
+
+        :param key: 字典键的格式，"hex" 为十六进制颜色（CubeBuilder），"rgb" 为 (r, g, b) 元组（PointCloudBuilder）。
+        :type key: str
+        :return: 颜色 -> 体积。
+        :rtype: dict
+        """
+        volumes = {}
+        for label, count in enumerate(self.class_counts.tolist()):
+            if not self.kept[label] or count == 0:
+                continue
+            if key == "hex":
+                color = self.palette.hex_color(label)
+            elif key == "rgb":
+                color = tuple(int(c) for c in self.palette.rgb[label])
+            else:
+                raise ValueError(f"未知的颜色键格式: {key}")
+            volumes[color] = count * self.voxel_volume
+        return volumes
+
+    def slice_fractions(self):
+        """
+        每层切片中各类别所占的比例。
+
+        :return: (n_slices, n_classes) 的 float64 数组。
+        :rtype: np.ndarray
+        """
+        _, height, width = self.shape
+        return self.slice_counts / float(height * width)
+
+    def depth_fractions(self):
+        """
+        每个深度（图片的每一行）上各类别所占的比例。
+
+        :return: (height, n_classes) 的 float64 数组。
+        :rtype: np.ndarray
+        """
+        n_slices, _, width = self.shape
+        return self.depth_counts / float(n_slices * width)
+
+    def depths(self):
+        """
+        每一行底部距土壤表面的深度。
+
+        :rtype: np.ndarray
+        """
+        return (np.arange(self.shape[1]) + 1) * float(self.side_length)
+
+    def cumulative_fractions(self):
+        """
+        累积入渗分布：各类别在某一深度以上的体素占该类别全部体素的比例。
+
+        :return: (height, n_classes) 的 float64 数组，类别不存在时整列为 0。
+        :rtype: np.ndarray
+        """
+        totals = self.class_counts.astype(np.float64)
+        cumulative = np.cumsum(self.depth_counts, axis=0).astype(np.float64)
+        return np.divide(cumulative, totals, out=np.zeros_like(cumulative), where=totals > 0)
+
+    def infiltration_depths(self):
+        """
+        各类别的最大入渗深度，即出现该类别的最深一行的深度。
+
+        :return: (n_classes,) 的 float64 数组，类别不存在时为 0。
+        :rtype: np.ndarray
+        """
+        present = self.depth_counts > 0
+        deepest = self.shape[1] - 1 - np.argmax(present[::-1], axis=0)
+        return np.where(present.any(axis=0), (deepest + 1) * float(self.side_length), 0.0)
+
+    def to_dict(self):
+        """
+        将统计结果转换为可以直接序列化为 JSON 的字典。
+
+        :rtype: dict
+        """
+        counts = self.class_counts
+        total = int(counts.sum())
+        infiltration_depths = self.infiltration_depths()
+        classes = [
+            {
+                "color": color,
+                "kept": bool(self.kept[label]),
+                "voxels": int(counts[label]),
+                "volume": int(counts[label]) * self.voxel_volume,
+                "fraction": int(counts[label]) / total if total else 0.0,
+                "infiltration_depth": float(infiltration_depths[label]),
+            }
+            for label, color in enumerate(self.palette.hex_colors)
+        ]
+        return {
+            "shape": [int(n) for n in self.shape],
+            "layer_thickness": self.layer_thickness,
+            "side_length": self.side_length,
+            "target": self.target,
+            "total_volume": sum(c["volume"] for c in classes if c["kept"]),
+            "classes": classes,
+            "slice_z": (np.arange(self.shape[0]) * self.layer_thickness).tolist(),
+            "slice_fractions": self.slice_fractions().tolist(),
+            "depth": self.depths().tolist(),
+            "depth_fractions": self.depth_fractions().tolist(),
+            "cumulative_fractions": self.cumulative_fractions().tolist(),
+        }
+
+    @staticmethod
+    def stats_path(output_path):
+        """
+        模型文件对应的统计结果文件路径：与模型同名，后缀为 .stats.json。
+
+        :param output_path: 模型输出路径（可带或不带后缀）。
+        :type output_path: str
+        :rtype: str
+        """
+        base_name, _ = os.path.splitext(output_path)
+        return f"{base_name}.stats.json"
+
+    def save_json(self, output_path):
+        """
+        将统计结果保存在模型文件旁边。
+
+        :param output_path: 模型输出路径。
+        :type output_path: str
+        :return: 统计结果文件路径。
+        :rtype: str
+        """
+        stats_path = self.stats_path(output_path)
+        output_dir = os.path.dirname(stats_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        logger.info(f"体积统计结果已保存: {stats_path}")
+        return stats_path
+
+    @staticmethod
+    def load_json(output_path):
+        """
+        读取模型文件旁边保存的统计结果。
+
+        :param output_path: 模型输出路径，或统计结果文件路径。
+        :type output_path: str
+        :rtype: dict
+        :raises FileNotFoundError: 如果统计结果文件不存在。
+        """
+        stats_path = output_path if output_path.endswith(".stats.json") else VolumeStatistics.stats_path(output_path)
+        if not os.path.exists(stats_path):
+            raise FileNotFoundError(f"统计结果文件不存在: {stats_path}")
+        with open(stats_path, "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,174 @@
+import json
+import os
+import uuid
+
+import numpy as np
+
+from utils.CubeBuilder import CubeBuilder
+from utils.LabelVolume import LabelVolume
+from utils.Palette import Palette
+from utils.VtkStorage import VtkStorage
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VolumeStore:
+    """
+    标签体文件类：直接保存聚类得到的 uint8 标签体和调色板，不保存点云或网格几何。
+
+    每个体素只占 1 个字节，文件远小于由它生成的点云和立方体模型；需要模型时再从标签体生成。支持两种格式：
+    - "npz"：按 chunk_layers 层分块的压缩 NPZ 文件，每块是一个独立压缩的数组，只读取部分层时只解压对应的块；
+    - "vti"：带标签的 ImageData（二进制 XML，压缩方式见 VtkStorage），类别编号保存在单元数据 "label" 中，
+      间距为 (1, 1, layer_thickness)，可以直接在 ParaView 等软件中打开，与立方体模型的坐标一致。
+    两种格式都保存调色板、层厚和切片文件名。
+    """
+
+    FORMATS = ("npz", "vti")
+    VERSION = 1
+
+    def __init__(self, file_path):
+        """
+        打开标签体文件，只读取元数据，标签在 read_slices 或 load 时才读取。
+
+        :param file_path: .npz 或 .vti 文件路径。
+        :type file_path: str
+        :raises ValueError: 如果文件格式未知。
+        """
+        self.file_path = file_path
+        self.file_format = os.path.splitext(file_path)[1].lstrip(".").lower()
+        if self.file_format not in self.FORMATS:
+            raise ValueError(f"未知的标签体文件格式: {file_path}")
+
+        self._grid = None
+        if self.file_format == "npz":
+            with np.load(file_path, allow_pickle=False) as data:
+                self.meta = self._decode_meta(data["meta"])
+        else:
+            self._grid = VtkStorage.load(file_path)
+            self.meta = self._decode_meta(self._grid.field_data["meta"])
+        if self.meta.get("version") != self.VERSION:
+            raise ValueError(f"不支持的标签体文件版本: {self.meta.get('version')}")
+
+    @staticmethod
+    def _encode_meta(meta):
+        # 元数据以 UTF-8 编码的 JSON 字节保存，两种格式都不需要 pickle
+        return np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+    @staticmethod
+    def _decode_meta(array):
+        return json.loads(np.asarray(array, dtype=np.uint8).tobytes().decode("utf-8"))
+
+    @property
+    def shape(self):
+        """
+        :return: 标签体的形状 (n_slices, height, width)。
+        :rtype: Tuple[int, int, int]
+        """
+        return tuple(self.meta["shape"])
+
+    @property
+    def layer_thickness(self):
+        return self.meta["layer_thickness"]
+
+    @property
+    def palette(self):
+        """
+        :rtype: Palette
+        """
+        return Palette(self.meta["palette"])
+
+    @property
+    def slice_names(self):
+        return self.meta.get("slice_names")
+
+    @classmethod
+    def save(cls, volume, output_path, layer_thickness=1, file_format="npz", chunk_layers=32, codec="zlib"):
+        """
+        保存标签体。先写入临时文件再重命名，保存失败不会留下不完整的文件。
+
+        :param volume: 聚类得到的标签体。
+        :type volume: LabelVolume
+        :param output_path: 输出路径，后缀会被替换为 .npz 或 .vti。
+        :type output_path: str
+        :param layer_thickness: 每层的厚度，决定 z 方向的间距。
+        :type layer_thickness: int
+        :param file_format: "npz" 或 "vti"。
+        :type file_format: str
+        :param chunk_layers: NPZ 格式每块的层数。
+        :type chunk_layers: int
+        :param codec: VTI 格式的压缩方式，见 VtkStorage.CODECS；NPZ 格式固定使用 zlib。
+        :type codec: str
+        :return: 实际保存的文件路径。
+        :rtype: str
+        """
+        if file_format not in cls.FORMATS:
+            raise ValueError(f"未知的标签体文件格式: {file_format}，可选 {cls.FORMATS}")
+        base_name, _ = os.path.splitext(output_path)
+        output_path = f"{base_name}.{file_format}"
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.isdir(output_dir):
+            raise FileNotFoundError(f"输出文件夹不存在: {output_dir}")
+
+        meta = cls._encode_meta({
+            "version": cls.VERSION,
+            "shape": list(volume.shape),
+            "layer_thickness": layer_thickness,
+            "chunk_layers": chunk_layers,
+            "palette": volume.palette.hex_colors,
+            "slice_names": volume.slice_names,
+        })
+        temp_path = f"{base_name}.{uuid.uuid4().hex}.tmp.{file_format}"
+        try:
+            if file_format == "npz":
+                chunks = {
+                    f"chunk_{k0:06d}": volume.labels[k0:k0 + chunk_layers]
+                    for k0 in range(0, len(volume), chunk_layers)
+                }
+                with open(temp_path, "wb") as f:
+                    np.savez_compressed(f, meta=meta, **chunks)
+            else:
+                grid = CubeBuilder(side_length=1, layer_thickness=layer_thickness).build_voxel_grid(volume)
+                grid.field_data["meta"] = meta
+                VtkStorage.save(grid, temp_path, codec=codec)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        logger.info(
+            f"标签体已保存: {output_path}，{volume.nbytes / 1024 ** 2:.1f} MB 标签压缩为 "
+            f"{os.path.getsize(output_path) / 1024 ** 2:.2f} MB"
+        )
+        return output_path
+
+    def read_slices(self, start=0, stop=None):
+        """
+        读取 [start, stop) 层的标签；NPZ 格式只解压这些层所在的块。
+
+        :return: 形状为 (stop - start, height, width) 的 uint8 数组。
+        :rtype: np.ndarray
+        """
+        n_slices, height, width = self.shape
+        start, stop, _ = slice(start, stop).indices(n_slices)
+        if self.file_format == "vti":
+            labels = np.asarray(self._grid.cell_data["label"], dtype=np.uint8)
+            # 单元编号以 x 变化最快，还原为 (slice, x, y) 顺序，见 CubeBuilder.build_voxel_grid
+            return labels.reshape(n_slices, width, height).transpose(0, 2, 1)[start:stop].copy()
+
+        chunk_layers = self.meta["chunk_layers"]
+        labels = np.empty((max(0, stop - start), height, width), dtype=np.uint8)
+        with np.load(self.file_path, allow_pickle=False) as data:
+            for k0 in range(start - start % chunk_layers, stop, chunk_layers):
+                chunk = data[f"chunk_{k0:06d}"]
+                lo, hi = max(start, k0), min(stop, k0 + len(chunk))
+                labels[lo - start:hi - start] = chunk[lo - k0:hi - k0]
+        return labels
+
+    def load(self):
+        """
+        读取整个标签体。
+
+        :rtype: LabelVolume
+        """
+        return LabelVolume(self.read_slices(), self.palette, self.slice_names)
@@ -0,0 +1,326 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VoxelSurface:
+    """
+    体素表面生成类，直接在标签体上用数组运算找出暴露的体素面，只生成颜色边界和外边界上的面。
+
+    标签数组的维度顺序为 (k, i, j) = (层, x, y)。体素 (k, i, j) 的中心位于
+    (i * side_length, j * side_length, k * layer_thickness)，与 CubeBuilder 中的立方体一致。
+    """
+
+    # 六个方向上的面：(轴, 方向) -> 四个角点相对体素的格点偏移 (dk, di, dj)，
+    # 从体素外侧看为逆时针顺序，使面法向朝外
+    FACE_CORNERS = {
+        (1, 1): ((0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)),    # +x
+        (1, -1): ((1, 0, 0), (1, 0, 1), (0, 0, 1), (0, 0, 0)),   # -x
+        (2, 1): ((0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)),    # +y
+        (2, -1): ((0, 1, 0), (1, 1, 0), (1, 0, 0), (0, 0, 0)),   # -y
+        (0, 1): ((1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)),    # +z
+        (0, -1): ((0, 0, 1), (0, 1, 1), (0, 1, 0), (0, 0, 0)),   # -z
+    }
+
+    # 遍历各方向的固定顺序，保证分块缓存后拼接得到的网格与一次性生成的完全一致
+    DIRECTIONS = ((0, 1), (0, -1), (1, 1), (1, -1), (2, 1), (2, -1))
+
+    @staticmethod
+    def iter_exposed_masks(labels, keep, chunk_layers=32, chunk_starts=None):
+        """
+        分块遍历标签体，按方向产出暴露面的类别图。
+
+        只有保留类别的体素会生成面；当相邻体素属于不同类别、属于不保留的类别或位于标签体外时，该面暴露。
+        每块只多读取上下各一层作为邻居，内存占用与 chunk_layers 成正比。
+
+        :param labels: 形状为 (n_slices, height, width) 的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :param keep: 按类别编号索引的布尔数组，表示该类别是否生成表面。
+        :type keep: np.ndarray
+        :param chunk_layers: 每块处理的层数。
+        :type chunk_layers: int
+        :param chunk_starts: 只处理这些块（块的第一层编号，必须是 chunk_layers 的整数倍），默认处理全部块。
+        :type chunk_starts: Iterable[int]
+        :return: 依次产出 (k0, axis, sign, face_codes)，face_codes 为该块 (层, x, y) 形状的 int16 数组，
+                 暴露面处为体素类别编号，其余为 -1；k0 为该块第一层的编号。
+        :rtype: Iterator[Tuple[int, int, int, np.ndarray]]
+        """
+        n_slices, height, width = labels.shape
+        keep = np.asarray(keep, dtype=bool)
+
+        if chunk_starts is None:
+            chunk_starts = range(0, n_slices, chunk_layers)
+
+        for k0 in chunk_starts:
+            k1 = min(k0 + chunk_layers, n_slices)
+            lo, hi = max(k0 - 1, 0), min(k1 + 1, n_slices)
+
+            # 不保留的类别和标签体外都记为 -1，四周各填充一圈
+            ids = np.full((k1 - k0 + 2, height + 2, width + 2), -1, dtype=np.int16)
+            block = labels[lo:hi]
+            ids[lo - k0 + 1:hi - k0 + 1, 1:-1, 1:-1] = np.where(keep[block], block.astype(np.int16), -1)
+
+            center = ids[1:-1, 1:-1, 1:-1]
+            neighbours = {
+                (0, 1): ids[2:, 1:-1, 1:-1], (0, -1): ids[:-2, 1:-1, 1:-1],
+                (1, 1): ids[1:-1, 2:, 1:-1], (1, -1): ids[1:-1, :-2, 1:-1],
+                (2, 1): ids[1:-1, 1:-1, 2:], (2, -1): ids[1:-1, 1:-1, :-2],
+            }
+            for axis, sign in VoxelSurface.DIRECTIONS:
+                yield k0, axis, sign, np.where(center != neighbours[(axis, sign)], center, -1)
+
+    @staticmethod
+    def iter_exposed_faces(labels, keep, chunk_layers=32, chunk_starts=None):
+        """
+        分块遍历标签体，产出所有暴露的体素面，判断规则见 iter_exposed_masks。
+
+        :return: 依次产出 (axis, sign, k, i, j, face_labels)，k、i、j 为暴露面所属体素的坐标数组。
+        :rtype: Iterator[Tuple[int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]
+        """
+        for k0, axis, sign, codes in VoxelSurface.iter_exposed_masks(labels, keep, chunk_layers, chunk_starts):
+            k, i, j = np.nonzero(codes >= 0)
+            if len(k) == 0:
+                continue
+            yield axis, sign, k + k0, i, j, codes[k, i, j].astype(np.uint8)
+
+    @staticmethod
+    def count_exposed_faces(labels, keep, chunk_layers=32, chunk_starts=None):
+        """
+        统计暴露的体素面数量（未合并时每个面为一个四边形）。
+
+        :rtype: int
+        """
+        return sum(
+            int(np.count_nonzero(codes >= 0))
+            for _, _, _, codes in VoxelSurface.iter_exposed_masks(labels, keep, chunk_layers, chunk_starts)
+        )
+
+    @staticmethod
+    def iter_greedy_rectangles(labels, keep, chunk_layers=32, chunk_starts=None):
+        """
+        贪心合并同一平面内相邻、同颜色的暴露面，产出合并后的矩形。
+
+        每个方向的暴露面先沿平面内的一个方向合并为连续段，再把相邻行中起止位置和颜色完全相同的段合并为矩形，
+        全部使用数组运算完成。z 方向的面在每层平面内合并；x、y 方向的面沿层方向（竖直）合并，
+        合并不会跨越 chunk_layers 分块的边界。
+
+        :return: 依次产出 (axis, sign, lo, hi, face_labels)，lo、hi 为 (R, 3) 的数组，
+                 表示每个矩形覆盖的体素坐标范围 [lo, hi]（含两端，顺序为层、x、y）。
+        :rtype: Iterator[Tuple[int, int, np.ndarray, np.ndarray, np.ndarray]]
+        """
+        # 每个方向上 (平面轴, 合并行轴 u, 段方向轴 v)
+        plane_axes = {0: (0, 1, 2), 1: (1, 0, 2), 2: (2, 0, 1)}
+
+        for k0, axis, sign, codes in VoxelSurface.iter_exposed_masks(labels, keep, chunk_layers, chunk_starts):
+            order = plane_axes[axis]
+            code = codes.transpose(order)
+
+            # 第一步：沿 v 方向找出同颜色的连续段
+            padded = np.full(code.shape[:2] + (code.shape[2] + 2,), -1, dtype=np.int16)
+            padded[:, :, 1:-1] = code
+            starts = (code >= 0) & (code != padded[:, :, :-2])
+            ends = (code >= 0) & (code != padded[:, :, 2:])
+            p, u, v_start = np.nonzero(starts)
+            if len(p) == 0:
+                continue
+            v_end = np.nonzero(ends)[2]
+            run_labels = code[p, u, v_start]
+
+            # 第二步：起止位置和颜色相同、u 连续的段合并为一个矩形
+            sort = np.lexsort((u, run_labels, v_end, v_start, p))
+            p, u, v_start, v_end, run_labels = p[sort], u[sort], v_start[sort], v_end[sort], run_labels[sort]
+            new_rect = np.ones(len(p), dtype=bool)
+            new_rect[1:] = (
+                (p[1:] != p[:-1]) | (v_start[1:] != v_start[:-1]) | (v_end[1:] != v_end[:-1])
+                | (run_labels[1:] != run_labels[:-1]) | (u[1:] != u[:-1] + 1)
+            )
+            first = np.flatnonzero(new_rect)
+            last = np.append(first[1:], len(p)) - 1
+
+            lo = np.empty((len(first), 3), dtype=np.int64)
+            hi = np.empty((len(first), 3), dtype=np.int64)
+            lo[:, order[0]], hi[:, order[0]] = p[first], p[first]
+            lo[:, order[1]], hi[:, order[1]] = u[first], u[last]
+            lo[:, order[2]], hi[:, order[2]] = v_start[first], v_end[first]
+            lo[:, 0] += k0
+            hi[:, 0] += k0
+
+            yield axis, sign, lo, hi, run_labels[first].astype(np.uint8)
+
+    @staticmethod
+    def face_vertex_ids(axis, sign, k, i, j, shape):
+        """
+        计算一组面的四个角点在 (n_slices+1, height+1, width+1) 格点上的编号。
+
+        :return: (F, 4) 的 int64 格点编号数组。
+        :rtype: np.ndarray
+        """
+        lo = np.stack((k, i, j), axis=1).astype(np.int64)
+        return VoxelSurface.rectangle_vertex_ids(axis, sign, lo, lo, shape)
+
+    @staticmethod
+    def rectangle_vertex_ids(axis, sign, lo, hi, shape):
+        """
+        计算一组矩形面的四个角点的格点编号，矩形覆盖体素坐标范围 [lo, hi]（含两端）。
+
+        :return: (R, 4) 的 int64 格点编号数组。
+        :rtype: np.ndarray
+        """
+        _, height, width = shape
+        corners = np.array(VoxelSurface.FACE_CORNERS[(axis, sign)], dtype=np.int64)
+        extent = hi - lo + 1
+        # 平面轴上 lo 与 hi 相同，偏移 0/1 即面的两侧；其余两轴偏移 1 表示矩形的另一端
+        corner_coords = lo[:, None, :] + corners[None, :, :] * extent[:, None, :]
+        ck, ci, cj = corner_coords[..., 0], corner_coords[..., 1], corner_coords[..., 2]
+        return (ck * (height + 1) + ci) * (width + 1) + cj
+
+    @staticmethod
+    def vertex_positions(vertex_ids, shape, side_length=1, layer_thickness=1):
+        """
+        将格点编号换算为三维坐标。
+
+        :return: (N, 3) 的 float32 坐标数组。
+        :rtype: np.ndarray
+        """
+        _, height, width = shape
+        j = vertex_ids % (width + 1)
+        i = (vertex_ids // (width + 1)) % (height + 1)
+        k = vertex_ids // ((width + 1) * (height + 1))
+        points = np.empty((len(vertex_ids), 3), dtype=np.float32)
+        points[:, 0] = (i - 0.5) * side_length
+        points[:, 1] = (j - 0.5) * side_length
+        points[:, 2] = (k - 0.5) * layer_thickness
+        return points
+
+    @staticmethod
+    def chunk_rectangles(labels, keep, k0, chunk_layers=32, greedy=False):
+        """
+        生成单个块内的全部暴露面（或贪心合并后的矩形），坐标相对于块的第一层，便于按块缓存和拼接。
+
+        一个块的结果只取决于块内各层以及上下相邻的各一层。
+
+        :param k0: 块的第一层编号，必须是 chunk_layers 的整数倍。
+        :type k0: int
+        :param greedy: 是否贪心合并，见 iter_greedy_rectangles。
+        :type greedy: bool
+        :return: 字典，包含 axis、sign（(R,) int8）、lo、hi（(R, 3) int32，层坐标相对 k0）、
+                 labels（(R,) uint8）以及合并前的暴露面数量 n_faces。
+        :rtype: Dict[str, np.ndarray]
+        """
+        if greedy:
+            groups = list(VoxelSurface.iter_greedy_rectangles(labels, keep, chunk_layers, chunk_starts=[k0]))
+            n_faces = VoxelSurface.count_exposed_faces(labels, keep, chunk_layers, chunk_starts=[k0])
+        else:
+            groups = [
+                (axis, sign, np.stack((k, i, j), axis=1), np.stack((k, i, j), axis=1), face_labels)
+                for axis, sign, k, i, j, face_labels
+                in VoxelSurface.iter_exposed_faces(labels, keep, chunk_layers, chunk_starts=[k0])
+            ]
+            n_faces = sum(len(face_labels) for *_, face_labels in groups)
+
+        if not groups:
+            groups = [(0, 1, np.empty((0, 3), dtype=np.int64), np.empty((0, 3), dtype=np.int64), np.empty(0, np.uint8))]
+
+        offset = np.array([k0, 0, 0])
+        return {
+            "axis": np.concatenate([np.full(len(face_labels), axis, dtype=np.int8) for axis, _, _, _, face_labels in groups]),
+            "sign": np.concatenate([np.full(len(face_labels), sign, dtype=np.int8) for _, sign, _, _, face_labels in groups]),
+            "lo": np.concatenate([lo - offset for _, _, lo, _, _ in groups]).astype(np.int32),
+            "hi": np.concatenate([hi - offset for _, _, _, hi, _ in groups]).astype(np.int32),
+            "labels": np.concatenate([face_labels for *_, face_labels in groups]).astype(np.uint8),
+            "n_faces": np.int64(n_faces),
+        }
+
+    @staticmethod
+    def iter_chunk_quads(chunks, shape):
+        """
+        将 chunk_rectangles 的结果换算为四边形的格点编号。
+
+        :param chunks: (k0, chunk_rectangles 结果) 的序列。
+        :type chunks: Iterable[Tuple[int, Dict[str, np.ndarray]]]
+        :param shape: 标签体形状 (n_slices, height, width)。
+        :return: 依次产出 (格点编号, face_labels)。
+        :rtype: Iterator[Tuple[np.ndarray, np.ndarray]]
+        """
+        for k0, rects in chunks:
+            offset = np.array([k0, 0, 0], dtype=np.int64)
+            for axis, sign in VoxelSurface.DIRECTIONS:
+                mask = (rects["axis"] == axis) & (rects["sign"] == sign)
+                if not mask.any():
+                    continue
+                lo = rects["lo"][mask].astype(np.int64) + offset
+                hi = rects["hi"][mask].astype(np.int64) + offset
+                yield VoxelSurface.rectangle_vertex_ids(axis, sign, lo, hi, shape), rects["labels"][mask]
+
+    @staticmethod
+    def assemble_surfaces(quads, shape, side_length=1, layer_thickness=1, description="暴露"):
+        """
+        按类别汇总四边形，生成每个类别共享顶点的网格。
+
+        :param quads: 依次为 (格点编号 (F, 4), face_labels (F,)) 的序列。
+        :type quads: Iterable[Tuple[np.ndarray, np.ndarray]]
+        :param shape: 标签体形状 (n_slices, height, width)。
+        :param description: 日志中面的描述。
+        :return: 类别编号 -> (points, faces)，格式见 exposed_surfaces。
+        :rtype: Dict[int, Tuple[np.ndarray, np.ndarray]]
+        """
+        face_ids = {}
+        for vertex_ids, face_labels in quads:
+            for label in np.unique(face_labels):
+                face_ids.setdefault(int(label), []).append(vertex_ids[face_labels == label])
+
+        surfaces = {}
+        for label, chunks in face_ids.items():
+            vertex_ids = np.concatenate(chunks)
+            unique_ids, inverse = np.unique(vertex_ids, return_inverse=True)
+
+            faces = np.empty((len(vertex_ids), 5), dtype=np.int64)
+            faces[:, 0] = 4
+            faces[:, 1:] = inverse.reshape(-1, 4)
+
+            points = VoxelSurface.vertex_positions(unique_ids, shape, side_length, layer_thickness)
+            surfaces[label] = (points, faces.ravel())
+            logger.info(f"类别 {label} 生成 {len(vertex_ids)} 个{description}面、{len(unique_ids)} 个顶点")
+
+        return surfaces
+
+    @staticmethod
+    def exposed_surfaces(labels, keep, side_length=1, layer_thickness=1, chunk_layers=32, greedy=False,
+                         chunk_starts=None):
+        """
+        生成每个保留类别的暴露面网格，同一类别内共享顶点。
+
+        :param labels: 形状为 (n_slices, height, width) 的 uint8 类别编号数组。
+        :type labels: np.ndarray
+        :param keep: 按类别编号索引的布尔数组，表示该类别是否生成表面。
+        :type keep: np.ndarray
+        :param side_length: 体素在 x、y 方向的边长。
+        :param layer_thickness: 体素在 z 方向的厚度。
+        :param chunk_layers: 每块处理的层数。
+        :param greedy: 是否贪心合并同一平面内相邻、同颜色的面，见 iter_greedy_rectangles。
+        :type greedy: bool
+        :param chunk_starts: 依次处理的块，默认为全部块，见 iter_exposed_masks；可以传入生成器以跟踪进度。
+        :type chunk_starts: Iterable[int]
+        :return: 类别编号 -> (points, faces)，points 为 (N, 3) 的 float32 坐标，
+                 faces 为 VTK 格式的四边形面数组 [4, a, b, c, d, 4, ...]。
+        :rtype: Dict[int, Tuple[np.ndarray, np.ndarray]]
+        """
+        if greedy:
+            quads = (
+                (VoxelSurface.rectangle_vertex_ids(axis, sign, lo, hi, labels.shape), face_labels)
+                for axis, sign, lo, hi, face_labels in VoxelSurface.iter_greedy_rectangles(
+                    labels, keep, chunk_layers, chunk_starts
+                )
+            )
+        else:
+            quads = (
+                (VoxelSurface.face_vertex_ids(axis, sign, k, i, j, labels.shape), face_labels)
+                for axis, sign, k, i, j, face_labels in VoxelSurface.iter_exposed_faces(
+                    labels, keep, chunk_layers, chunk_starts
+                )
+            )
+
+        return VoxelSurface.assemble_surfaces(
+            quads, labels.shape, side_length, layer_thickness, "合并后的" if greedy else "暴露"
+        )
@@ -0,0 +1,204 @@
+import os
+import time
+
+import numpy as np
+import pyvista as pv
+from vtkmodules.vtkIOXML import (
+    vtkXMLImageDataWriter, vtkXMLPolyDataWriter, vtkXMLRectilinearGridWriter, vtkXMLStructuredGridWriter,
+    vtkXMLUnstructuredGridWriter,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VtkStorage:
+    """
+    二进制 XML VTK 文件（VTP/VTU/VTI 等）的读写类，可以选择压缩方式。
+
+    数据以原始二进制追加在文件末尾（不做 base64 编码），按块压缩：
+    - "zlib"：压缩率和速度均衡，适合一般保存；
+    - "lz4"：压缩和解压最快，适合需要频繁交互加载的模型；
+    - "lzma"：压缩率最高但写入很慢，适合归档；
+    - "none"：不压缩，写入最快，文件最大。
+    保存前可以紧凑化数组：坐标转换为 float32，0 ~ 1 的浮点颜色转换为 uint8，颜色数组只占原来的四分之一。
+    各压缩方式的实际读写速度用 benchmark 在真实模型上测量。
+    """
+
+    CODECS = ("none", "zlib", "lz4", "lzma")
+
+    # 数据类型 -> (文件后缀, XML 写入器)
+    WRITERS = {
+        pv.PolyData: ("vtp", vtkXMLPolyDataWriter),
+        pv.UnstructuredGrid: ("vtu", vtkXMLUnstructuredGridWriter),
+        pv.ImageData: ("vti", vtkXMLImageDataWriter),
+        pv.StructuredGrid: ("vts", vtkXMLStructuredGridWriter),
+        pv.RectilinearGrid: ("vtr", vtkXMLRectilinearGridWriter),
+    }
+
+    @classmethod
+    def writer_for(cls, dataset):
+        """
+        :param dataset: PyVista 数据对象。
+        :return: (文件后缀, XML 写入器类)。
+        :rtype: Tuple[str, type]
+        :raises TypeError: 如果数据类型不支持保存为 XML 格式。
+        """
+        for dataset_type, writer in cls.WRITERS.items():
+            if isinstance(dataset, dataset_type):
+                return writer
+        raise TypeError(f"不支持保存为 XML VTK 格式的数据类型: {type(dataset).__name__}")
+
+    @classmethod
+    def output_path(cls, dataset, output_path):
+        """
+        按数据类型修改输出路径的后缀，例如点云为 .vtp，立方体模型为 .vtu。
+
+        :rtype: str
+        """
+        extension, _ = cls.writer_for(dataset)
+        base_name, _ = os.path.splitext(output_path)
+        return f"{base_name}.{extension}"
+
+    @staticmethod
+    def compact(dataset, color_name="RGB"):
+        """
+        紧凑化数组类型：坐标转换为 float32，0 ~ 1 的浮点颜色转换为 uint8（四舍五入）。
+
+        返回浅拷贝，不修改原数据对象；颜色已经是整数类型时保持不变。
+
+        :param dataset: PyVista 数据对象。
+        :param color_name: 颜色数组的名称。
+        :type color_name: str
+        :return: 紧凑化后的数据对象。
+        """
+        compacted = dataset.copy(deep=False)
+        # 只有显式保存坐标的数据类型才有 points 数组，ImageData 等规则网格没有
+        explicit = isinstance(compacted, (pv.PolyData, pv.UnstructuredGrid, pv.StructuredGrid))
+        if explicit and compacted.n_points and compacted.points.dtype != np.float32:
+            compacted.points = compacted.points.astype(np.float32)
+        for data in (compacted.point_data, compacted.cell_data):
+            if color_name in data and np.issubdtype(data[color_name].dtype, np.floating):
+                colors = np.asarray(data[color_name])
+                data[color_name] = np.rint(np.clip(colors, 0.0, 1.0) * 255).astype(np.uint8)
+                data.active_scalars_name = color_name
+        return compacted
+
+    @staticmethod
+    def colors_uint8(dataset, color_name="RGB"):
+        """
+        以 uint8 读取点颜色，兼容 0 ~ 1 浮点颜色（旧版 .vtk 文件）和 uint8 颜色（紧凑化的 XML 文件）。
+
+        :return: (N, C) 的 uint8 数组。
+        :rtype: np.ndarray
+        """
+        colors = np.asarray(dataset.point_data[color_name])
+        if np.issubdtype(colors.dtype, np.floating):
+            return np.rint(colors * 255).astype(np.uint8)
+        return colors.astype(np.uint8, copy=False)
+
+    @classmethod
+    def save(cls, dataset, output_path, codec="zlib", level=None, compact=True):
+        """
+        保存为二进制 XML VTK 文件，后缀由数据类型决定。
+
+        :param dataset: PyVista 数据对象。
+        :param output_path: 输出路径（后缀会被替换）。
+        :type output_path: str
+        :param codec: 压缩方式，见 CODECS。
+        :type codec: str
+        :param level: 压缩级别（1 ~ 9），为 None 时使用 VTK 的默认级别。
+        :type level: int
+        :param compact: 是否先紧凑化数组类型，见 compact。
+        :type compact: bool
+        :return: 实际保存的文件路径。
+        :rtype: str
+        :raises ValueError: 如果压缩方式未知。
+        """
+        if codec not in cls.CODECS:
+            raise ValueError(f"未知的压缩方式: {codec}，可选 {cls.CODECS}")
+        output_path = cls.output_path(dataset, output_path)
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.isdir(output_dir):
+            raise FileNotFoundError(f"输出文件夹不存在: {output_dir}")
+
+        if compact:
+            dataset = cls.compact(dataset)
+        _, writer_type = cls.writer_for(dataset)
+        writer = writer_type()
+        writer.SetFileName(output_path)
+        writer.SetInputData(dataset)
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()  # 原始二进制，不做 base64 编码
+        writer.SetHeaderTypeToUInt64()  # 支持超过 4 GB 的数组
+        {
+            "none": writer.SetCompressorTypeToNone,
+            "zlib": writer.SetCompressorTypeToZLib,
+            "lz4": writer.SetCompressorTypeToLZ4,
+            "lzma": writer.SetCompressorTypeToLZMA,
+        }[codec]()
+        if level is not None and codec != "none":
+            writer.SetCompressionLevel(int(level))
+        if not writer.Write():
+            raise OSError(f"VTK 写入器保存文件失败: {output_path}")
+        logger.info(f"已保存为二进制 XML 格式（压缩方式 {codec}）: {output_path}")
+        return output_path
+
+    @staticmethod
+    def load(file_path):
+        """
+        读取 VTK 文件（任意格式，压缩方式记录在文件中，读取时不需要指定）。
+
+        :rtype: pv.DataSet
+        """
+        return pv.read(file_path)
+
+    @classmethod
+    def benchmark(cls, dataset, folder, codecs=CODECS, level=None, repeat=1, compact=True):
+        """
+        测量各压缩方式的文件大小和读写速度。
+
+        吞吐量按未压缩的数组字节数计算（MB/s），便于在不同压缩方式之间比较；每种方式取 repeat 次中最快的一次。
+
+        :param dataset: 用于测试的 PyVista 数据对象，应当是真实的模型。
+        :param folder: 存放测试文件的文件夹，测试结束后删除测试文件。
+        :type folder: str
+        :param codecs: 参与测试的压缩方式。
+        :param level: 压缩级别。
+        :param repeat: 每种方式重复的次数。
+        :param compact: 是否紧凑化数组类型。
+        :return: 每种压缩方式一行：codec、bytes（文件大小）、ratio（压缩比）、write_s、read_s、write_mb_s、read_mb_s。
+        :rtype: List[dict]
+        """
+        os.makedirs(folder, exist_ok=True)
+        raw_dataset = cls.compact(dataset) if compact else dataset
+        raw_bytes = raw_dataset.actual_memory_size * 1024  # actual_memory_size 的单位为 KiB
+        results = []
+        for codec in codecs:
+            file_path = os.path.join(folder, f"benchmark_{codec}")
+            write_s = read_s = float("inf")
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                file_path = cls.save(raw_dataset, file_path, codec=codec, level=level, compact=False)
+                write_s = min(write_s, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                cls.load(file_path)
+                read_s = min(read_s, time.perf_counter() - start)
+
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+            results.append({
+                "codec": codec,
+                "bytes": size,
+                "ratio": round(raw_bytes / size, 2) if size else None,
+                "write_s": round(write_s, 3),
+                "read_s": round(read_s, 3),
+                "write_mb_s": round(raw_bytes / 1024 ** 2 / write_s, 1) if write_s > 0 else None,
+                "read_mb_s": round(raw_bytes / 1024 ** 2 / read_s, 1) if read_s > 0 else None,
+            })
+            logger.info(
+                f"压缩方式 {codec}: 文件 {size / 1024 ** 2:.1f} MB（压缩比 {results[-1]['ratio']}），"
+                f"写入 {write_s:.2f} 秒，读取 {read_s:.2f} 秒"
+            )
+        return results
@@ -1 +1,8 @@
+import os
+
 window = None  # 初始化全局变量
+
+# 缓存的根目录：固定在用户的应用数据目录下，与启动程序时的工作目录无关
+CACHE_ROOT = os.path.join(
+    os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"), "SoilHydro3D"
+)
@@ -33,4 +33,8 @@ export default defineConfig({
       '@': fileURLToPath(new URL('./src', import.meta.url))
     },
   },
+  build: {
+    outDir: '../SH-BackEnd/web/dist', // 直接输出到桌面程序加载的目录（见 SH-BackEnd/main.py）
+    emptyOutDir: true,               // 输出目录在项目之外，需要显式允许清空旧文件
+  },
 })